@@ -38,6 +38,8 @@ class ReddwarfContext(context.RequestContext):
         self.marker = kwargs['marker']
         del kwargs['limit']
         del kwargs['marker']
+        self.sort_key = kwargs.pop('sort_key', None)
+        self.sort_dir = kwargs.pop('sort_dir', None)
         super(ReddwarfContext, self).__init__(**kwargs)
 
     def to_dict(self):
@@ -48,7 +50,9 @@ class ReddwarfContext(context.RequestContext):
                 'read_only': self.read_only,
                 'auth_tok': self.auth_tok,
                 'limit': self.limit,
-                'marker': self.marker
+                'marker': self.marker,
+                'sort_key': self.sort_key,
+                'sort_dir': self.sort_dir
                 }
 
     @classmethod
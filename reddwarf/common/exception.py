@@ -88,6 +88,11 @@ class GuestError(ReddwarfError):
                 "%(original_message)s.")
 
 
+class GuestTimeout(GuestError):
+
+    message = _("Timed out waiting for the guest to answer %(method)s.")
+
+
 class BadRequest(ReddwarfError):
 
     message = _("The server could not comply with the request since it is "
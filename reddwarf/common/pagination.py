@@ -15,10 +15,50 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import datetime
+import json
 import urllib
 import urlparse
 from xml.dom import minidom
 
+from reddwarf.common import exception
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError("%r is not JSON serializable" % value)
+
+
+def encode_marker(*values):
+    """Packs the sort values of the last row on a page into one marker.
+
+    Datetimes become ISO 8601 strings.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values,
+                                               default=_json_default))
+
+
+def decode_marker(marker):
+    """Returns the list of values packed by encode_marker."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(marker)))
+    except (TypeError, ValueError):
+        raise exception.BadRequest(_("Invalid marker %s.") % marker)
+    if not isinstance(values, list):
+        raise exception.BadRequest(_("Invalid marker %s.") % marker)
+    return values
+
+
+def is_encoded_marker(marker):
+    """Tells a marker made by encode_marker from a plain column value."""
+    try:
+        decode_marker(marker)
+    except exception.BadRequest:
+        return False
+    return True
+
 
 class PaginatedDataView(object):
 
@@ -15,6 +15,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
+import time
+
 from reddwarf.common import config
 from novaclient.v1_1.client import Client
 
@@ -22,6 +26,144 @@ from novaclient.v1_1.client import Client
 CONFIG = config.Config
 
 
+class ClientPool(object):
+    """Keeps idle HTTP clients around so their connections are reused.
+
+    Clients are keyed by whatever identifies the credentials they were built
+    with. Each request checks a client out for its own use and checks it
+    back in when done, so concurrent requests for one key run side by side
+    on separate connections. Up to max_per_key idle clients are kept for a
+    key and max_size in all, dropping the least recently used first. Idle
+    clients unused for idle_timeout seconds are dropped on the next
+    checkout.
+
+    """
+
+    def __init__(self, max_size, idle_timeout, max_per_key=4):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_per_key = max_per_key
+        # Lists of (checked in at, client), oldest first, by key in order of
+        # their last check in.
+        self._idle = collections.OrderedDict()
+        self._size = 0
+        self.checked_out = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def checkout(self, key, factory):
+        """Returns an idle client for key, building one if there is none."""
+        self._evict_idle()
+        entries = self._idle.get(key)
+        if entries:
+            self.hits += 1
+            client = entries.pop()[1]
+            self._size -= 1
+            if not entries:
+                del self._idle[key]
+        else:
+            self.misses += 1
+            client = factory()
+        self.checked_out += 1
+        return client
+
+    def checkin(self, key, client):
+        """Hands a client back once the caller is done with it."""
+        self.checked_out -= 1
+        entries = self._idle.pop(key, [])
+        if len(entries) < min(self.max_per_key, self.max_size):
+            entries.append((time.time(), client))
+            self._size += 1
+        else:
+            self.evictions += 1
+        if entries:
+            self._idle[key] = entries
+        while self._size > self.max_size:
+            oldest_key, oldest = self._idle.items()[0]
+            oldest.pop(0)
+            self._size -= 1
+            self.evictions += 1
+            if not oldest:
+                del self._idle[oldest_key]
+
+    @contextlib.contextmanager
+    def borrow(self, key, factory):
+        client = self.checkout(key, factory)
+        try:
+            yield client
+        finally:
+            self.checkin(key, client)
+
+    def _evict_idle(self):
+        oldest_allowed = time.time() - self.idle_timeout
+        for key, entries in self._idle.items():
+            while entries and entries[0][0] < oldest_allowed:
+                entries.pop(0)
+                self._size -= 1
+                self.evictions += 1
+            if not entries:
+                del self._idle[key]
+
+    def clear(self):
+        self._idle.clear()
+        self._size = 0
+
+    def stats(self):
+        return {'size': self._size,
+                'checked_out': self.checked_out,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+_CLIENT_POOL = None
+
+
+def get_client_pool():
+    global _CLIENT_POOL
+    if _CLIENT_POOL is None:
+        _CLIENT_POOL = ClientPool(
+            max_size=int(CONFIG.get('nova_client_pool_size', 100)),
+            idle_timeout=float(CONFIG.get('nova_client_idle_timeout', 300)),
+            max_per_key=int(CONFIG.get('nova_client_pool_per_key', 4)))
+    return _CLIENT_POOL
+
+
+def client_pool_stats():
+    return get_client_pool().stats()
+
+
+def _create_client(context, url):
+    PROXY_AUTH_URL = CONFIG.get('reddwarf_auth_url',
+                                'http://0.0.0.0:5000/v2.0')
+    client = Client(context.user, context.auth_tok,
+        project_id=context.tenant, auth_url=PROXY_AUTH_URL)
+    client.client.auth_token = context.auth_tok
+    client.client.management_url = "%s/%s/" % (url, context.tenant)
+    return client
+
+
+def _pooled_client(kind, context, url):
+    """Returns a client whose requests each borrow a pooled connection.
+
+    The client itself holds no connection, so it is built for every caller
+    as before, and any number of greenthreads may use it at once.
+    """
+    key = (kind, url, context.user, context.tenant, context.auth_tok)
+    pool = get_client_pool()
+    client = _create_client(context, url)
+
+    def connect():
+        return _create_client(context, url).client
+
+    def pooled_request(*args, **kwargs):
+        with pool.borrow(key, connect) as http_client:
+            return http_client.request(*args, **kwargs)
+    client.client.request = pooled_request
+    return client
+
+
 def create_dns_client(context):
     from reddwarf.dns.manager import DnsManager
     return DnsManager()
@@ -32,30 +174,36 @@ def create_guest_client(context, id):
     return API(context, id)
 
 
+def create_guest_set_client(context, ids):
+    from reddwarf.guestagent.api import GuestSetAPI
+    return GuestSetAPI(context, ids)
+
+
+def create_taskmanager_client(context):
+    from reddwarf.taskmanager.api import API
+    return API(context)
+
+
 def create_nova_client(context):
     COMPUTE_URL = CONFIG.get('nova_compute_url', 'http://localhost:8774/v2')
-    PROXY_AUTH_URL = CONFIG.get('reddwarf_auth_url',
-                                'http://0.0.0.0:5000/v2.0')
-    client = Client(context.user, context.auth_tok,
-        project_id=context.tenant, auth_url=PROXY_AUTH_URL)
-    client.client.auth_token = context.auth_tok
-    client.client.management_url = "%s/%s/" % (COMPUTE_URL, context.tenant)
+    return _pooled_client('compute', context, COMPUTE_URL)
 
-    return client
+
+def create_admin_nova_client():
+    """Returns a Nova client for the proxy admin user, for maintenance."""
+    return Client(CONFIG.get('reddwarf_proxy_admin_user', 'admin'),
+                  CONFIG.get('reddwarf_proxy_admin_pass'),
+                  project_id=CONFIG.get('reddwarf_proxy_admin_tenant_name',
+                                        'admin'),
+                  auth_url=CONFIG.get('reddwarf_auth_url',
+                                      'http://0.0.0.0:5000/v2.0'))
 
 
 def create_nova_volume_client(context):
     # Quite annoying but due to a paste config loading bug.
     # TODO(hub-cap): talk to the openstack-common people about this
     VOLUME_URL = CONFIG.get('nova_volume_url', 'http://localhost:8776/v2')
-    PROXY_AUTH_URL = CONFIG.get('reddwarf_auth_url',
-                                'http://0.0.0.0:5000/v2.0')
-    client = Client(context.user, context.auth_tok,
-        project_id=context.tenant, auth_url=PROXY_AUTH_URL)
-    client.client.auth_token = context.auth_tok
-    client.client.management_url = "%s/%s/" % (VOLUME_URL, context.tenant)
-
-    return client
+    return _pooled_client('volume', context, VOLUME_URL)
 
 
 if CONFIG.get("remote_implementation", "real") == "fake":
@@ -64,12 +212,20 @@ if CONFIG.get("remote_implementation", "real") == "fake":
     from reddwarf.tests.fakes.nova import fake_create_nova_client
     from reddwarf.tests.fakes.nova import fake_create_nova_volume_client
     from reddwarf.tests.fakes.guestagent import fake_create_guest_client
+    from reddwarf.tests.fakes.guestagent import fake_create_guest_set_client
+    from reddwarf.tests.fakes.taskmanager import fake_create_taskmanager_client
 
     def create_guest_client(context, id):
         return fake_create_guest_client(context, id)
 
+    def create_guest_set_client(context, ids):
+        return fake_create_guest_set_client(context, ids)
+
     def create_nova_client(context):
         return fake_create_nova_client(context)
 
     def create_nova_volume_client(context):
         return fake_create_nova_volume_client(context)
+
+    def create_taskmanager_client(context):
+        return fake_create_taskmanager_client(context)
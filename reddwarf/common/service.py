@@ -26,6 +26,7 @@ import socket
 import eventlet
 import greenlet
 
+from reddwarf import db
 from reddwarf.common import config
 from reddwarf import rpc
 from reddwarf.common import utils
@@ -94,6 +95,10 @@ class Service(object):
     def report_state(self):
         pass
 
+    def dispatch_scope(self):
+        """Returns the scope each rpc message is handled in."""
+        return self.manager.dispatch_scope()
+
     def __getattr__(self, key):
         """This method proxy's the calls to the manager implementation"""
         manager = self.__dict__.get('manager', None)
@@ -183,6 +188,15 @@ class Manager(object):
         """
         pass
 
+    def dispatch_scope(self):
+        """Returns the context manager each rpc message is handled in.
+
+        Everything one message does shares a database session, which is
+        flushed before the reply is sent.
+
+        """
+        return db.db_api.request_scope()
+
     def _wrapper(self, method, context, *args, **kwargs):
         """Wraps the called functions with additional information."""
         func = getattr(self, method)
@@ -16,6 +16,7 @@
 #    under the License.
 """I totally stole most of this from melange, thx guys!!!"""
 
+import collections
 import datetime
 import inspect
 import logging
@@ -107,6 +108,64 @@ class cached_property(object):
         return value
 
 
+class ExpiringCache(object):
+    """A small in-process cache whose entries expire after ttl seconds.
+
+    Once the cache holds max_size entries the oldest one is evicted to make
+    room. A ttl of zero or less disables caching entirely. Counters for hits,
+    misses, expirations and evictions are available through stats().
+
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_size > 0
+
+    def get(self, key):
+        """Returns the value stored under key, or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if time.time() < expires_at:
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+        self._entries.pop(key, None)
+        while len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self._entries[key] = (time.time() + self.ttl, value)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'evictions': self.evictions}
+
+
 class MethodInspector(object):
 
     def __init__(self, func):
@@ -228,6 +287,26 @@ def poll_until(retriever, condition=lambda value: value,
     return lc.wait()
 
 
+def poll_with_backoff(retriever, condition=lambda value: value,
+                      sleep_time=1, max_sleep_time=30, backoff=2,
+                      time_out=None):
+    """Like poll_until, but waits longer after each unsuccessful check.
+
+    The wait starts at sleep_time and is multiplied by backoff after every
+    check, up to max_sleep_time.
+
+    """
+    start_time = time.time()
+    while True:
+        obj = retriever()
+        if condition(obj):
+            return obj
+        if time_out is not None and time.time() > start_time + time_out:
+            raise exception.PollTimeOut
+        greenthread.sleep(sleep_time)
+        sleep_time = min(sleep_time * backoff, max_sleep_time)
+
+
 # Copied from nova.api.openstack.common in the old code.
 def get_id_from_href(href):
     """Return the id or uuid portion of a url.
@@ -25,6 +25,7 @@ import webob
 import webob.dec
 import webob.exc
 
+from reddwarf import db
 from reddwarf.common import context as rd_context
 from reddwarf.common import exception
 from reddwarf.common import utils
@@ -305,7 +306,7 @@ class ContextMiddleware(openstack_wsgi.Middleware):
 
     def _extract_limits(self, params):
         return dict([(key, params[key]) for key in params.keys()
-                    if key in ["limit", "marker"]])
+                    if key in ["limit", "marker", "sort_key", "sort_dir"]])
 
     def process_request(self, request):
         tenant_id = request.headers.get('X-Tenant-Id', None)
@@ -314,7 +315,9 @@ class ContextMiddleware(openstack_wsgi.Middleware):
         context = rd_context.ReddwarfContext(auth_tok=auth_tok,
                                              tenant=tenant_id,
                                              limit=limits.get('limit'),
-                                             marker=limits.get('marker'))
+                                             marker=limits.get('marker'),
+                                             sort_key=limits.get('sort_key'),
+                                             sort_dir=limits.get('sort_dir'))
         request.environ[CONTEXT_KEY] = context
 
     @classmethod
@@ -324,3 +327,18 @@ class ContextMiddleware(openstack_wsgi.Middleware):
                        local_config)
             return cls(app)
         return _factory
+
+
+class DatabaseSessionMiddleware(openstack_wsgi.Middleware):
+    """Runs each request inside one database session scope."""
+
+    @webob.dec.wsgify
+    def __call__(self, request):
+        with db.db_api.request_scope():
+            return request.get_response(self.application)
+
+    @classmethod
+    def factory(cls, global_config, **local_config):
+        def _factory(app):
+            return cls(app)
+        return _factory
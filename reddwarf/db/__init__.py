@@ -19,6 +19,8 @@ import optparse
 
 from reddwarf.common import utils
 from reddwarf.common import config
+from reddwarf.common import exception
+from reddwarf.common import pagination
 
 
 db_api = utils.import_object(config.Config.get("db_api_implementation",
@@ -48,8 +50,8 @@ class Query(object):
         return iter(self.all())
 
     def update(self, **values):
-        db_api.update_all(self._query_func, self._model, self._conditions,
-            values)
+        return db_api.update_all(self._query_func, self._model,
+                                 self._conditions, values)
 
     def delete(self):
         db_api.delete_all(self._query_func, self._model, **self._conditions)
@@ -62,10 +64,41 @@ class Query(object):
             marker=marker,
             marker_column=marker_column)
 
-    def paginated_collection(self, limit=200, marker=None, marker_column=None):
-        collection = self.limit(int(limit) + 1, marker, marker_column)
+    def paginated_collection(self, limit=200, marker=None, marker_column=None,
+                             sort_key=None, sort_dir='asc'):
+        """Returns a page of models and the marker for the next page.
+
+        Without a sort_key the page is ordered by marker_column (the id by
+        default) and the marker is that column's value. With a sort_key the
+        page is ordered by (sort_key, id) in sort_dir order and the marker
+        is an opaque encoding of both values from the last row. A marker
+        must come back with the sort_key, or lack of one, it was issued for.
+        """
+        if sort_key is None:
+            if marker and pagination.is_encoded_marker(marker):
+                raise exception.BadRequest(_("Marker %s belongs to a sorted "
+                    "listing; pass the sort_key it was issued with.")
+                    % marker)
+            collection = self.limit(int(limit) + 1, marker, marker_column)
+            if len(collection) > int(limit):
+                return (collection[0:-1], collection[-2]['id'])
+            return (collection, None)
+
+        if marker and not pagination.is_encoded_marker(marker):
+            raise exception.BadRequest(_("Marker %(marker)s does not belong "
+                "to a listing sorted by %(sort_key)s.") % locals())
+        marker_values = pagination.decode_marker(marker) if marker else None
+        collection = db_api.find_all_by_keyset(self._query_func,
+            self._model,
+            self._conditions,
+            limit=int(limit) + 1,
+            sort_key=sort_key,
+            sort_dir=sort_dir,
+            marker=marker_values)
         if len(collection) > int(limit):
-            return (collection[0:-1], collection[-2]['id'])
+            last = collection[-2]
+            return (collection[0:-1],
+                    pagination.encode_marker(last[sort_key], last['id']))
         return (collection, None)
 
 
@@ -15,11 +15,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+import operator
+
+import sqlalchemy
 import sqlalchemy.exc
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import orm
+from sqlalchemy import types
 from sqlalchemy.orm import aliased
 
+from reddwarf.common import config
 from reddwarf.common import exception
 from reddwarf.common import utils
 from reddwarf.db.sqlalchemy import migration
@@ -27,6 +34,10 @@ from reddwarf.db.sqlalchemy import mappers
 from reddwarf.db.sqlalchemy import session
 
 
+# Taken before list() below shadows the builtin.
+_SEQUENCES = (list, tuple)
+
+
 def list(query_func, *args, **kwargs):
     return query_func(*args, **kwargs).all()
 
@@ -45,14 +56,62 @@ def find_all_by_limit(query_func, model, conditions, limit, marker=None,
                    marker_column).all()
 
 
+def find_all_by_keyset(query_func, model, conditions, limit, sort_key,
+                       sort_dir='asc', marker=None):
+    return _keyset(query_func, model, conditions, limit, sort_key, sort_dir,
+                   marker).all()
+
+
 def find_by(model, **kwargs):
+    if kwargs.keys() == ['id']:
+        # Looking up by primary key lets the session answer from its
+        # identity map when the row was already loaded in this scope.
+        return _read_query(model).get(kwargs['id'])
     return _query_by(model, **kwargs).first()
 
 
+def find_all_in(model, field, values, **conditions):
+    if not values:
+        return []
+    query = _query_by(model, **conditions)
+    return query.filter(getattr(model, field).in_(values)).all()
+
+
+def find_joined_by(model, related_model, related_field, **conditions):
+    """Finds a model and the related row pointing at it in one query.
+
+    Returns a (model, related_model) tuple, or None if either is missing.
+    """
+    query = session.get_read_session().query(model, related_model)
+    query = query.filter(getattr(related_model, related_field) == model.id)
+    for key, value in conditions.iteritems():
+        query = query.filter(getattr(model, key) == value)
+    return query.first()
+
+
+def _attach(db_session, model):
+    """Adds the model to db_session, returning the copy the session tracks.
+
+    A model another session loaded keeps the change history SQLAlchemy
+    tracked for it, so flushing issues an UPDATE of only the columns that
+    changed, with no SELECT beforehand. A model with no session may stand
+    for a row that already exists, so it is merged instead: the row is
+    looked up by primary key, then UPDATEd or INSERTed.
+    """
+    owner = orm.object_session(model)
+    if owner is db_session:
+        return model
+    if owner is None:
+        return db_session.merge(model)
+    owner.expunge(model)
+    db_session.add(model)
+    return model
+
+
 def save(model):
     try:
         db_session = session.get_session()
-        model = db_session.merge(model)
+        model = _attach(db_session, model)
         db_session.flush()
         return model
     except sqlalchemy.exc.IntegrityError as error:
@@ -60,15 +119,32 @@ def save(model):
                                           error=str(error.orig))
 
 
+def insert_all(models):
+    """INSERTs several new models with a single flush.
+
+    Models of one type are INSERTed together as one executemany. None of the
+    rows may exist yet.
+    """
+    try:
+        db_session = session.get_session()
+        db_session.add_all(models)
+        db_session.flush()
+        return models
+    except sqlalchemy.exc.IntegrityError as error:
+        raise exception.DBConstraintError(
+            model_name=models[0].__class__.__name__, error=str(error.orig))
+
+
 def delete(model):
     db_session = session.get_session()
-    model = db_session.merge(model)
+    model = _attach(db_session, model)
     db_session.delete(model)
     db_session.flush()
 
 
 def delete_all(query_func, model, **conditions):
-    query_func(model, **conditions).delete()
+    with session.use_primary():
+        query_func(model, **conditions).delete()
 
 
 def update(model, **values):
@@ -77,10 +153,57 @@ def update(model, **values):
 
 
 def update_all(query_func, model, conditions, values):
-    query_func(model, **conditions).update(values)
+    with session.use_primary():
+        # Models already loaded into the session are left as they were.
+        return query_func(model, **conditions).update(
+            values, synchronize_session=False)
+
+
+def update_newer(model, key, rows, timestamp):
+    """Gives each row its own values with one UPDATE.
+
+    rows maps a value of the key column to a dict of new column values. The
+    dicts all have the same columns, including timestamp. A row whose
+    timestamp is already the same or later is left alone, so a change that
+    arrives late never replaces a newer one. Returns the number of rows
+    changed.
+    """
+    key_column = getattr(model, key)
+
+    def per_row(column):
+        return sqlalchemy.case(dict((key_value, values[column])
+                                    for key_value, values in rows.iteritems()),
+                               value=key_column)
+    timestamp_column = getattr(model, timestamp)
+    values = dict((column, per_row(column))
+                  for column in rows.values()[0].keys())
+    with session.use_primary():
+        query = _query_by(model, **{key: rows.keys()})
+        query = query.filter(or_(timestamp_column == None,
+                                 timestamp_column < per_row(timestamp)))
+        return query.update(values, synchronize_session=False)
+
+
+def request_scope():
+    return session.request_scope()
+
+
+def suspend_scope():
+    return session.suspend_scope()
+
+
+def pool_stats(read=False):
+    return session.pool_stats(read)
+
+
+def use_primary():
+    return session.use_primary()
 
 
 def configure_db(options, *plugins):
+    if config.get_option(options, 'sql_check_schema_version', type='bool',
+                         default=False):
+        migration.check_schema_version(options)
     session.configure_db(options)
     configure_db_for_plugins(options, *plugins)
 
@@ -110,20 +233,38 @@ def db_downgrade(options, version, repo_path=None):
     migration.downgrade(options, version, repo_path)
 
 
+def db_missing_indexes(options):
+    return migration.missing_indexes(options)
+
+
 def db_reset(options, *plugins):
     drop_db(options)
     db_sync(options)
     configure_db(options)
 
 
-def _base_query(cls):
-    return session.get_session().query(cls)
+def _read_query(cls):
+    return session.get_read_session().query(cls)
 
 
 def _query_by(cls, **conditions):
-    query = _base_query(cls)
-    if conditions:
-        query = query.filter_by(**conditions)
+    """Filters on each condition; list or tuple values match with IN.
+
+    A None in a list or tuple also matches NULL, which IN alone never does.
+    """
+    query = _read_query(cls)
+    for key, value in conditions.iteritems():
+        column = getattr(cls, key)
+        if isinstance(value, _SEQUENCES):
+            values = [item for item in value if item is not None]
+            if not values:
+                query = query.filter(column == None)
+            elif len(values) < len(value):
+                query = query.filter(or_(column.in_(values), column == None))
+            else:
+                query = query.filter(column.in_(value))
+        else:
+            query = query.filter(column == value)
     return query
 
 
@@ -133,3 +274,60 @@ def _limits(query_func, model, conditions, limit, marker, marker_column=None):
     if marker:
         query = query.filter(marker_column > marker)
     return query.order_by(marker_column).limit(limit)
+
+
+def _marker_value(column, value):
+    """Turns a value decoded from a marker back into the column's type."""
+    column_type = column.property.columns[0].type
+    if value is not None and isinstance(column_type, types.DateTime):
+        for time_format in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"):
+            try:
+                return datetime.datetime.strptime(value, time_format)
+            except ValueError:
+                pass
+        raise exception.BadRequest(_("Invalid marker value %s.") % value)
+    return value
+
+
+def _keyset(query_func, model, conditions, limit, sort_key, sort_dir,
+            marker=None):
+    """Orders by (sort_key, id) and seeks past the marker's row.
+
+    Filtering on the last row's values instead of using an OFFSET keeps the
+    cost of each page proportional to the page size when an index on the
+    sort columns exists.
+    """
+    if sort_dir not in ('asc', 'desc'):
+        raise exception.BadRequest(_("Invalid sort direction %s.") % sort_dir)
+    if sort_key not in orm.class_mapper(model).columns:
+        raise exception.BadRequest(_("Invalid sort key %s.") % sort_key)
+    sort_column = getattr(model, sort_key)
+    order = sqlalchemy.asc if sort_dir == 'asc' else sqlalchemy.desc
+    query = query_func(model, **conditions)
+    if marker:
+        if len(marker) != 2:
+            raise exception.BadRequest(_("Invalid marker."))
+        sort_value = _marker_value(sort_column, marker[0])
+        query = query.filter(_after_row(sort_column, sort_value, model.id,
+                                        marker[1], sort_dir))
+    return query.order_by(order(sort_column), order(model.id)).limit(limit)
+
+
+def _after_row(sort_column, sort_value, id_column, id_value, sort_dir):
+    """Matches the rows ordered after the row (sort_value, id_value).
+
+    The sort key may be NULL. NULLs come before every other value, as MySQL
+    and SQLite order them, so ascending pages start with the NULL rows and
+    descending pages end with them. A plain comparison never matches NULL,
+    so those rows are matched with IS NULL instead.
+    """
+    after = operator.gt if sort_dir == 'asc' else operator.lt
+    if sort_value is None:
+        tie = and_(sort_column == None, after(id_column, id_value))
+        if sort_dir == 'asc':
+            return or_(sort_column != None, tie)
+        return tie
+    tie = and_(sort_column == sort_value, after(id_column, id_value))
+    if sort_dir == 'asc':
+        return or_(sort_column > sort_value, tie)
+    return or_(sort_column < sort_value, tie, sort_column == None)
@@ -0,0 +1,51 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy.schema import Index
+from sqlalchemy.schema import MetaData
+
+from reddwarf.db.sqlalchemy.migrate_repo.schema import Table
+
+
+meta = MetaData()
+
+# dns_records.name, root_enabled_history.id and instances.id are primary
+# keys and are already indexed.
+INDEXES = [
+    ('ix_service_statuses_instance_id', 'service_statuses', ['instance_id']),
+    ('ix_agent_heartbeats_instance_id', 'agent_heartbeats', ['instance_id']),
+    ('ix_service_images_service_name', 'service_images', ['service_name']),
+    ('ix_instances_tenant_id_id', 'instances', ['tenant_id', 'id']),
+]
+
+
+def _indexes():
+    for name, table_name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        yield Index(name, *[table.c[column] for column in columns])
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.drop(migrate_engine)
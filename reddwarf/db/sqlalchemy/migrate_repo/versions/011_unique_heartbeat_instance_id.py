@@ -0,0 +1,64 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import select
+from sqlalchemy.schema import Index
+from sqlalchemy.schema import MetaData
+
+from reddwarf.db.sqlalchemy.migrate_repo.schema import Table
+
+
+meta = MetaData()
+
+INDEX_NAME = 'ix_agent_heartbeats_instance_id'
+
+
+def _delete_duplicates(migrate_engine, heartbeats):
+    """Keeps only the newest heartbeat row of each instance.
+
+    Task managers flushing at the same time could each insert a row for an
+    instance seen for the first time.
+    """
+    rows = migrate_engine.execute(
+        select([heartbeats.c.id, heartbeats.c.instance_id]).order_by(
+            heartbeats.c.instance_id, heartbeats.c.updated_at.desc()))
+    seen = set()
+    duplicates = []
+    for row in rows:
+        if row.instance_id in seen:
+            duplicates.append(row.id)
+        seen.add(row.instance_id)
+    if duplicates:
+        migrate_engine.execute(
+            heartbeats.delete().where(heartbeats.c.id.in_(duplicates)))
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    heartbeats = Table('agent_heartbeats', meta, autoload=True)
+    _delete_duplicates(migrate_engine, heartbeats)
+    Index(INDEX_NAME, heartbeats.c.instance_id).drop(migrate_engine)
+    Index(INDEX_NAME, heartbeats.c.instance_id,
+          unique=True).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    heartbeats = Table('agent_heartbeats', meta, autoload=True)
+    Index(INDEX_NAME, heartbeats.c.instance_id,
+          unique=True).drop(migrate_engine)
+    Index(INDEX_NAME, heartbeats.c.instance_id).create(migrate_engine)
@@ -19,6 +19,8 @@ import logging
 import os
 
 from migrate.versioning import api as versioning_api
+from sqlalchemy import create_engine
+from sqlalchemy.engine import reflection
 # See LP bug #719834. sqlalchemy-migrate changed location of
 # exceptions.py after 0.6.0.
 try:
@@ -31,6 +33,20 @@ from reddwarf.common import exception
 
 logger = logging.getLogger('reddwarf.db.sqlalchemy.migration')
 
+# Columns the API, task manager and guest filter or order by on hot paths.
+# Each entry must be the leading columns of the primary key or of an index.
+INDEXED_COLUMNS = [
+    ('instances', ['id']),
+    ('instances', ['tenant_id', 'id']),
+    ('instances', ['tenant_id', 'created', 'id']),
+    ('instances', ['tenant_id', 'updated', 'id']),
+    ('service_statuses', ['instance_id']),
+    ('agent_heartbeats', ['instance_id']),
+    ('service_images', ['service_name']),
+    ('dns_records', ['name']),
+    ('root_enabled_history', ['id']),
+]
+
 
 def db_version(options, repo_path=None):
     """Return the database's current migration number.
@@ -49,6 +65,23 @@ def db_version(options, repo_path=None):
         raise exception.DatabaseMigrationError(msg)
 
 
+def check_schema_version(options, repo_path=None):
+    """Fail unless the database is at the newest migration.
+
+    The models are mapped onto the tables declared in tables.py, which
+    describe the schema after the newest migration.
+
+    :param options: options dict
+
+    """
+    current = db_version(options, repo_path)
+    latest = versioning_api.version(get_migrate_repo_path(repo_path))
+    if int(current) != int(latest):
+        msg = ("database is at migration %(current)s but this code expects "
+               "%(latest)s; run 'reddwarf-manage db_upgrade'" % locals())
+        raise exception.DatabaseMigrationError(msg)
+
+
 def upgrade(options, version=None, repo_path=None):
     """Upgrade the database's current migration level.
 
@@ -124,6 +157,33 @@ def db_sync(options, version=None, repo_path=None):
     upgrade(options, version=version, repo_path=repo_path)
 
 
+def missing_indexes(options):
+    """Compare INDEXED_COLUMNS with the indexes of a live schema.
+
+    :param options: options dict
+    :retval list of (table, columns) tuples with no usable index
+
+    """
+    engine = create_engine(options['sql_connection'])
+    try:
+        inspector = reflection.Inspector.from_engine(engine)
+        tables = set(inspector.get_table_names())
+        missing = []
+        for table, columns in INDEXED_COLUMNS:
+            if table not in tables:
+                missing.append((table, columns))
+                continue
+            covering = [inspector.get_primary_keys(table)]
+            covering += [index['column_names']
+                         for index in inspector.get_indexes(table)]
+            if not any(index[:len(columns)] == columns
+                       for index in covering):
+                missing.append((table, columns))
+        return missing
+    finally:
+        engine.dispose()
+
+
 def get_migrate_repo_path(repo_path=None):
     """Get the path for the migrate repository."""
 
@@ -17,8 +17,13 @@
 
 import contextlib
 import logging
+import time
+from eventlet import corolocal
 from sqlalchemy import create_engine
+from sqlalchemy import exc
+from sqlalchemy import interfaces
 from sqlalchemy import MetaData
+from sqlalchemy import pool
 from sqlalchemy.orm import sessionmaker
 
 from reddwarf.common import config
@@ -26,6 +31,9 @@ from reddwarf.db.sqlalchemy import mappers
 
 _ENGINE = None
 _MAKER = None
+_READ_ENGINE = None
+_READ_MAKER = None
+_SCOPE = corolocal.local()
 
 
 LOG = logging.getLogger(__name__)
@@ -33,9 +41,12 @@ LOG = logging.getLogger(__name__)
 
 def configure_db(options, models_mapper=None):
     configure_sqlalchemy_log(options)
-    global _ENGINE
+    global _ENGINE, _READ_ENGINE
     if not _ENGINE:
         _ENGINE = _create_engine(options)
+    read_connection = options.get('sql_read_connection')
+    if not _READ_ENGINE and read_connection:
+        _READ_ENGINE = _create_engine(options, read_connection)
     if models_mapper:
         models_mapper.map(_ENGINE)
     else:
@@ -65,7 +76,63 @@ def configure_sqlalchemy_log(options):
         logger.setLevel(logging.INFO)
 
 
-def _create_engine(options):
+class PingListener(interfaces.PoolListener):
+    """
+    Makes sure connections handed out by the pool are still alive, so a
+    connection the database server dropped is replaced rather than failing
+    the request that happens to check it out.
+    """
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        """Event triggered when a connection is checked out from the pool"""
+        cursor = None
+        try:
+            cursor = dbapi_con.cursor()
+            cursor.execute("SELECT 1")
+        except Exception, ex:
+            LOG.warn(_("Replacing dead database connection: %s") % ex)
+            raise exc.DisconnectionError()
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+
+class MeteredQueuePool(pool.QueuePool):
+    """A QueuePool that keeps track of how long checkouts wait."""
+
+    def __init__(self, *args, **kwargs):
+        super(MeteredQueuePool, self).__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(MeteredQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.time() - start
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def stats(self):
+        return {'size': self.size(),
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': self.overflow(),
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait}
+
+
+def _create_engine(options, connection=None):
+    connection = connection or options['sql_connection']
     engine_args = {
         "pool_recycle": config.get_option(options,
                                           'sql_idle_timeout',
@@ -76,12 +143,147 @@ def _create_engine(options):
                                   type='bool',
                                   default=False),
     }
+    if not connection.startswith('sqlite'):
+        # SQLite uses its own pool classes which take none of these.
+        engine_args.update({
+            "poolclass": MeteredQueuePool,
+            "pool_size": config.get_option(options,
+                                           'sql_pool_size',
+                                           type='int',
+                                           default=10),
+            "max_overflow": config.get_option(options,
+                                              'sql_max_overflow',
+                                              type='int',
+                                              default=10),
+            "pool_timeout": config.get_option(options,
+                                              'sql_pool_timeout',
+                                              type='int',
+                                              default=30),
+        })
+    if config.get_option(options, 'sql_pool_ping', type='bool',
+                         default=True):
+        engine_args["listeners"] = [PingListener()]
     LOG.info(_("Creating SQLAlchemy engine with args: %s") % engine_args)
-    return create_engine(options['sql_connection'], **engine_args)
+    return create_engine(connection, **engine_args)
+
+
+def pool_stats(read=False):
+    """Returns the connection pool counters, if the pool keeps any.
+
+    With read set, returns those of the read replica's pool instead.
+    """
+    engine = _READ_ENGINE if read else _ENGINE
+    if engine is None or not hasattr(engine.pool, 'stats'):
+        return {}
+    return engine.pool.stats()
+
+
+@contextlib.contextmanager
+def request_scope():
+    """Shares one session across all the database work done in the block.
+
+    The session belongs to the current greenthread, is created the first time
+    it is needed and is flushed and closed when the block exits. Nested
+    scopes reuse the outer one.
+
+    """
+    if getattr(_SCOPE, 'active', False):
+        yield
+        return
+    _SCOPE.active = True
+    _SCOPE.session = None
+    _SCOPE.read_session = None
+    try:
+        yield
+        if _SCOPE.session is not None:
+            _SCOPE.session.flush()
+    finally:
+        for scoped in (_SCOPE.session, _SCOPE.read_session):
+            if scoped is not None:
+                scoped.close()
+        _SCOPE.session = None
+        _SCOPE.read_session = None
+        _SCOPE.active = False
+
+
+@contextlib.contextmanager
+def suspend_scope():
+    """Runs the block as if no request scope were open.
+
+    Every query in the block gets a session of its own, so work that runs
+    for minutes reads the rows as they are now rather than as the scope
+    first loaded them. The scope is restored when the block exits.
+
+    """
+    saved = (getattr(_SCOPE, 'active', False),
+             getattr(_SCOPE, 'session', None),
+             getattr(_SCOPE, 'read_session', None))
+    _SCOPE.active = False
+    try:
+        yield
+    finally:
+        _SCOPE.active, _SCOPE.session, _SCOPE.read_session = saved
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Sends the reads made in the block to the primary database.
+
+    Use it when a flow must see its own writes, which the read replica may
+    not have applied yet.
+
+    """
+    previous = getattr(_SCOPE, 'primary', False)
+    _SCOPE.primary = True
+    try:
+        yield
+    finally:
+        _SCOPE.primary = previous
 
 
 def get_session(autocommit=True, expire_on_commit=False):
-    """Helper method to grab session."""
+    """Helper method to grab session.
+
+    Inside a request_scope this is the scope's session, otherwise a new one.
+
+    """
+    if getattr(_SCOPE, 'active', False):
+        if _SCOPE.session is None:
+            _SCOPE.session = _new_session(autocommit, expire_on_commit)
+        return _SCOPE.session
+    return _new_session(autocommit, expire_on_commit)
+
+
+def get_read_session(autocommit=True, expire_on_commit=False):
+    """Helper method to grab a session for read-only queries.
+
+    This is bound to the read replica when sql_read_connection is set. It is
+    the get_session() one when there is no replica, inside use_primary(),
+    and once the current request scope has written, so a scope always reads
+    its own writes.
+
+    """
+    if (_READ_ENGINE is None or getattr(_SCOPE, 'primary', False) or
+        (getattr(_SCOPE, 'active', False) and _SCOPE.session is not None)):
+        return get_session(autocommit, expire_on_commit)
+    if getattr(_SCOPE, 'active', False):
+        if _SCOPE.read_session is None:
+            _SCOPE.read_session = _new_read_session(autocommit,
+                                                    expire_on_commit)
+        return _SCOPE.read_session
+    return _new_read_session(autocommit, expire_on_commit)
+
+
+def _new_read_session(autocommit, expire_on_commit):
+    global _READ_MAKER
+    if not _READ_MAKER:
+        _READ_MAKER = sessionmaker(bind=_READ_ENGINE,
+                                   autocommit=autocommit,
+                                   expire_on_commit=expire_on_commit)
+    return _READ_MAKER()
+
+
+def _new_session(autocommit, expire_on_commit):
     global _MAKER, _ENGINE
     if not _MAKER:
         if not _ENGINE:
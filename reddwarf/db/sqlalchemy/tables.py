@@ -0,0 +1,89 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The schema as of the newest migration, used to map the models.
+
+Declaring the tables here spares every process from reflecting them from
+the database when it starts. Any migration that changes a mapped table
+must change its definition here too.
+"""
+
+from sqlalchemy.schema import Column
+from sqlalchemy.schema import Index
+from sqlalchemy.schema import MetaData
+
+from reddwarf.db.sqlalchemy.migrate_repo.schema import DateTime
+from reddwarf.db.sqlalchemy.migrate_repo.schema import Integer
+from reddwarf.db.sqlalchemy.migrate_repo.schema import String
+from reddwarf.db.sqlalchemy.migrate_repo.schema import Table
+
+
+meta = MetaData()
+
+instances = Table('instances', meta,
+    Column('id', String(36), primary_key=True, nullable=False),
+    Column('created', DateTime()),
+    Column('updated', DateTime()),
+    Column('name', String(255)),
+    Column('hostname', String(255)),
+    Column('compute_instance_id', String(36)),
+    Column('task_id', Integer()),
+    Column('task_description', String(32)),
+    Column('task_start_time', DateTime()),
+    Column('volume_id', String(36)),
+    Column('tenant_id', String(36), nullable=True),
+    Column('flavor_id', String(36), nullable=True),
+    Column('volume_size', Integer(), nullable=True))
+
+Index('ix_instances_tenant_id_id', instances.c.tenant_id, instances.c.id)
+Index('ix_instances_tenant_id_created_id', instances.c.tenant_id,
+      instances.c.created, instances.c.id)
+Index('ix_instances_tenant_id_updated_id', instances.c.tenant_id,
+      instances.c.updated, instances.c.id)
+
+service_images = Table('service_images', meta,
+    Column('id', String(36), primary_key=True, nullable=False),
+    Column('service_name', String(255)),
+    Column('image_id', String(255)))
+
+Index('ix_service_images_service_name', service_images.c.service_name)
+
+service_statuses = Table('service_statuses', meta,
+    Column('id', String(36), primary_key=True, nullable=False),
+    Column('instance_id', String(36), nullable=False),
+    Column('status_id', Integer(), nullable=False),
+    Column('status_description', String(64), nullable=False),
+    Column('updated_at', DateTime()))
+
+Index('ix_service_statuses_instance_id', service_statuses.c.instance_id)
+
+root_enabled_history = Table('root_enabled_history', meta,
+    Column('id', String(36), primary_key=True, nullable=False),
+    Column('user', String(length=255)),
+    Column('created', DateTime()))
+
+agent_heartbeats = Table('agent_heartbeats', meta,
+    Column('id', String(36), primary_key=True, nullable=False),
+    Column('instance_id', String(36), nullable=False),
+    Column('updated_at', DateTime()))
+
+Index('ix_agent_heartbeats_instance_id', agent_heartbeats.c.instance_id,
+      unique=True)
+
+dns_records = Table('dns_records', meta,
+    Column('name', String(length=255), primary_key=True),
+    Column('record_id', String(length=64)))
@@ -51,8 +51,16 @@ class Mgmt(extensions.ExtensionsDescriptor):
             service.MgmtInstanceController(),
             deserializer=wsgi.RequestDeserializer(),
             serializer=serializer,
+            collection_actions={'cast': 'POST'},
             member_actions={'root': 'GET'},
             )
         resources.append(resource)
 
+        resource = extensions.ResourceExtension('{tenant_id}/mgmt/stats',
+            service.MgmtStatsController(),
+            deserializer=wsgi.RequestDeserializer(),
+            serializer=serializer,
+            )
+        resources.append(resource)
+
         return resources
@@ -18,7 +18,10 @@
 import logging
 import webob.exc
 
+from reddwarf import db
+from reddwarf import rpc
 from reddwarf.common import exception
+from reddwarf.common import remote
 from reddwarf.common import wsgi
 from reddwarf.instance import models as instance_models
 from reddwarf.extensions.mgmt import views
@@ -27,6 +30,11 @@ from reddwarf.instance.service import InstanceController
 
 LOG = logging.getLogger(__name__)
 
+# Guest agent methods that may be sent to many instances at once. A guest
+# can get the same cast twice (see rpc.cast_many), so each of these must be
+# safe to repeat.
+GUEST_CAST_METHODS = ['update_status', 'upgrade']
+
 
 class MgmtInstanceController(InstanceController):
     """Controller for instance functionality"""
@@ -37,7 +45,7 @@ class MgmtInstanceController(InstanceController):
         LOG.info(_("Indexing a database instance for tenant '%s'") % tenant_id)
         # TODO(sacharya): Load all servers from nova?
         context = req.environ[wsgi.CONTEXT_KEY]
-        servers = instance_models.Instances.load(context)
+        servers, marker = instance_models.Instances.load(context)
 
         view_cls = views.InstancesView
         return wsgi.Result(view_cls(servers,
@@ -58,6 +66,45 @@ class MgmtInstanceController(InstanceController):
         return wsgi.Result(views.InstanceView(server,
             add_addresses=self.add_addresses).data(), 200)
 
+    def cast(self, req, body, tenant_id):
+        """Send one guest agent method to a set of instances.
+
+        The body looks like {"cast": {"method": "upgrade",
+        "instances": [<instance id>, ...]}}. The task manager publishes
+        the casts in bulk, so this returns as soon as it has been asked to.
+        """
+        LOG.info(_("req : '%s'\n\n") % req)
+        context = req.environ[wsgi.CONTEXT_KEY]
+        method, instance_ids = self._validate_cast(body)
+        with db.db_api.use_primary():
+            found = instance_models.DBInstance.find_all_by_ids(instance_ids)
+        missing = set(instance_ids) - set(found)
+        if missing:
+            raise exception.NotFound(uuid=", ".join(sorted(missing)))
+        LOG.info(_("Casting %s to %d instances") % (method,
+                                                    len(instance_ids)))
+        remote.create_taskmanager_client(context).cast_to_instances(
+            instance_ids, method)
+        return wsgi.Result(None, 202)
+
+    @staticmethod
+    def _validate_cast(body):
+        """Returns the method and instance ids from a cast request."""
+        try:
+            method = body['cast']['method']
+            instance_ids = body['cast']['instances']
+        except (KeyError, TypeError) as e:
+            raise exception.BadRequest(_("Required element/key - %s was not "
+                                         "specified") % e)
+        if method not in GUEST_CAST_METHODS:
+            raise exception.BadRequest(_("Method %s cannot be cast to "
+                                         "instances.") % method)
+        if (not isinstance(instance_ids, list) or not instance_ids or
+            not all(isinstance(id, basestring) for id in instance_ids)):
+            raise exception.BadRequest(_("The instances to cast to must be "
+                                         "a non-empty list of ids."))
+        return method, list(set(instance_ids))
+
     def root(self, req, tenant_id, id):
         """Return the date and time root was enabled on an instance,
         if ever."""
@@ -78,3 +125,20 @@ class MgmtInstanceController(InstanceController):
         else:
             rhv = views.RootHistoryView(id)
         return wsgi.Result(rhv.data(), 200)
+
+
+class MgmtStatsController(wsgi.Controller):
+    """Reports the counters kept by this API process, for monitoring."""
+
+    def index(self, req, tenant_id):
+        """Return the current value of every counter."""
+        LOG.info(_("req : '%s'\n\n") % req)
+        return wsgi.Result({'stats': self._stats()}, 200)
+
+    @staticmethod
+    def _stats():
+        return {'server_cache': instance_models.server_cache_stats(),
+                'nova_clients': remote.client_pool_stats(),
+                'database_pool': db.db_api.pool_stats(),
+                'database_read_pool': db.db_api.pool_stats(read=True),
+                'rpc_pool': rpc.pool_stats()}
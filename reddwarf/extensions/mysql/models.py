@@ -42,7 +42,7 @@ def persisted_models():
 
 def load_and_verify(context, instance_id):
     # Load InstanceServiceStatus to verify if its running
-    instance = base_models.Instance.load(context, instance_id)
+    instance = base_models.SimpleInstance.load(context, instance_id)
     if not instance.is_sql_running:
         raise exception.UnprocessableEntity(
                     "Instance %s is not ready." % instance.id)
@@ -46,6 +46,9 @@ class BaseController(wsgi.Controller):
             ],
         webob.exc.HTTPConflict: [
             ],
+        webob.exc.HTTPGatewayTimeout: [
+            exception.GuestTimeout,
+            ],
         }
 
     def __init__(self):
@@ -25,12 +25,32 @@ from reddwarf import rpc
 from reddwarf.common import config
 from reddwarf.common import exception
 from reddwarf.common import utils
+from reddwarf.rpc import common as rpc_common
 # from nova.db import api as dbapi
 
 
 LOG = logging.getLogger(__name__)
 
 
+class GuestSetAPI(object):
+    """API for sending the same cast to the guests of many instances."""
+
+    def __init__(self, context, ids):
+        self.context = context
+        self.ids = ids
+
+    def cast(self, method_name, **kwargs):
+        LOG.debug(_("Casting %s to %d guests"), method_name, len(self.ids))
+        routing_keys = [API(self.context, id)._get_routing_key()
+                        for id in self.ids]
+        try:
+            rpc.cast_many(self.context, routing_keys,
+                          {"method": method_name, "args": kwargs})
+        except Exception as e:
+            LOG.error(e)
+            raise exception.GuestError(original_message=str(e))
+
+
 class API(object):
     """API for interacting with the guest manager."""
 
@@ -45,6 +65,9 @@ class API(object):
                             {"method": method_name, "args": kwargs})
             LOG.debug("Result is %s" % result)
             return result
+        except rpc_common.Timeout as e:
+            LOG.error(e)
+            raise exception.GuestTimeout(method=method_name)
         except Exception as e:
             LOG.error(e)
             raise exception.GuestError(original_message=str(e))
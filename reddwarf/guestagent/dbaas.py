@@ -49,6 +49,7 @@ from reddwarf.guestagent.db import models
 from reddwarf.guestagent.volume import VolumeDevice
 from reddwarf.guestagent.query import Query
 from reddwarf.instance import models as rd_models
+from reddwarf.taskmanager import api as task_api
 
 
 ADMIN_USER_NAME = "os_admin"
@@ -123,8 +124,8 @@ class MySqlAppStatus(object):
     the state of the application is determined by calling a series of
     commands.
 
-    This class also handles saving and load the status of the MySQL application
-    in the database.
+    This class also reports the status of the MySQL application to the task
+    manager, which records it in the database.
     The status is updated whenever the update() method is called, except
     if the state is changed to building or restart mode using the
      "begin_mysql_install" and "begin_mysql_restart" methods.
@@ -220,15 +221,16 @@ class MySqlAppStatus(object):
 
     @staticmethod
     def _load_status():
-        """Loads the status from the database."""
+        """Asks the task manager for the last status recorded for us."""
         id = config.Config.get('guest_id')
-        return rd_models.InstanceServiceStatus.find_by(instance_id=id)
+        code = task_api.create_admin_client().get_service_status(id)
+        return rd_models.ServiceStatus.from_code(code)
 
     def set_status(self, status):
-        """Changes the status of the MySQL app in the database."""
-        db_status = self._load_status()
-        db_status.set_status(status)
-        db_status.save()
+        """Reports a new status of the MySQL app to the task manager."""
+        id = config.Config.get('guest_id')
+        task_api.create_admin_client().update_service_status(id,
+                                                             status.code)
         self.status = status
 
     def update(self):
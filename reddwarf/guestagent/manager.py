@@ -32,6 +32,7 @@ from reddwarf.common import config
 from reddwarf.common import exception
 from reddwarf.common import utils
 from reddwarf.common import service
+from reddwarf.taskmanager import api as task_api
 
 
 LOG = logging.getLogger(__name__)
@@ -93,6 +94,15 @@ class GuestManager(service.Manager):
         except Exception as e:
             LOG.error("Got an error during periodic tasks!")
             LOG.debug(traceback.format_exc())
+        self._send_heartbeat()
+
+    def _send_heartbeat(self):
+        """Lets the task manager know this agent is alive."""
+        try:
+            task_api.create_admin_client().heartbeat(CONFIG.get('guest_id'))
+        except Exception:
+            LOG.error("Could not send a heartbeat!")
+            LOG.debug(traceback.format_exc())
 
     def upgrade(self, context):
         """Upgrade the guest agent and restart the agent"""
@@ -17,10 +17,10 @@
 
 """Model classes that form the core of instances functionality."""
 
-import eventlet
 import logging
 import netaddr
-import time
+
+from eventlet import greenpool
 
 from reddwarf import db
 
@@ -35,33 +35,70 @@ from reddwarf.common.remote import create_dns_client
 from reddwarf.common.remote import create_guest_client
 from reddwarf.common.remote import create_nova_client
 from reddwarf.common.remote import create_nova_volume_client
-from reddwarf.common.utils import poll_until
+from reddwarf.common.remote import create_taskmanager_client
 from reddwarf.guestagent import api as guest_api
 from reddwarf.instance.tasks import InstanceTask
 from reddwarf.instance.tasks import InstanceTasks
-from reddwarf.taskmanager import api as task_api
-
-
-from eventlet import greenthread
-from reddwarf.instance.views import get_ip_address
 
 
 CONFIG = config.Config
 LOG = logging.getLogger(__name__)
 
 
-def load_server_with_volumes(context, instance_id, server_id):
-    """Loads a server or raises an exception."""
+_SERVER_CACHE = None
+
+
+def get_server_cache():
+    """Returns the per-process cache of Nova servers and their volumes."""
+    global _SERVER_CACHE
+    if _SERVER_CACHE is None:
+        _SERVER_CACHE = utils.ExpiringCache(
+            ttl=float(CONFIG.get('server_cache_ttl', 5)),
+            max_size=int(CONFIG.get('server_cache_size', 1000)))
+    return _SERVER_CACHE
+
+
+def _server_cache_key(context, server_id):
+    # The cached servers keep the client, and so the token, that fetched
+    # them, so they are only handed back to callers with the same token.
+    return (context.tenant, context.auth_tok, server_id)
+
+
+def invalidate_server_cache(context, server_id):
+    get_server_cache().delete(_server_cache_key(context, server_id))
+
+
+def server_cache_stats():
+    return get_server_cache().stats()
+
+
+def load_server_with_volumes(context, instance_id, server_id, use_cache=True):
+    """Loads a server or raises an exception.
+
+    Results are kept for a few seconds in a per-process cache keyed by
+    tenant, auth token and server id. Pass use_cache=False when fresh data
+    from Nova is needed, for example before acting on the server or while
+    waiting on it to change state.
+
+    """
+    cache = get_server_cache()
+    key = _server_cache_key(context, server_id)
+    if use_cache and cache.enabled:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
     client = create_nova_client(context)
     try:
         server = client.servers.get(server_id)
         volumes = load_volumes(context, server_id, client=client)
     except nova_exceptions.NotFound, e:
         LOG.debug("Could not find nova server_id(%s)" % server_id)
+        cache.delete(key)
         raise rd_exceptions.ComputeInstanceNotFound(instance_id=instance_id,
                                                   server_id=server_id)
     except nova_exceptions.ClientException, e:
         raise rd_exceptions.ReddwarfError(str(e))
+    cache.set(key, (server, volumes))
     return server, volumes
 
 
@@ -76,8 +113,7 @@ def load_volumes(context, server_id, client=None):
             volumes_info = client.volumes.get_server_volumes(server_id)
             volume_ids = [attachments.volumeId for attachments in
                           volumes_info]
-            for volume_id in volume_ids:
-                volume_info = volume_client.volumes.get(volume_id)
+            for volume_info in _get_volumes(volume_client, volume_ids):
                 volume = {'id': volume_info.id,
                           'size': volume_info.size}
                 if volume_info.attachments:
@@ -92,6 +128,90 @@ def load_volumes(context, server_id, client=None):
     return None
 
 
+def _get_volumes(volume_client, volume_ids):
+    """Fetches the given volumes, in order.
+
+    The ids come from the server's own attachments, so only its volumes are
+    asked for. Several are fetched concurrently, a few at a time.
+    """
+    concurrency = int(CONFIG.get('volume_fetch_concurrency', 4))
+    return _fetch_concurrently(volume_client.volumes.get, volume_ids,
+                               concurrency)
+
+
+def _fetch_concurrently(fetch, ids, concurrency):
+    """Calls fetch on each id, up to concurrency at a time, in order."""
+    if len(ids) < 2:
+        return [fetch(id) for id in ids]
+    pool = greenpool.GreenPool(min(len(ids), concurrency))
+    return list(pool.imap(fetch, ids))
+
+
+def _fetch_found(fetch, ids, kind):
+    """Fetches each id concurrently, leaving out those Nova cannot find."""
+    def fetch_one(id):
+        try:
+            return fetch(id)
+        except nova_exceptions.NotFound:
+            LOG.debug("Could not find nova %s(%s)" % (kind, id))
+    concurrency = int(CONFIG.get('instance_page_fetch_concurrency', 10))
+    try:
+        found = _fetch_concurrently(fetch_one, ids, concurrency)
+    except nova_exceptions.ClientException, e:
+        raise rd_exceptions.ReddwarfError(str(e))
+    return [item for item in found if item is not None]
+
+
+def load_servers_for_instances(context, db_infos):
+    """Fetches only the compute servers backing the given instances.
+
+    Servers Nova can no longer find are left out of the result so the
+    matcher reports them as missing.
+    """
+    server_ids = [db_info.compute_instance_id for db_info in db_infos
+                  if db_info.compute_instance_id is not None]
+    if not server_ids:
+        return []
+    client = create_nova_client(context)
+    return _fetch_found(client.servers.get, server_ids, 'server_id')
+
+
+def load_volumes_for_instances(context, db_infos):
+    """Fetches only the volumes recorded against the given instances."""
+    volume_ids = [db_info.volume_id for db_info in db_infos
+                  if db_info.volume_id is not None]
+    if not volume_ids:
+        return []
+    volume_client = create_nova_volume_client(context)
+    return _fetch_found(volume_client.volumes.get, volume_ids, 'volume_id')
+
+
+def backfill_tenant_ids(client):
+    """Records the tenant of the instances created before tenant_id was.
+
+    Listings only show an instance to the tenant recorded on it. client
+    must be a Nova client with admin credentials, so that it can list every
+    tenant's servers. Rows whose server Nova no longer has are left as they
+    are. Returns how many rows were given a tenant and how many were not.
+    """
+    db_infos = [db_info for db_info in DBInstance.find_all(tenant_id=None)
+                if db_info.compute_instance_id is not None]
+    if not db_infos:
+        return 0, 0
+    servers = client.servers.list(search_opts={'all_tenants': 1})
+    tenants = dict((server.id, server.tenant_id) for server in servers)
+    updated = 0
+    for db_info in db_infos:
+        tenant_id = tenants.get(db_info.compute_instance_id)
+        if tenant_id is None:
+            LOG.warn(_("Could not find the server of instance %s, so its "
+                       "tenant is unknown.") % db_info.id)
+            continue
+        updated += DBInstance.find_all(id=db_info.id, tenant_id=None).update(
+            tenant_id=tenant_id)
+    return updated, len(db_infos) - updated
+
+
 # This probably should not happen here. Seems like it should
 # be in an extension instead
 def populate_databases(dbs):
@@ -133,16 +253,6 @@ SERVER_INVALID_ACTION_STATUSES = ["BUILD", "REBOOT", "REBUILD"]
 VALID_ACTION_STATUSES = ["ACTIVE"]
 
 
-def ExecuteInstanceMethod(context, id, method_name, *args, **kwargs):
-    """Loads an instance and executes a method."""
-    arg_str = utils.create_method_args_string(*args, **kwargs)
-    LOG.debug("Loading instance %s to make the following call: %s(%s)."
-              % (id, method_name, arg_str))
-    instance = Instance.load(context, id)
-    func = getattr(instance, method_name)
-    func(*args, **kwargs)
-
-
 class Instance(object):
     """Represents an instance.
 
@@ -150,47 +260,72 @@ class Instance(object):
     pass them between threads.
     """
 
-    def __init__(self, context, db_info, server, service_status, volumes):
+    def __init__(self, context, db_info, server, service_status, volumes,
+                 heartbeat=None):
         self.context = context
         self.db_info = db_info
         self.server = server
         self.service_status = service_status
         self.volumes = volumes
+        self.heartbeat = heartbeat
 
-    def call_async(self, method, *args, **kwargs):
-        """Calls a method on this instance in the background and returns.
-
-        This will be a call to some module similar to the guest API, but for
-        now we just call the real method in eventlet.
+    @staticmethod
+    def load(context, id, use_cache=True):
+        """Loads an instance and its server.
 
+        Pass use_cache=False before acting on the instance, so its
+        preconditions are checked against the server as Nova has it now.
         """
-        eventlet.spawn(ExecuteInstanceMethod, self.context, self.db_info.id,
-                       method.__name__, *args, **kwargs)
-
-    @staticmethod
-    def load(context, id):
         if context is None:
             raise TypeError("Argument context not defined.")
         elif id is None:
             raise TypeError("Argument id not defined.")
+        try:
+            return Instance._load(context, id, use_cache)
+        except ModelNotFoundError:
+            # An instance created moments ago may not have reached the read
+            # replica yet.
+            with db.db_api.use_primary():
+                return Instance._load(context, id, use_cache)
+
+    @staticmethod
+    def _load(context, id, use_cache=True):
         try:
             db_info = DBInstance.find_by(id=id)
         except rd_exceptions.NotFound:
             raise rd_exceptions.NotFound(uuid=id)
-        server, volumes = load_server_with_volumes(context, db_info.id,
-            db_info.compute_instance_id)
+        if db_info.compute_instance_id is None:
+            # The task manager has not created the server yet, so there is
+            # no Nova lookup to check that the instance is the tenant's.
+            if not context.is_admin and db_info.tenant_id != context.tenant:
+                raise rd_exceptions.NotFound(uuid=id)
+            server, volumes = None, []
+        else:
+            server, volumes = load_server_with_volumes(context, db_info.id,
+                db_info.compute_instance_id, use_cache=use_cache)
         task_status = db_info.task_status
         service_status = InstanceServiceStatus.find_by(instance_id=id)
         LOG.info("service status=%s" % service_status)
-        return Instance(context, db_info, server, service_status, volumes)
+        heartbeat = AgentHeartBeat.get_by(instance_id=id)
+        return Instance(context, db_info, server, service_status, volumes,
+                        heartbeat)
 
     def delete(self, force=False):
-        if not force and self.server.status in SERVER_INVALID_ACTION_STATUSES:
+        if not force and (
+            self.db_info.task_status == InstanceTasks.BUILDING or
+            (self.server is not None and
+             self.server.status in SERVER_INVALID_ACTION_STATUSES)):
             raise rd_exceptions.UnprocessableEntity("Instance %s is not ready."
                                                     % self.id)
-        LOG.debug(_("  ... deleting compute id = %s") %
-                  self.server.id)
-        self._delete_server()
+        if self.server is not None:
+            LOG.debug(_("  ... deleting compute id = %s") %
+                      self.server.id)
+            self._delete_server()
+            self._invalidate_server_cache()
+        if self.db_info.volume_id is not None:
+            # Attached after boot, so Nova will not delete it with the server.
+            create_taskmanager_client(self.context).delete_volume(
+                self.db_info.volume_id)
         LOG.debug(_(" ... setting status to DELETING."))
         self.db_info.task_status = InstanceTasks.DELETING
         self.db_info.save()
@@ -211,134 +346,32 @@ class Instance(object):
         except nova_exceptions.ClientException, e:
             raise rd_exceptions.ReddwarfError()
 
-    @classmethod
-    def _create_volume(cls, context, db_info, volume_size):
-        volume_support = config.Config.get("reddwarf_volume_support", 'False')
-        LOG.debug(_("reddwarf volume support = %s") % volume_support)
-        if utils.bool_from_string(volume_support):
-            LOG.debug(_("Starting to create the volume for the instance"))
-            volume_client = create_nova_volume_client(context)
-            volume_desc = ("mysql volume for %s" % db_info.id)
-            volume_ref = volume_client.volumes.create(
-                                        volume_size,
-                                        display_name="mysql-%s" % db_info.id,
-                                        display_description=volume_desc)
-            # Record the volume ID in case something goes wrong.
-            db_info.volume_id = volume_ref.id
-            db_info.save()
-            #TODO(cp16net) this is bad to wait here for the volume create
-            # before returning but this was a quick way to get it working
-            # for now we need this to go into the task manager
-            v_ref = volume_client.volumes.get(volume_ref.id)
-            while not v_ref.status in ['available', 'error']:
-                LOG.debug(_("waiting for volume [volume.status=%s]") %
-                            v_ref.status)
-                greenthread.sleep(1)
-                v_ref = volume_client.volumes.get(volume_ref.id)
-
-            if v_ref.status in ['error']:
-                raise rd_exceptions.VolumeCreationFailure()
-            LOG.debug(_("Created volume %s") % v_ref)
-            # The mapping is in the format:
-            # <id>:[<type>]:[<size(GB)>]:[<delete_on_terminate>]
-            # setting the delete_on_terminate instance to true=1
-            mapping = "%s:%s:%s:%s" % (v_ref.id, '', v_ref.size, 1)
-            bdm = CONFIG.get('block_device_mapping', 'vdb')
-            block_device = {bdm: mapping}
-            volumes = [{'id': v_ref.id,
-                       'size': v_ref.size}]
-            LOG.debug("block_device = %s" % block_device)
-            LOG.debug("volume = %s" % volumes)
-
-            device_path = CONFIG.get('device_path', '/dev/vdb')
-            mount_point = CONFIG.get('mount_point', '/var/lib/mysql')
-            LOG.debug(_("device_path = %s") % device_path)
-            LOG.debug(_("mount_point = %s") % mount_point)
-        else:
-            LOG.debug(_("Skipping setting up the volume"))
-            block_device = None
-            device_path = None
-            mount_point = None
-            volumes = None
-            #end volume_support
-        #block_device = ""
-        #device_path = /dev/vdb
-        #mount_point = /var/lib/mysql
-        volume_info = {'block_device': block_device,
-                       'device_path': device_path,
-                       'mount_point': mount_point,
-                       'volumes': volumes}
-        return volume_info
-
     @classmethod
     def create(cls, context, name, flavor_ref, image_id,
                databases, service_type, volume_size):
-        db_info = DBInstance.create(name=name,
-            task_status=InstanceTasks.NONE)
-        LOG.debug(_("Created new Reddwarf instance %s...") % db_info.id)
-
-        if volume_size:
-            volume_info = cls._create_volume(context, db_info, volume_size)
-            block_device_mapping = volume_info['block_device']
-            device_path = volume_info['device_path']
-            mount_point = volume_info['mount_point']
-            volumes = volume_info['volumes']
-        else:
-            block_device_mapping = None
-            device_path = None
-            mount_point = None
-            volumes = []
-
         client = create_nova_client(context)
-        files = {"/etc/guest_info": "guest_id=%s\nservice_type=%s\n" %
-                 (db_info.id, service_type)}
-        server = client.servers.create(name, image_id, flavor_ref,
-                     files=files,
-                     block_device_mapping=block_device_mapping)
-        LOG.debug(_("Created new compute instance %s.") % server.id)
-
-        db_info.compute_instance_id = server.id
-        db_info.save()
+        flavor_id = utils.get_id_from_href(flavor_ref)
+        try:
+            flavor = client.flavors.get(flavor_id)
+        except nova_exceptions.NotFound:
+            raise rd_exceptions.FlavorNotFound(uuid=flavor_id)
+
+        db_info = DBInstance.create(name=name, flavor_id=flavor.id,
+            tenant_id=context.tenant, volume_size=volume_size,
+            task_status=InstanceTasks.BUILDING)
+        LOG.debug(_("Created new Reddwarf instance %s...") % db_info.id)
         service_status = InstanceServiceStatus.create(instance_id=db_info.id,
             status=ServiceStatuses.NEW)
-        # Now wait for the response from the create to do additional work
 
-        guest = create_guest_client(context, db_info.id)
+        # The volume, server, guest and DNS are set up by the task manager,
+        # so the caller gets the instance back while it is still building.
+        create_taskmanager_client(context).create_instance(db_info.id, name,
+            flavor_ref, image_id, databases, service_type, volume_size)
 
-        # populate the databases
-        model_schemas = populate_databases(databases)
-        guest.prepare(512, model_schemas, users=[],
-                      device_path=device_path,
-                      mount_point=mount_point)
-
-        dns_support = config.Config.get("reddwarf_dns_support", 'False')
-        LOG.debug(_("reddwarf dns support = %s") % dns_support)
-        dns_client = create_dns_client(context)
-        # Default the hostname to instance name if no dns support
-        dns_client.update_hostname(db_info)
-        if utils.bool_from_string(dns_support):
-
-            def get_server():
-                return client.servers.get(server.id)
-
-            def ip_is_available(server):
-                if server.addresses != {}:
-                    return True
-                elif server.addresses == {} and\
-                     server.status != InstanceStatus.ERROR:
-                    return False
-                elif server.addresses == {} and\
-                     server.status == InstanceStatus.ERROR:
-                    LOG.error(_("Instance IP not available, instance (%s): server had "
-                                " status (%s).") % (db_info['id'], server.status))
-                    raise rd_exceptions.ReddwarfError(
-                        status=server.status)
-            poll_until(get_server, ip_is_available, sleep_time=1, time_out=60*2)
-
-            dns_client.create_instance_entry(db_info['id'],
-                          get_ip_address(server.addresses))
-
-        return Instance(context, db_info, server, service_status, volumes)
+        volumes = []
+        if volume_size:
+            volumes = [{'id': None, 'size': volume_size}]
+        return Instance(context, db_info, None, service_status, volumes)
 
     def get_guest(self):
         return create_guest_client(self.context, self.db_info.id)
@@ -356,19 +389,36 @@ class Instance(object):
         """True if the service status indicates MySQL is up and running."""
         return self.service_status.status in MYSQL_RESPONSIVE_STATUSES
 
+    @property
+    def agent_is_stale(self):
+        """True if the guest agent stopped sending heartbeats.
+
+        Agents that never sent one are given the benefit of the doubt.
+        """
+        return self.heartbeat is not None and self.heartbeat.is_stale()
+
     @property
     def name(self):
-        return self.server.name
+        return self.db_info.name
 
     @property
     def status(self):
         #TODO(tim.simpson): As we enter more advanced cases dealing with
         # timeouts determine if the task_status should be integrated here
         # or removed entirely.
+        if InstanceTasks.BUILDING == self.db_info.task_status:
+            return InstanceStatus.BUILD
+        if self.db_info.task_status in InstanceTasks.BUILDING_ERRORS:
+            return InstanceStatus.ERROR
         if InstanceTasks.REBOOTING == self.db_info.task_status:
             return InstanceStatus.REBOOT
         if InstanceTasks.RESIZING == self.db_info.task_status:
             return InstanceStatus.RESIZE
+        if self.server is None:
+            # Nothing was ever created in Nova, so there is nothing left.
+            if InstanceTasks.DELETING == self.db_info.task_status:
+                return InstanceStatus.SHUTDOWN
+            return InstanceStatus.ERROR
         # If the server is in any of these states they take precedence.
         if self.server.status in ["BUILD", "ERROR", "REBOOT", "RESIZE"]:
             return self.server.status
@@ -385,6 +435,9 @@ class Instance(object):
                 LOG.error(_("While shutting down instance (%s): server had "
                           " status (%s).") % (self.id, self.server.status))
                 return InstanceStatus.ERROR
+        # The last status reported can't be trusted once the agent is gone.
+        if self.agent_is_stale:
+            return ServiceStatuses.UNKNOWN.api_status
         # For everything else we can look at the service status mapping.
         return self.service_status.status.api_status
 
@@ -398,16 +451,29 @@ class Instance(object):
 
     @property
     def flavor(self):
+        if self.server is None:
+            return {'id': self.db_info.flavor_id, 'links': []}
         return self.server.flavor
 
     @property
     def links(self):
+        if self.server is None:
+            # Shaped like the links Nova would return for the server; the
+            # views rewrite them to point at the instance.
+            compute_url = CONFIG.get('nova_compute_url',
+                                     'http://localhost:8774/v2')
+            href = "%s/%s/servers/%s" % (compute_url, self.db_info.tenant_id,
+                                         self.id)
+            return [{'href': href, 'rel': rel}
+                    for rel in ['self', 'bookmark']]
         return self.server.links
 
     @property
     def addresses(self):
         #TODO(tim.simpson): Review whether we should be returning the server
         # addresses.
+        if self.server is None:
+            return {}
         return self.server.addresses
 
     @staticmethod
@@ -428,10 +494,14 @@ class Instance(object):
             LOG.debug(_(msg) % self.status)
             raise rd_exceptions.UnprocessableEntity(_(msg) % self.status)
 
+    def _invalidate_server_cache(self):
+        invalidate_server_cache(self.context, self.db_info.compute_instance_id)
+
     def _refresh_compute_server_info(self):
         """Refreshes the compute server field."""
         server, volumes = load_server_with_volumes(self.context,
-            self.db_info.id, self.db_info.compute_instance_id)
+            self.db_info.id, self.db_info.compute_instance_id,
+            use_cache=False)
         self.server = server
         self.volumes = volumes
         return server
@@ -456,68 +526,10 @@ class Instance(object):
         # Set the task to RESIZING and begin the async call before returning.
         self.db_info.task_status = InstanceTasks.RESIZING
         self.db_info.save()
+        self._invalidate_server_cache()
         LOG.debug("Instance %s set to RESIZING." % self.id)
-        self.call_async(self.resize_flavor_async, new_flavor_id,
-                        old_flavor_size, new_flavor_size)
-
-    def resize_flavor_async(self, new_flavor_id, old_memory_size,
-                            updated_memory_size):
-        def resize_status_msg():
-            return "instance_id=%s, status=%s, flavor_id=%s, " \
-                   "dest. flavor id=%s)" % (self.id, self.server.status, \
-                    str(self.flavor['id']), str(new_flavor_id))
-        try:
-            LOG.debug("Instance %s calling stop_mysql..." % self.id)
-            guest = create_guest_client(self.context, self.db_info.id)
-            guest.stop_mysql()
-            try:
-                LOG.debug("Instance %s calling Compute resize..." % self.id)
-                self.server.resize(new_flavor_id)
-                #TODO(tim.simpson): Figure out some way to message the
-                #                   following exceptions:
-                # nova_exceptions.NotFound (for the flavor)
-                # nova_exceptions.OverLimit
-
-                self._refresh_compute_server_info()
-                # Do initial check and confirm the status is appropriate.
-                if self.server.status != "RESIZE" and \
-                    self.server.status != "VERIFY_RESIZE":
-                    raise ReddwarfError("Unexpected status after call to "
-                        "resize! : %s" % resize_status_msg())
-
-                # Wait for the flavor to change.
-                #TODO(tim.simpson): Bring back our good friend poll_until.
-                while(self.server.status == "RESIZE"):
-                    LOG.debug("Resizing... currently, %s" % resize_status_msg())
-                    time.sleep(1)
-                    self._refresh_compute_server_info()
-
-                # Do check to make sure the status and flavor id are correct.
-                if (str(self.flavor['id']) != str(new_flavor_id) or
-                    self.server.status != "VERIFY_RESIZE"):
-                    raise ReddwarfError("Assertion failed! flavor_id=%s "
-                        "and not %s"
-                        % (self.server.status, str(self.flavor['id'])))
-
-                # Confirm the resize with Nova.
-                LOG.debug("Instance %s calling Compute confirm resize..."
-                          % self.id)
-                self.server.confirm_resize()
-            except Exception as ex:
-                updated_memory_size = old_memory_size
-                LOG.error("Error during resize compute! Aborting action.")
-                LOG.error(ex)
-                raise
-            finally:
-                # Tell the guest to restart MySQL with the new RAM size.
-                # This is in the finally because we have to call this, or
-                # else MySQL could stay turned off on an otherwise usable
-                # instance.
-                LOG.debug("Instance %s starting mysql..." % self.id)
-                guest.start_mysql_with_conf_changes(updated_memory_size)
-        finally:
-            self.db_info.task_status = InstanceTasks.NONE
-            self.db_info.save()
+        create_taskmanager_client(self.context).resize_flavor(self.id,
+            new_flavor_id, old_flavor_size, new_flavor_size)
 
     def resize_volume(self, new_size):
         LOG.info("Resizing volume of instance %s..." % self.id)
@@ -531,8 +543,9 @@ class Instance(object):
         # Set the task to Resizing before sending off to the taskmanager
         self.db_info.task_status = InstanceTasks.RESIZING
         self.db_info.save()
-        task_api.API(self.context).resize_volume(new_size, self.id)
-
+        self._invalidate_server_cache()
+        create_taskmanager_client(self.context).resize_volume(new_size,
+                                                              self.id)
 
     def restart(self):
         if self.server.status in SERVER_INVALID_ACTION_STATUSES:
@@ -551,6 +564,7 @@ class Instance(object):
         #                   status is no longer in effect.
         self.db_info.task_status = InstanceTasks.REBOOTING
         self.db_info.save()
+        self._invalidate_server_cache()
         try:
             self.get_guest().restart()
         except rd_exceptions.GuestError:
@@ -584,65 +598,130 @@ class Instance(object):
 
 def create_server_list_matcher(server_list):
     # Returns a method which finds a server from the given list.
+    servers = {}
+    duplicates = set()
+    for server in server_list:
+        if server.id in servers:
+            duplicates.add(server.id)
+        servers[server.id] = server
+
     def find_server(instance_id, server_id):
-        matches = [server for server in server_list if server.id == server_id]
-        if len(matches) == 1:
-            return matches[0]
-        elif len(matches) < 1:
+        if server_id in duplicates:
+            # Should never happen, but never say never.
+            LOG.error(_("Server %s for instance %s was found twice!")
+                  % (server_id, instance_id))
+            raise rd_exceptions.ReddwarfError(uuid=instance_id)
+        try:
+            return servers[server_id]
+        except KeyError:
             # The instance was not found in the list and
             # this can happen if the instance is deleted from
             # nova but still in reddwarf database
             raise rd_exceptions.ComputeInstanceNotFound(
                 instance_id=instance_id, server_id=server_id)
-        else:
-            # Should never happen, but never say never.
-            LOG.error(_("Server %s for instance %s was found twice!")
-                  % (server_id, instance_id))
-            raise rd_exceptions.ReddwarfError(uuid=instance_id)
     return find_server
 
 
 def create_volumes_list_matcher(volume_list):
     # Returns a method which finds a volume from the given list.
+    volumes_by_server = {}
+    for volume in volume_list:
+        server_ids = set(attachment["server_id"]
+                         for attachment in volume.attachments)
+        for server_id in server_ids:
+            volumes_by_server.setdefault(server_id, []).append(
+                {'id': volume.id, 'size': volume.size})
+
     def find_volumes(server_id):
-        return [{'id': volume.id, 'size': volume.size}
-                    for volume in volume_list
-                        if server_id in [attachment["server_id"]
-                            for attachment in volume.attachments]]
+        return list(volumes_by_server.get(server_id, []))
     return find_volumes
 
 
+class SimpleInstance(object):
+    """An instance loaded from the Reddwarf database alone.
+
+    Only carries the task and service status, so it is enough to check
+    whether MySQL is running without asking Nova about the server.
+    """
+
+    def __init__(self, context, db_info, service_status):
+        self.context = context
+        self.db_info = db_info
+        self.service_status = service_status
+
+    @staticmethod
+    def load(context, id):
+        """Loads the instance status, or the full instance as a fallback.
+
+        Rows that predate tenant tracking can only be checked for ownership
+        through Nova, so those go through Instance.load.
+        """
+        if context is None:
+            raise TypeError("Argument context not defined.")
+        elif id is None:
+            raise TypeError("Argument id not defined.")
+        result = db.db_api.find_joined_by(DBInstance, InstanceServiceStatus,
+                                          'instance_id', id=id)
+        if result is None or result[0].tenant_id is None:
+            return Instance.load(context, id)
+        db_info, service_status = result
+        if not context.is_admin and db_info.tenant_id != context.tenant:
+            raise rd_exceptions.NotFound(uuid=id)
+        return SimpleInstance(context, db_info, service_status)
+
+    @property
+    def id(self):
+        return self.db_info.id
+
+    @property
+    def is_sql_running(self):
+        """True if the service status indicates MySQL is up and running."""
+        return self.service_status.status in MYSQL_RESPONSIVE_STATUSES
+
+
 class Instances(object):
 
     DEFAULT_LIMIT = int(config.Config.get('instances_page_size', '20'))
 
+    # Each of these has an index on (tenant_id, key, id).
+    SORT_KEYS = ['created', 'updated']
+
     @staticmethod
     def load(context):
         if context is None:
             raise TypeError("Argument context not defined.")
-        client = create_nova_client(context)
-        servers = client.servers.list()
-        volume_client = create_nova_volume_client(context)
-        try:
-            volumes = volume_client.volumes.list(detailed=False)
-        except nova_exceptions.NotFound:
-            volumes = []
-
-        db_infos = DBInstance.find_all()
         limit = int(context.limit or Instances.DEFAULT_LIMIT)
         if limit > Instances.DEFAULT_LIMIT:
             limit = Instances.DEFAULT_LIMIT
+        sort = {}
+        sort_key = context.sort_key
+        if sort_key is not None:
+            if sort_key not in Instances.SORT_KEYS:
+                raise rd_exceptions.BadRequest(_("Instances can only be "
+                    "sorted by %s.") % ", ".join(Instances.SORT_KEYS))
+            sort = {'sort_key': sort_key,
+                    'sort_dir': context.sort_dir or 'asc'}
+        # Rows created before tenant_id was recorded are only listed once
+        # "reddwarf-manage db_backfill_tenant_ids" has recorded it.
+        db_infos = DBInstance.find_all(tenant_id=context.tenant)
         data_view = DBInstance.find_by_pagination('instances', db_infos, "foo",
                                                   limit=limit,
-                                                  marker=context.marker)
+                                                  marker=context.marker,
+                                                  **sort)
         next_marker = data_view.next_page_marker
 
+        # Only ask Nova about what is on this page, so the cost of a listing
+        # follows the page size rather than the size of the tenant.
+        servers = load_servers_for_instances(context, data_view.collection)
+        volumes = load_volumes_for_instances(context, data_view.collection)
+
+        instance_ids = [db.id for db in data_view.collection]
+        statuses = InstanceServiceStatus.find_all_by_instance_ids(instance_ids)
+        heartbeats = AgentHeartBeat.find_all_by_instance_ids(instance_ids)
+
         ret = []
         find_server = create_server_list_matcher(servers)
         find_volumes = create_volumes_list_matcher(volumes)
-        for db in db_infos:
-            LOG.debug("checking for db [id=%s, compute_instance_id=%s]" %
-                      (db.id, db.compute_instance_id))
         for db in data_view.collection:
             try:
                 # TODO(hub-cap): Figure out if this is actually correct.
@@ -651,9 +730,18 @@ class Instances(object):
                 # have something, there is a mismatch between what the
                 # nova db has compared to what we have. We should have
                 # a way to handle this.
-                server = find_server(db.id, db.compute_instance_id)
-                volumes = find_volumes(server.id)
-                status = InstanceServiceStatus.find_by(instance_id=db.id)
+                if db.compute_instance_id is None:
+                    # The task manager has not created the server yet.
+                    if InstanceTasks.DELETING == db.task_status:
+                        continue
+                    server, volumes = None, []
+                else:
+                    server = find_server(db.id, db.compute_instance_id)
+                    volumes = find_volumes(server.id)
+                status = statuses.get(db.id)
+                if status is None:
+                    raise ModelNotFoundError(_("InstanceServiceStatus Not "
+                                               "Found"))
                 LOG.info(_("Server api_status(%s)") %
                            (status.status.api_status))
 
@@ -673,12 +761,15 @@ class Instances(object):
                 LOG.info(_("Status entry not found either failed to start "
                            "or instance was deleted"))
                 continue
-            ret.append(Instance(context, db, server, status, volumes))
+            ret.append(Instance(context, db, server, status, volumes,
+                                heartbeats.get(db.id)))
         return ret, next_marker
 
 
 class DatabaseModelBase(ModelBase):
     _auto_generated_attrs = ['id']
+    # The column bulk_create and update_where stamp with the time.
+    _timestamp_column = 'updated'
 
     @classmethod
     def create(cls, **values):
@@ -689,6 +780,50 @@ class DatabaseModelBase(ModelBase):
             raise InvalidModelError(instance.errors)
         return instance
 
+    @classmethod
+    def bulk_create(cls, list_of_values):
+        """Creates a model for each dict of values with one INSERT."""
+        now = utils.utcnow()
+        models = []
+        for values in list_of_values:
+            values = dict(values, id=utils.generate_uuid(), created=now)
+            values.setdefault(cls._timestamp_column, now)
+            model = cls(**values)
+            models.append(model)
+        if not models:
+            return []
+        return db.db_api.insert_all(models)
+
+    @classmethod
+    def update_where(cls, conditions, values):
+        """Sets values on every row matching conditions with one UPDATE.
+
+        Returns the number of rows changed. Models already loaded are not
+        refreshed.
+        """
+        errors = {}
+        values = cls._process_values(values, errors)
+        if errors:
+            raise InvalidModelError(errors)
+        values.setdefault(cls._timestamp_column, utils.utcnow())
+        return cls.find_all(**conditions).update(**values)
+
+    @classmethod
+    def update_newer(cls, key, rows):
+        """Gives each row its own values with one UPDATE.
+
+        rows maps a value of the key field to the values for that row. Each
+        must set the timestamp column to the time of the change; rows already
+        stamped with that time or a later one are left alone. Returns the
+        number of rows changed.
+        """
+        errors = {}
+        rows = dict((key_value, cls._process_values(values, errors))
+                    for key_value, values in rows.iteritems())
+        if errors:
+            raise InvalidModelError(errors)
+        return db.db_api.update_newer(cls, key, rows, cls._timestamp_column)
+
     def save(self):
         if not self.is_valid():
             raise InvalidModelError(self.errors)
@@ -728,11 +863,29 @@ class DatabaseModelBase(ModelBase):
     def find_all(cls, **kwargs):
         return db.db_query.find_all(cls, **cls._process_conditions(kwargs))
 
+    @classmethod
+    def find_all_by_ids(cls, ids, field='id', **kwargs):
+        """Loads every model whose field is one of ids in a single query.
+
+        Returns a dict keyed by the value of that field.
+        """
+        models = db.db_api.find_all_in(cls, field, list(set(ids)),
+                                       **cls._process_conditions(kwargs))
+        return dict((model[field], model) for model in models)
+
     @classmethod
     def _process_conditions(cls, raw_conditions):
         """Override in inheritors to format/modify any conditions."""
         return raw_conditions
 
+    @classmethod
+    def _process_values(cls, raw_values, errors):
+        """Override in inheritors to format/validate bulk update values.
+
+        Like _validate, adds a message to errors for each invalid field.
+        """
+        return dict(raw_values)
+
     @classmethod
     def find_by_pagination(cls, collection_type, collection_query,
                             paginated_url, **kwargs):
@@ -751,13 +904,13 @@ class DBInstance(DatabaseModelBase):
 
     _data_fields = ['name', 'created', 'compute_instance_id',
                     'task_id', 'task_description', 'task_start_time',
-                    'volume_id']
+                    'volume_id', 'tenant_id', 'flavor_id', 'volume_size']
 
     def __init__(self, task_status=None, **kwargs):
-        kwargs["task_id"] = task_status.code
-        kwargs["task_description"] = task_status.db_text
+        if task_status is not None:
+            kwargs["task_id"] = task_status.code
+            kwargs["task_description"] = task_status.db_text
         super(DBInstance, self).__init__(**kwargs)
-        self.set_task_status(task_status)
 
     def _validate(self, errors):
         if InstanceTask.from_code(self.task_id) is None:
@@ -765,6 +918,21 @@ class DBInstance(DatabaseModelBase):
         if self.task_status is None:
             errors['task_status'] = "Cannot be none."
 
+    @classmethod
+    def _process_values(cls, raw_values, errors):
+        values = dict(raw_values)
+        if 'task_status' in values:
+            task_status = values.pop('task_status')
+            if task_status is None:
+                errors['task_status'] = "Cannot be none."
+                return values
+            values['task_id'] = task_status.code
+            values['task_description'] = task_status.db_text
+        if ('task_id' in values and
+            InstanceTask.from_code(values['task_id']) is None):
+            errors['task_id'] = "Not valid."
+        return values
+
     def get_task_status(self):
         return InstanceTask.from_code(self.task_id)
 
@@ -784,19 +952,41 @@ class ServiceImage(DatabaseModelBase):
 class InstanceServiceStatus(DatabaseModelBase):
 
     _data_fields = ['instance_id', 'status_id', 'status_description']
+    _timestamp_column = 'updated_at'
 
     def __init__(self, status=None, **kwargs):
-        kwargs["status_id"] = status.code
-        kwargs["status_description"] = status.description
+        if status is not None:
+            kwargs["status_id"] = status.code
+            kwargs["status_description"] = status.description
         super(InstanceServiceStatus, self).__init__(**kwargs)
-        self.set_status(status)
 
     def _validate(self, errors):
-        if self.status is None:
+        if self.status_id is None:
             errors['status'] = "Cannot be none."
-        if ServiceStatus.from_code(self.status_id) is None:
+        else:
+            self._validate_status_id(self.status_id, errors)
+
+    @staticmethod
+    def _validate_status_id(status_id, errors):
+        try:
+            ServiceStatus.from_code(status_id)
+        except ValueError:
             errors['status_id'] = "Not valid."
 
+    @classmethod
+    def _process_values(cls, raw_values, errors):
+        values = dict(raw_values)
+        if 'status' in values:
+            status = values.pop('status')
+            if status is None:
+                errors['status'] = "Cannot be none."
+                return values
+            values['status_id'] = status.code
+            values['status_description'] = status.description
+        if 'status_id' in values:
+            cls._validate_status_id(values['status_id'], errors)
+        return values
+
     def get_status(self):
         return ServiceStatus.from_code(self.status_id)
 
@@ -806,12 +996,37 @@ class InstanceServiceStatus(DatabaseModelBase):
 
     status = property(get_status, set_status)
 
+    @classmethod
+    def find_all_by_instance_ids(cls, instance_ids):
+        return cls.find_all_by_ids(instance_ids, field='instance_id')
+
+
+class AgentHeartBeat(DatabaseModelBase):
+    """When the guest agent of an instance last checked in."""
+
+    _data_fields = ['instance_id', 'updated_at']
+    _timestamp_column = 'updated_at'
+
+    HEARTBEAT_EXPIRY = int(config.Config.get('agent_heartbeat_expiry', 180))
+
+    def is_stale(self, now=None):
+        if self.updated_at is None:
+            return True
+        now = now or utils.utcnow()
+        age = now - self.updated_at
+        return age.days * 86400 + age.seconds > self.HEARTBEAT_EXPIRY
+
+    @classmethod
+    def find_all_by_instance_ids(cls, instance_ids):
+        return cls.find_all_by_ids(instance_ids, field='instance_id')
+
 
 def persisted_models():
     return {
         'instance': DBInstance,
         'service_image': ServiceImage,
         'service_statuses': InstanceServiceStatus,
+        'agent_heartbeats': AgentHeartBeat,
         }
 
 
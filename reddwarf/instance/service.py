@@ -19,6 +19,7 @@ import logging
 import routes
 import webob.exc
 
+from reddwarf import db
 from reddwarf.common import config
 from reddwarf.common import exception
 from reddwarf.common import pagination
@@ -56,6 +57,9 @@ class BaseController(wsgi.Controller):
             ],
         webob.exc.HTTPConflict: [
             ],
+        webob.exc.HTTPGatewayTimeout: [
+            exception.GuestTimeout,
+            ],
         webob.exc.HTTPRequestEntityTooLarge: [
             exception.OverLimit,
             ],
@@ -107,7 +111,10 @@ class InstanceController(BaseController):
         LOG.info("Comitting an ACTION again instance %s for tenant '%s'"
                  % (id, tenant_id))
         context = req.environ[wsgi.CONTEXT_KEY]
-        instance = models.Instance.load(context, id)
+        # The action is checked against the instance's current task, which
+        # the read replica may not have caught up with.
+        with db.db_api.use_primary():
+            instance = models.Instance.load(context, id, use_cache=False)
         _actions = {
             'restart': self._action_restart,
             'resize': self._action_resize
@@ -220,7 +227,9 @@ class InstanceController(BaseController):
         LOG.info(_("id : '%s'\n\n") % id)
         # TODO(hub-cap): turn this into middleware
         context = req.environ[wsgi.CONTEXT_KEY]
-        instance = models.Instance.load(context=context, id=id)
+        with db.db_api.use_primary():
+            instance = models.Instance.load(context=context, id=id,
+                                            use_cache=False)
         instance.delete()
         # TODO(cp16net): need to set the return code correctly
         return wsgi.Result(None, 202)
@@ -59,6 +59,17 @@ class InstanceTasks(object):
     DELETING = InstanceTask(0x02, 'DELETING')
     REBOOTING = InstanceTask(0x03, 'REBOOTING')
     RESIZING = InstanceTask(0x04, 'RESIZING')
+    BUILDING = InstanceTask(0x05, 'BUILDING')
+
+    BUILDING_ERROR_VOLUME = InstanceTask(0x51, 'BUILDING_ERROR_VOLUME')
+    BUILDING_ERROR_SERVER = InstanceTask(0x52, 'BUILDING_ERROR_SERVER')
+    BUILDING_ERROR_DNS = InstanceTask(0x53, 'BUILDING_ERROR_DNS')
+    BUILDING_ERROR_GUEST = InstanceTask(0x54, 'BUILDING_ERROR_GUEST')
+    BUILDING_ERROR_TIMEOUT = InstanceTask(0x55, 'BUILDING_ERROR_TIMEOUT')
+
+    BUILDING_ERRORS = [BUILDING_ERROR_VOLUME, BUILDING_ERROR_SERVER,
+                       BUILDING_ERROR_DNS, BUILDING_ERROR_GUEST,
+                       BUILDING_ERROR_TIMEOUT]
 
 
 # Dissuade further additions at run-time.
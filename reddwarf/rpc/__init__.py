@@ -82,6 +82,28 @@ def cast(context, topic, msg):
     return _get_impl().cast(context, topic, msg)
 
 
+def cast_many(context, topics, msg):
+    """Invoke the same remote method on many topics with no return.
+
+    The message is packed and encoded once and published to every topic
+    over a single connection, which is much cheaper than a cast per topic
+    when the same action goes to many guests.
+
+    Delivery is at least once: a batch whose acknowledgement is lost is
+    published again, so a topic can get the message twice. Only cast
+    methods that are safe to repeat.
+
+    :param context: Information that identifies the user that has made this
+                    request.
+    :param topics: The topics to send the rpc message to.
+    :param msg: This is a dict in the form { "method" : "method_to_invoke",
+                                             "args" : dict_of_kwargs }
+
+    :returns: None
+    """
+    return _get_impl().cast_many(context, topics, msg)
+
+
 def cast_with_consumer(context, topic, msg):
     """Invoke a remote method that does not return anything.
 
@@ -161,6 +183,18 @@ def notify(context, topic, msg):
     return _get_impl().notify(context, topic, msg)
 
 
+def pool_stats():
+    """Returns gauges for the pool of connections used to send messages.
+
+    :returns: A dict with the connections in the pool ('size'), those free
+              to be checked out ('free'), the greenthreads waiting for one
+              ('waiters'), how often its connections had to reconnect to
+              the broker ('reconnects') and how many were closed for being
+              idle or old ('evicted') or failing a health check ('dead').
+    """
+    return _get_impl().pool_stats()
+
+
 def cleanup():
     """Clean up resoruces in use by implementation.
 
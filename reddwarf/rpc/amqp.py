@@ -25,18 +25,24 @@ Specifically, this includes impl_kombu and impl_qpid.  impl_carrot also uses
 AMQP, but is deprecated and predates this code.
 """
 
+import contextlib
 import inspect
 import logging
 import sys
+import time
 import traceback
 import uuid
 
+import eventlet
 from eventlet import greenpool
 from eventlet import pools
+from eventlet import queue
+from eventlet import semaphore
 
 from reddwarf.common import config
 from reddwarf.common import exception
 from reddwarf.common import local
+from reddwarf.common import utils
 import reddwarf.rpc.common as rpc_common
 from reddwarf.common import context
 
@@ -45,22 +51,163 @@ LOG = logging.getLogger(__name__)
 
 
 class Pool(pools.Pool):
-    """Class that implements a Pool of Connections."""
+    """Class that implements a Pool of Connections.
+
+    Connections are closed instead of handed out once they have been free
+    for rpc_conn_idle_timeout seconds or open for rpc_conn_max_lifetime
+    seconds. Every rpc_conn_health_check_interval seconds a greenthread
+    closes those among the free connections and probes the rest, so the
+    dead sockets a broker failover leaves behind are dropped before a
+    caller checks them out. A connection that does not answer the probe
+    within rpc_conn_health_check_timeout seconds is closed too. A setting
+    of 0 turns each of these off.
+    """
     def __init__(self, *args, **kwargs):
         self.connection_cls = kwargs.pop("connection_cls", None)
         kwargs.setdefault("max_size",
                           config.Config.get('rpc_conn_pool_size', 30))
         kwargs.setdefault("order_as_stack", True)
+        self.idle_timeout = float(
+            config.Config.get('rpc_conn_idle_timeout', 600))
+        self.max_lifetime = float(
+            config.Config.get('rpc_conn_max_lifetime', 3600))
+        self.check_interval = float(
+            config.Config.get('rpc_conn_health_check_interval', 60))
+        self.check_timeout = float(
+            config.Config.get('rpc_conn_health_check_timeout', 10))
+        self.evicted = 0
+        self.dead = 0
+        self._connections = set()
+        self._closed_reconnects = 0
+        self._checker = None
         super(Pool, self).__init__(*args, **kwargs)
+        self.reply_proxy = None
+        self._reply_proxy_lock = semaphore.Semaphore()
+
+    def get_reply_proxy(self):
+        """Returns the ReplyProxy for this pool, creating it on first use."""
+        with self._reply_proxy_lock:
+            if self.reply_proxy is None:
+                self.reply_proxy = ReplyProxy(self)
+        return self.reply_proxy
 
-    # TODO(comstud): Timeout connections not used in a while
     def create(self):
         LOG.debug(_('Pool creating new connection'))
-        return self.connection_cls()
+        connection = self.connection_cls()
+        connection.pool_created = connection.pool_last_used = time.time()
+        self._connections.add(connection)
+        if self._checker is None and self.check_interval > 0:
+            self._checker = eventlet.spawn(self._check_forever)
+        return connection
+
+    def get(self):
+        while True:
+            connection = super(Pool, self).get()
+            if not self._expired(connection, time.time()):
+                return connection
+            self.evicted += 1
+            self._discard(connection)
+
+    def put(self, connection):
+        connection.pool_last_used = time.time()
+        if self.max_lifetime > 0 and (connection.pool_last_used -
+                                      connection.pool_created >
+                                      self.max_lifetime):
+            self.evicted += 1
+            self._discard(connection)
+            return
+        super(Pool, self).put(connection)
+
+    def _expired(self, connection, now):
+        return ((self.idle_timeout > 0 and
+                 now - connection.pool_last_used > self.idle_timeout) or
+                (self.max_lifetime > 0 and
+                 now - connection.pool_created > self.max_lifetime))
+
+    def _close(self, connection):
+        self._connections.discard(connection)
+        self._closed_reconnects += getattr(connection, 'reconnects', 0)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _discard(self, connection):
+        """Closes a connection and frees its slot in the pool.
+
+        A greenthread waiting for a connection only wakes when one is put
+        back, so if any are waiting the slot goes to a new connection.
+        """
+        self._close(connection)
+        if self.waiting():
+            try:
+                self.channel.put(self.create())
+                return
+            except Exception:
+                LOG.exception(_('Pool failed to replace a connection'))
+        self.current_size -= 1
+
+    def check(self):
+        """Closes the free connections that expired or stopped working."""
+        now = time.time()
+        for connection in list(self.free_items):
+            try:
+                # Taken out while it is probed so nobody checks it out.
+                self.free_items.remove(connection)
+            except ValueError:
+                continue
+            if self._expired(connection, now):
+                self.evicted += 1
+                self._discard(connection)
+            elif not self._healthy(connection):
+                self.dead += 1
+                self._discard(connection)
+            elif self.waiting():
+                self.channel.put(connection)
+            else:
+                # Back at the bottom of the stack, as it was not used.
+                self.free_items.append(connection)
+
+    def _healthy(self, connection):
+        """Probes a connection, taking one that does not answer as dead.
+
+        A socket the broker dropped without closing it can leave the probe
+        waiting for as long as the operating system takes to notice.
+        """
+        probe = getattr(connection, 'health_check', None)
+        if probe is None:
+            return True
+        with eventlet.Timeout(self.check_timeout or None, False):
+            return probe()
+        LOG.warn(_('AMQP connection did not answer its health check within '
+                   '%.1f seconds'), self.check_timeout)
+        return False
+
+    def _check_forever(self):
+        while True:
+            eventlet.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception:
+                LOG.exception(_('Pool failed to check its connections'))
+
+    def stats(self):
+        reconnects = sum(getattr(connection, 'reconnects', 0)
+                         for connection in self._connections)
+        return {'size': self.current_size,
+                'free': len(self.free_items),
+                'waiters': self.waiting(),
+                'reconnects': self._closed_reconnects + reconnects,
+                'evicted': self.evicted,
+                'dead': self.dead}
 
     def empty(self):
+        if self._checker is not None:
+            self._checker.kill()
+            self._checker = None
         while self.free_items:
-            self.get().close()
+            self._close(self.free_items.popleft())
+            self.current_size -= 1
 
 
 class ConnectionContext(rpc_common.Connection):
@@ -132,10 +279,86 @@ class ConnectionContext(rpc_common.Connection):
             raise exception.InvalidRPCConnectionReuse()
 
 
-def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False):
+class ReplyProxy(ConnectionContext):
+    """Receives the replies to every call made through one connection pool.
+
+    Used when rpc_shared_reply_queue is on. A single direct queue is
+    declared the first time a call is made and is consumed for the life of
+    the process. Each call sends the queue's name as '_reply_q', every reply
+    carries back the '_msg_id' of the call it answers, and the reply is
+    handed to the greenthread waiting on that msg_id.
+    """
+
+    def __init__(self, connection_pool):
+        self._call_waiters = {}
+        self._reply_q = 'reply_%s' % uuid.uuid4().hex
+        super(ReplyProxy, self).__init__(connection_pool, pooled=False)
+        self.declare_direct_consumer(self._reply_q, self._process_data)
+        self.consume_in_thread()
+
+    def _process_data(self, message_data):
+        msg_id = message_data.pop('_msg_id', None)
+        waiter = self._call_waiters.get(msg_id)
+        if waiter is None:
+            LOG.warn(_('No call is waiting for a reply to msg_id %s'), msg_id)
+        else:
+            waiter.put(message_data)
+
+    def add_call_waiter(self, msg_id):
+        waiter = queue.LightQueue()
+        self._call_waiters[msg_id] = waiter
+        return waiter
+
+    def del_call_waiter(self, msg_id):
+        self._call_waiters.pop(msg_id, None)
+
+    def get_reply_q(self):
+        return self._reply_q
+
+
+class DirectReplyProxy(ConnectionContext):
+    """Receives the replies to one call on a queue named after its msg_id.
+
+    This is how every call was answered before the shared reply queue, and
+    the only way responders that do not know '_reply_q' can answer. The
+    queue is declared on a pooled connection, and the connection goes back
+    to the pool once the call is done with.
+    """
+
+    def add_call_waiter(self, msg_id):
+        waiter = queue.LightQueue()
+        self.declare_direct_consumer(msg_id, waiter.put)
+        self.consume_in_thread()
+        return waiter
+
+    def del_call_waiter(self, msg_id):
+        self.close()
+
+    def get_reply_q(self):
+        return None
+
+
+def _reply_proxy(connection_pool):
+    """Returns what the replies to a new call should be received through.
+
+    Responders that have not been upgraded ignore '_reply_q' and reply to
+    the msg_id queue, which nobody would be consuming, so the shared queue
+    is only used once rpc_shared_reply_queue says every responder knows it.
+    """
+    if utils.bool_from_string(config.Config.get('rpc_shared_reply_queue',
+                                                'False')):
+        return connection_pool.get_reply_proxy()
+    return DirectReplyProxy(connection_pool)
+
+
+def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False,
+              reply_q=None, content_type=None):
     """Sends a reply or an error on the channel signified by msg_id.
 
-    Failure should be a sys.exc_info() tuple.
+    Failure should be a sys.exc_info() tuple. If the caller gave a reply_q
+    the reply goes to that shared queue tagged with msg_id, otherwise to
+    the queue the caller declared just for msg_id. The reply is encoded
+    with the content_type the call came in, when given.
 
     """
     with ConnectionContext(connection_pool) as conn:
@@ -146,43 +369,58 @@ def msg_reply(msg_id, connection_pool, reply=None, failure=None, ending=False):
             LOG.error(tb)
             failure = (failure[0].__name__, str(failure[1]), tb)
 
-        try:
-            msg = {'result': reply, 'failure': failure}
-        except TypeError:
-            msg = {'result': dict((k, repr(v))
-                            for k, v in reply.__dict__.iteritems()),
-                    'failure': failure}
+        msg = {'result': reply, 'failure': failure}
         if ending:
             msg['ending'] = True
-        conn.direct_send(msg_id, msg)
+        if reply_q:
+            msg['_msg_id'] = msg_id
+            conn.direct_send(reply_q, msg, content_type=content_type)
+        else:
+            conn.direct_send(msg_id, msg, content_type=content_type)
 
 
 class RpcContext(context.ReddwarfContext):
     """Context that supports replying to a rpc.call"""
     def __init__(self, *args, **kwargs):
         self.msg_id = kwargs.pop('msg_id', None)
+        self.reply_q = kwargs.pop('reply_q', None)
+        self.content_type = kwargs.pop('content_type', None)
+        self.deadline = kwargs.pop('deadline', None)
         super(RpcContext, self).__init__(*args, **kwargs)
 
+    def deadline_passed(self):
+        """True once the caller has stopped waiting for the reply."""
+        return self.deadline is not None and time.time() > self.deadline
+
     def reply(self, reply=None, failure=None, ending=False,
               connection_pool=None):
         if self.msg_id:
             msg_reply(self.msg_id, connection_pool, reply, failure,
-                      ending)
+                      ending, reply_q=self.reply_q,
+                      content_type=self.content_type)
             if ending:
                 self.msg_id = None
 
 
 def unpack_context(msg):
     """Unpack context from msg."""
-    context_dict = {}
+    # NOTE(vish): Some versions of python don't like unicode keys
+    #             in kwargs.
+    context_dict = dict((str(key), value)
+                        for key, value in msg.pop('_context', {}).iteritems())
+    # Messages from senders that still flatten the context into the message.
     for key in list(msg.keys()):
-        # NOTE(vish): Some versions of python don't like unicode keys
-        #             in kwargs.
         key = str(key)
         if key.startswith('_context_'):
             value = msg.pop(key)
             context_dict[key[9:]] = value
     context_dict['msg_id'] = msg.pop('_msg_id', None)
+    context_dict['reply_q'] = msg.pop('_reply_q', None)
+    context_dict['content_type'] = msg.pop('_content_type', None)
+    # The caller sends how long it will wait rather than until when, as the
+    # clocks of guests and hosts may disagree. The wait is counted from now.
+    timeout = msg.pop('_timeout', None)
+    context_dict['deadline'] = time.time() + timeout if timeout else None
     ctx = RpcContext.from_dict(context_dict)
     LOG.debug(_('unpacked context: %s'), ctx.to_dict())
     return ctx
@@ -191,15 +429,22 @@ def unpack_context(msg):
 def pack_context(msg, context):
     """Pack context into msg.
 
-    Values for message keys need to be less than 255 chars, so we pull
-    context out into a bunch of separate keys. If we want to support
-    more arguments in rabbit messages, we may want to do the same
-    for args at some point.
-
+    With rpc_nested_context on, the context goes as one nested '_context'
+    object, which is smaller and quicker to encode. Receivers that predate
+    it only read a '_context_<key>' entry per field, so until every one of
+    them has been upgraded the context is flattened into those instead.
     """
-    context_d = dict([('_context_%s' % key, value)
-                      for (key, value) in context.to_dict().iteritems()])
-    msg.update(context_d)
+    if utils.bool_from_string(config.Config.get('rpc_nested_context',
+                                                'False')):
+        msg['_context'] = context.to_dict()
+    else:
+        msg.update(('_context_%s' % key, value)
+                   for key, value in context.to_dict().iteritems())
+
+
+@contextlib.contextmanager
+def _no_scope():
+    yield
 
 
 class ProxyCallback(object):
@@ -239,23 +484,45 @@ class ProxyCallback(object):
             return
         self.pool.spawn_n(self._process_data, ctxt, method, args)
 
+    def _dispatch_scope(self):
+        """Returns the proxy's dispatch_scope(), if it has one.
+
+        A proxy can define dispatch_scope() to return a context manager
+        that each message it handles runs in.
+        """
+        scope = getattr(self.proxy, 'dispatch_scope', None)
+        if scope is None:
+            return _no_scope()
+        return scope()
+
     @exception.wrap_exception
     def _process_data(self, ctxt, method, args):
         """Thread that magically looks for a method on the proxy
         object and calls it.
         """
 
+        if ctxt.deadline_passed():
+            # Nobody is waiting for the result, and the caller has been told
+            # the call failed, so doing the work now would only surprise it.
+            LOG.warn(_('Dropping call to %(method)s, its deadline passed '
+                       '%(late).1f seconds ago.') %
+                     {'method': method, 'late': time.time() - ctxt.deadline})
+            return
         try:
             node_func = getattr(self.proxy, str(method))
             node_args = dict((str(k), v) for k, v in args.iteritems())
-            # NOTE(vish): magic is fun!
-            rval = node_func(context=ctxt, **node_args)
-            # Check if the result was a generator
-            if inspect.isgenerator(rval):
-                for x in rval:
-                    ctxt.reply(x, None, connection_pool=self.connection_pool)
-            else:
-                ctxt.reply(rval, None, connection_pool=self.connection_pool)
+            # Results are collected inside the proxy's scope, so whatever it
+            # sets up is finished with before any reply goes out.
+            with self._dispatch_scope():
+                # NOTE(vish): magic is fun!
+                rval = node_func(context=ctxt, **node_args)
+                # Check if the result was a generator
+                if inspect.isgenerator(rval):
+                    results = list(rval)
+                else:
+                    results = [rval]
+            for x in results:
+                ctxt.reply(x, None, connection_pool=self.connection_pool)
             # This final None tells multicall that it is done.
             ctxt.reply(ending=True, connection_pool=self.connection_pool)
         except Exception as e:
@@ -266,11 +533,11 @@ class ProxyCallback(object):
 
 
 class MulticallWaiter(object):
-    def __init__(self, connection, timeout):
-        self._connection = connection
-        timeout = timeout or config.Config.get('rpc_response_timeout', 3600)
-        self._iterator = connection.iterconsume(timeout)
-        self._result = None
+    def __init__(self, reply_proxy, msg_id, deadline):
+        self._reply_proxy = reply_proxy
+        self._msg_id = msg_id
+        self._deadline = deadline
+        self._queue = reply_proxy.add_call_waiter(msg_id)
         self._done = False
         self._got_ending = False
 
@@ -278,33 +545,38 @@ class MulticallWaiter(object):
         if self._done:
             return
         self._done = True
-        self._iterator.close()
-        self._iterator = None
-        self._connection.close()
+        self._reply_proxy.del_call_waiter(self._msg_id)
 
-    def __call__(self, data):
-        """The consume() callback will call this.  Store the result."""
+    def _process_data(self, data):
+        """Returns the result or error carried by one reply."""
         if data['failure']:
-            self._result = rpc_common.RemoteError(*data['failure'])
+            return rpc_common.RemoteError(*data['failure'])
         elif data.get('ending', False):
             self._got_ending = True
         else:
-            self._result = data['result']
+            return data['result']
 
     def __iter__(self):
         """Return a result until we get a 'None' response from consumer"""
         if self._done:
             raise StopIteration
-        while True:
-            self._iterator.next()
-            if self._got_ending:
-                self.done()
-                raise StopIteration
-            result = self._result
-            if isinstance(result, Exception):
-                self.done()
-                raise result
-            yield result
+        try:
+            while True:
+                remaining = self._deadline - time.time()
+                if remaining <= 0:
+                    raise rpc_common.Timeout()
+                try:
+                    data = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    raise rpc_common.Timeout()
+                result = self._process_data(data)
+                if self._got_ending:
+                    raise StopIteration
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            self.done()
 
 
 def create_connection(new, connection_pool):
@@ -312,22 +584,47 @@ def create_connection(new, connection_pool):
     return ConnectionContext(connection_pool, pooled=not new)
 
 
+def call_timeout(method, timeout=None):
+    """Returns how many seconds a call to method may wait for its replies.
+
+    An explicit timeout wins, then the rpc_response_timeout_<method> option,
+    then rpc_response_timeout.
+    """
+    if timeout:
+        return float(timeout)
+    default = config.Config.get('rpc_response_timeout', 3600)
+    return float(config.Config.get('rpc_response_timeout_%s' % method,
+                                   default))
+
+
 def multicall(context, topic, msg, timeout, connection_pool):
-    """Make a call that returns multiple times."""
-    # Can't use 'with' for multicall, as it returns an iterator
-    # that will continue to use the connection.  When it's done,
-    # connection.close() will get called which will put it back into
-    # the pool
+    """Make a call that returns multiple times.
+
+    The call must be answered within a timeout carried in the message,
+    after which the caller gets an rpc_common.Timeout. The remote side
+    counts the timeout from when it receives the call, and drops the call
+    if it has not started on it by then.
+    """
     LOG.debug(_('Making asynchronous call on %s ...'), topic)
     msg_id = uuid.uuid4().hex
-    msg.update({'_msg_id': msg_id})
+    reply_proxy = _reply_proxy(connection_pool)
+    timeout = call_timeout(msg.get('method'), timeout)
+    deadline = time.time() + timeout
+    msg.update({'_msg_id': msg_id, '_timeout': timeout})
+    reply_q = reply_proxy.get_reply_q()
+    if reply_q:
+        msg['_reply_q'] = reply_q
     LOG.debug(_('MSG_ID is %s') % (msg_id))
     pack_context(msg, context)
 
-    conn = ConnectionContext(connection_pool)
-    wait_msg = MulticallWaiter(conn, timeout)
-    conn.declare_direct_consumer(msg_id, wait_msg)
-    conn.topic_send(topic, msg)
+    # The waiter is registered before publishing so a fast reply is kept.
+    wait_msg = MulticallWaiter(reply_proxy, msg_id, deadline)
+    try:
+        with ConnectionContext(connection_pool) as conn:
+            conn.topic_send(topic, msg)
+    except Exception:
+        wait_msg.done()
+        raise
     return wait_msg
 
 
@@ -349,6 +646,14 @@ def cast(context, topic, msg, connection_pool):
         conn.topic_send(topic, msg)
 
 
+def cast_many(context, topics, msg, connection_pool):
+    """Sends the same message to many topics over one connection."""
+    LOG.debug(_('Making asynchronous cast on %d topics...'), len(topics))
+    pack_context(msg, context)
+    with ConnectionContext(connection_pool) as conn:
+        conn.topic_send_many(topics, msg)
+
+
 def cast_with_consumer(context, topic, msg, connection_pool):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
@@ -391,5 +696,12 @@ def notify(context, topic, msg, connection_pool):
         conn.notify_send(topic, msg)
 
 
+def pool_stats(connection_pool):
+    return connection_pool.stats()
+
+
 def cleanup(connection_pool):
+    if connection_pool.reply_proxy is not None:
+        connection_pool.reply_proxy.close()
+        connection_pool.reply_proxy = None
     connection_pool.empty()
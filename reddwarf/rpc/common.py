@@ -50,12 +50,18 @@ class RemoteError(exception.ReddwarfError):
 class Timeout(exception.ReddwarfError):
     """Signifies that a timeout has occurred.
 
-    This exception is raised if the rpc_response_timeout is reached while
-    waiting for a response from the remote side.
+    This exception is raised if the call's deadline, set from its timeout or
+    the rpc_response_timeout options, passes while waiting for a response
+    from the remote side.
     """
     message = _("Timeout while waiting on RPC response.")
 
 
+class UnsupportedContentType(exception.ReddwarfError):
+    """Signifies that a message was encoded with an unknown codec."""
+    message = _("Unable to decode RPC message of type %(content_type)s.")
+
+
 class Connection(object):
     """A connection, returned by rpc.create_connection().
 
@@ -32,6 +32,7 @@ import kombu.connection
 from reddwarf.common import config
 from reddwarf.rpc import amqp as rpc_amqp
 from reddwarf.rpc import common as rpc_common
+from reddwarf.rpc import serializer
 
 LOG = logging.getLogger(__name__)
 SSL_VERSION = "SSLv2"
@@ -87,7 +88,16 @@ class ConsumerBase(object):
 
         def _callback(raw_message):
             message = self.channel.message_to_python(raw_message)
-            callback(message.payload)
+            try:
+                payload = serializer.loads(message.content_type, message.body)
+            except rpc_common.UnsupportedContentType as e:
+                # Nothing here can read it, so it must not be redelivered.
+                LOG.error(e)
+                message.ack()
+                return
+            # Remembered so that a reply goes back in the same encoding.
+            payload['_content_type'] = message.content_type
+            callback(payload)
             message.ack()
 
         self.queue.consume(*args, callback=_callback, **options)
@@ -226,9 +236,10 @@ class Publisher(object):
         self.producer = kombu.messaging.Producer(exchange=self.exchange,
                 channel=channel, routing_key=self.routing_key)
 
-    def send(self, msg):
-        """Send a message"""
-        self.producer.publish(msg)
+    def send(self, msg, content_type=None):
+        """Send a message, encoded with the codec for content_type"""
+        content_type, body = serializer.dumps(msg, content_type)
+        self.producer.publish(body, content_type=content_type)
 
 
 class DirectPublisher(Publisher):
@@ -315,6 +326,7 @@ class Connection(object):
     def __init__(self, server_params=None):
         self.consumers = []
         self.consumer_thread = None
+        self.reconnects = 0
         self.max_retries = config.Config.get('rabbit_max_retries', 0)
         # Try forever?
         if self.max_retries <= 0:
@@ -393,6 +405,7 @@ class Connection(object):
         if self.connection:
             LOG.info(_("Reconnecting to AMQP server on "
                     "%(hostname)s:%(port)d") % self.params)
+            self.reconnects += 1
             try:
                 self.connection.close()
             except self.connection_errors:
@@ -494,6 +507,21 @@ class Connection(object):
         """Convenience call for bin/clear_rabbit_queues"""
         return self.channel
 
+    def health_check(self):
+        """Returns whether the broker still answers on this connection.
+
+        Opening and closing a channel costs one round trip and leaves the
+        channel the connection is using alone.
+        """
+        try:
+            self.connection.channel().close()
+            return True
+        except Exception, e:
+            LOG.warn(_("AMQP connection to %(hostname)s:%(port)d failed its "
+                       "health check: %(err_str)s") %
+                     dict(self.params, err_str=str(e)))
+            return False
+
     def close(self):
         """Close/release this connection"""
         self.cancel_consumer_thread()
@@ -568,7 +596,7 @@ class Connection(object):
                 pass
             self.consumer_thread = None
 
-    def publisher_send(self, cls, topic, msg, **kwargs):
+    def publisher_send(self, cls, topic, msg, content_type=None, **kwargs):
         """Send to a publisher based on the publisher class"""
 
         def _error_callback(exc):
@@ -580,7 +608,7 @@ class Connection(object):
             publisher = cls(self.channel, topic, **kwargs)
             LOG.info(_("_publish info%s %s %s %s") % (self.channel, topic,
                                                    kwargs, publisher))
-            publisher.send(msg)
+            publisher.send(msg, content_type)
 
         self.ensure(_error_callback, _publish)
 
@@ -599,14 +627,56 @@ class Connection(object):
         """Create a 'fanout' consumer"""
         self.declare_consumer(FanoutConsumer, topic, callback)
 
-    def direct_send(self, msg_id, msg):
+    def direct_send(self, msg_id, msg, content_type=None):
         """Send a 'direct' message"""
-        self.publisher_send(DirectPublisher, msg_id, msg)
+        self.publisher_send(DirectPublisher, msg_id, msg,
+                            content_type=content_type)
 
     def topic_send(self, topic, msg):
         """Send a 'topic' message"""
         self.publisher_send(TopicPublisher, topic, msg)
 
+    def topic_send_many(self, topics, msg):
+        """Send the same 'topic' message to each of many topics.
+
+        The message is encoded once and published over one channel. Where
+        the transport supports transactions, each batch of
+        rpc_cast_batch_size messages is committed in a single round trip,
+        and a batch interrupted by a lost connection is published again
+        in full after reconnecting. That includes a batch whose commit
+        reached the broker but whose acknowledgement did not, so a topic
+        can get the message twice.
+        """
+        batch_size = int(config.Config.get('rpc_cast_batch_size', 100))
+        content_type, body = serializer.dumps(msg)
+
+        def _error_callback(exc):
+            log_info = {'count': len(topics), 'err_str': str(exc)}
+            LOG.exception(_("Failed to publish message to %(count)d "
+                "topics: %(err_str)s") % log_info)
+
+        def _publish(batch):
+            channel = self.connection.channel()
+            # work around 'memory' transport bug in 1.1.3
+            if self.memory_transport:
+                channel._new_queue('ae.undeliver')
+            try:
+                transactional = hasattr(channel, 'tx_select')
+                if transactional:
+                    channel.tx_select()
+                publisher = TopicPublisher(channel, None)
+                for topic in batch:
+                    publisher.producer.publish(body, routing_key=topic,
+                                               content_type=content_type)
+                if transactional:
+                    channel.tx_commit()
+            finally:
+                channel.close()
+
+        for start in range(0, len(topics), batch_size):
+            self.ensure(_error_callback, _publish,
+                        topics[start:start + batch_size])
+
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
         self.publisher_send(FanoutPublisher, topic, msg)
@@ -668,6 +738,11 @@ def cast(context, topic, msg):
     return rpc_amqp.cast(context, topic, msg, Connection.pool)
 
 
+def cast_many(context, topics, msg):
+    """Sends the same message to many topics without waiting."""
+    return rpc_amqp.cast_many(context, topics, msg, Connection.pool)
+
+
 def cast_with_consumer(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     return rpc_amqp.cast_with_consumer(context, topic, msg, Connection.pool)
@@ -695,5 +770,9 @@ def notify(context, topic, msg):
     return rpc_amqp.notify(context, topic, msg, Connection.pool)
 
 
+def pool_stats():
+    return rpc_amqp.pool_stats(Connection.pool)
+
+
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
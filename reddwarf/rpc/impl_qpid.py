@@ -451,14 +451,22 @@ class Connection(object):
         """Create a 'fanout' consumer"""
         self.declare_consumer(FanoutConsumer, topic, callback)
 
-    def direct_send(self, msg_id, msg):
-        """Send a 'direct' message"""
+    def direct_send(self, msg_id, msg, content_type=None):
+        """Send a 'direct' message
+
+        Qpid encodes messages as its own maps, so content_type is ignored.
+        """
         self.publisher_send(DirectPublisher, msg_id, msg)
 
     def topic_send(self, topic, msg):
         """Send a 'topic' message"""
         self.publisher_send(TopicPublisher, topic, msg)
 
+    def topic_send_many(self, topics, msg):
+        """Send the same 'topic' message to each of many topics"""
+        for topic in topics:
+            self.publisher_send(TopicPublisher, topic, msg)
+
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
         self.publisher_send(FanoutPublisher, topic, msg)
@@ -522,6 +530,11 @@ def cast(context, topic, msg):
     return rpc_amqp.cast(context, topic, msg, Connection.pool)
 
 
+def cast_many(context, topics, msg):
+    """Sends the same message to many topics without waiting."""
+    return rpc_amqp.cast_many(context, topics, msg, Connection.pool)
+
+
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     return rpc_amqp.fanout_cast(context, topic, msg, Connection.pool)
@@ -544,5 +557,9 @@ def notify(context, topic, msg):
     return rpc_amqp.notify(context, topic, msg, Connection.pool)
 
 
+def pool_stats():
+    return rpc_amqp.pool_stats(Connection.pool)
+
+
 def cleanup():
     return rpc_amqp.cleanup(Connection.pool)
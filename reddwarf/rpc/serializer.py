@@ -0,0 +1,121 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Codecs for the bodies of rpc messages.
+
+Publishers encode with the codec named by the rpc_serializer option and
+label the message with its content type. Consumers decode with the codec the
+label names, and replies go back in the content type of the call, so
+processes configured with different codecs can still talk to each other.
+"""
+
+import datetime
+import json
+import logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from reddwarf.common import config
+from reddwarf.common import utils
+from reddwarf.rpc import common as rpc_common
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _to_primitive(value):
+    """Encodes the values neither codec understands on its own."""
+    if isinstance(value, datetime.datetime):
+        return utils.isotime(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__dict__'):
+        return dict((k, repr(v)) for k, v in value.__dict__.iteritems())
+    return repr(value)
+
+
+class JsonSerializer(object):
+
+    name = 'json'
+    content_type = 'application/json'
+
+    def dumps(self, data):
+        return json.dumps(data, default=_to_primitive)
+
+    def loads(self, body):
+        return json.loads(body)
+
+
+class MsgPackSerializer(object):
+    """Smaller and quicker than JSON; needs the msgpack-python package."""
+
+    name = 'msgpack'
+    content_type = 'application/x-msgpack'
+
+    def dumps(self, data):
+        return msgpack.packb(data, default=_to_primitive)
+
+    def loads(self, body):
+        # Strings come back as unicode and arrays as lists, as with JSON.
+        return msgpack.unpackb(body, encoding='utf-8', use_list=True)
+
+
+SERIALIZERS = [JsonSerializer()]
+if msgpack is not None:
+    SERIALIZERS.append(MsgPackSerializer())
+
+_BY_NAME = dict((codec.name, codec) for codec in SERIALIZERS)
+_BY_CONTENT_TYPE = dict((codec.content_type, codec) for codec in SERIALIZERS)
+# Configured codecs that could not be loaded, each only warned about once.
+_MISSING = set()
+
+
+def get_serializer(content_type=None):
+    """Returns the codec for content_type, or the configured one if None."""
+    if content_type:
+        return _by_content_type(content_type)
+    name = config.Config.get('rpc_serializer', 'json')
+    if name not in _BY_NAME:
+        if name not in _MISSING:
+            _MISSING.add(name)
+            LOG.warn(_("RPC serializer %s is not available, using json."),
+                     name)
+        name = 'json'
+    return _BY_NAME[name]
+
+
+def _by_content_type(content_type):
+    try:
+        return _BY_CONTENT_TYPE[content_type]
+    except KeyError:
+        raise rpc_common.UnsupportedContentType(content_type=content_type)
+
+
+def dumps(data, content_type=None):
+    """Encodes data, returning its content type and the encoded body."""
+    codec = get_serializer(content_type)
+    return codec.content_type, codec.dumps(data)
+
+
+def loads(content_type, body):
+    """Decodes a body; messages without a content type are taken as JSON."""
+    return _by_content_type(content_type or JsonSerializer.content_type
+                            ).loads(body)
@@ -23,12 +23,23 @@ import logging
 
 from reddwarf import rpc
 from reddwarf.common import config
+from reddwarf.common import context
 from reddwarf.common import exception
 from reddwarf.common import utils
 
 
 LOG = logging.getLogger(__name__)
 
+# How guests stamp their status reports, to the microsecond.
+REPORT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def create_admin_client():
+    """For callers with no request context, such as the guest agent."""
+    admin_context = context.ReddwarfContext(is_admin=True, limit=None,
+                                            marker=None)
+    return API(admin_context)
+
 
 class API(object):
     """API for interacting with the task manager."""
@@ -60,3 +71,44 @@ class API(object):
         LOG.debug("Making async call to resize volume for instance: %s"
                  % instance_id)
         self._cast("resize_volume", new_size=new_size, instance_id=instance_id)
+
+    def resize_flavor(self, instance_id, new_flavor_id, old_memory_size,
+                      new_memory_size):
+        LOG.debug("Making async call to resize flavor for instance: %s"
+                 % instance_id)
+        self._cast("resize_flavor", instance_id=instance_id,
+                   new_flavor_id=new_flavor_id,
+                   old_memory_size=old_memory_size,
+                   new_memory_size=new_memory_size)
+
+    def delete_volume(self, volume_id):
+        LOG.debug("Making async call to delete volume %s" % volume_id)
+        self._cast("delete_volume", volume_id=volume_id)
+
+    def update_service_status(self, instance_id, status_code):
+        LOG.debug("Reporting status %s for instance %s"
+                  % (status_code, instance_id))
+        reported_at = utils.utcnow().strftime(REPORT_TIME_FORMAT)
+        self._cast("update_service_status", instance_id=instance_id,
+                   status_code=status_code, reported_at=reported_at)
+
+    def heartbeat(self, instance_id):
+        self._cast("heartbeat", instance_id=instance_id)
+
+    def cast_to_instances(self, instance_ids, guest_method, **kwargs):
+        LOG.debug("Making async call to cast %s to %d instances"
+                  % (guest_method, len(instance_ids)))
+        self._cast("cast_to_instances", instance_ids=instance_ids,
+                   guest_method=guest_method, args=kwargs)
+
+    def get_service_status(self, instance_id):
+        LOG.debug("Fetching the service status of instance %s" % instance_id)
+        return self._call("get_service_status", instance_id=instance_id)
+
+    def create_instance(self, instance_id, name, flavor_ref, image_id,
+                        databases, service_type, volume_size):
+        LOG.debug("Making async call to create instance %s " % instance_id)
+        self._cast("create_instance", instance_id=instance_id, name=name,
+                   flavor_ref=flavor_ref, image_id=image_id,
+                   databases=databases, service_type=service_type,
+                   volume_size=volume_size)
@@ -0,0 +1,169 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Collects the reports guest agents send and writes them in batches.
+"""
+
+import logging
+
+from reddwarf import db
+from reddwarf.common import utils
+from reddwarf.instance.models import AgentHeartBeat
+from reddwarf.instance.models import InstanceServiceStatus
+from reddwarf.instance.models import ServiceStatus
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Collector(object):
+    """Keeps the newest report of each instance and saves them periodically.
+
+    The database load depends on the flush interval and batch size, not on
+    how many guests report. Subclasses write a batch in _save.
+
+    Reports waiting for a flush are lost if the task manager dies. Guests
+    send their status and a heartbeat on every periodic task, so the rows
+    catch up with the next round of reports.
+    """
+
+    def __init__(self, interval=5, batch_size=500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._timer = None
+        self.reports = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def start(self):
+        if self._timer is None and self.interval:
+            self._timer = utils.LoopingCall(self.flush)
+            self._timer.start(interval=self.interval, now=False)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+
+    def _add(self, instance_id, value):
+        self._pending[instance_id] = value
+        self.reports += 1
+
+    def _save(self, reports):
+        """Writes a dict of instance id to report and returns the row count.
+
+        Never called with more than batch_size reports.
+        """
+        raise NotImplementedError()
+
+    def _batches(self, instance_ids):
+        for start in range(0, len(instance_ids), self.batch_size):
+            yield instance_ids[start:start + self.batch_size]
+
+    def _group(self, pending):
+        """Splits the pending reports into the dicts passed to _save."""
+        instance_ids = pending.keys()
+        for batch in self._batches(instance_ids):
+            yield dict((instance_id, pending[instance_id])
+                       for instance_id in batch)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        for reports in self._group(pending):
+            try:
+                self.rows_written += self._save(reports)
+            except Exception:
+                LOG.exception(_("Could not save %d %s reports; will retry.")
+                              % (len(reports), self.__class__.__name__))
+                # Newer reports that came in meanwhile take precedence.
+                for instance_id, value in reports.iteritems():
+                    self._pending.setdefault(instance_id, value)
+        self.flushes += 1
+
+    def stats(self):
+        return {'pending': len(self._pending),
+                'reports': self.reports,
+                'flushes': self.flushes,
+                'rows_written': self.rows_written}
+
+
+class StatusCollector(Collector):
+    """Saves guest status reports with one UPDATE per batch.
+
+    Each status is stamped with the time the guest reported it. A row is
+    only updated while it holds an older status, so when several task
+    managers collect reports, one flushing late cannot undo a newer status
+    another has already saved.
+    """
+
+    def add(self, instance_id, status_code, reported_at=None):
+        """Queues a status; reported_at defaults to the time it arrived."""
+        ServiceStatus.from_code(status_code)
+        reported_at = reported_at or utils.utcnow()
+        pending = self._pending.get(instance_id)
+        if pending is not None and pending[1] > reported_at:
+            return
+        self._add(instance_id, (status_code, reported_at))
+
+    def get(self, instance_id):
+        """Returns the newest status code, flushed or not."""
+        if instance_id in self._pending:
+            return self._pending[instance_id][0]
+        return InstanceServiceStatus.find_by(instance_id=instance_id).status_id
+
+    def _save(self, reports):
+        return InstanceServiceStatus.update_newer('instance_id', dict(
+            (instance_id, {'status': ServiceStatus.from_code(status_code),
+                           'updated_at': reported_at})
+            for instance_id, (status_code, reported_at)
+            in reports.iteritems()))
+
+
+class HeartbeatCollector(Collector):
+    """Inserts or updates agent_heartbeats rows for the guests that checked in.
+
+    Each row gets the time its own heartbeat arrived and never moves back in
+    time. A batch costs one SELECT, one UPDATE and, for guests seen for the
+    first time, one INSERT. instance_id is unique, so when another task
+    manager inserts the same new row first, the INSERT fails and the batch
+    is retried on the next flush as an UPDATE.
+    """
+
+    def add(self, instance_id):
+        self._add(instance_id, utils.utcnow())
+
+    def _save(self, reports):
+        with db.db_api.use_primary():
+            existing = AgentHeartBeat.find_all_by_ids(reports.keys(),
+                                                      field='instance_id')
+        written = 0
+        if existing:
+            written += AgentHeartBeat.update_newer('instance_id', dict(
+                (instance_id, {'updated_at': reports[instance_id]})
+                for instance_id in existing))
+        new_ids = [instance_id for instance_id in reports
+                   if instance_id not in existing]
+        if new_ids:
+            written += len(AgentHeartBeat.bulk_create(
+                [{'instance_id': instance_id,
+                  'updated_at': reports[instance_id]}
+                 for instance_id in new_ids]))
+        return written
@@ -15,13 +15,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import datetime
 import logging
 import weakref
 
 from eventlet import greenthread
 
+from reddwarf import db
+from reddwarf.common import config
 from reddwarf.common import excutils
+from reddwarf.common import remote
 from reddwarf.common import service
+from reddwarf.common import utils
+from reddwarf.taskmanager import api
+from reddwarf.taskmanager import collector
 from reddwarf.taskmanager import models
 
 
@@ -33,11 +41,43 @@ class TaskManager(service.Manager):
 
     def __init__(self, *args, **kwargs):
         self.tasks = weakref.WeakKeyDictionary()
+        self.status_collector = collector.StatusCollector(
+            interval=int(config.Config.get('status_flush_interval', 5)),
+            batch_size=int(config.Config.get('status_flush_batch_size',
+                                             500)))
+        self.status_collector.start()
+        self.heartbeat_collector = collector.HeartbeatCollector(
+            interval=int(config.Config.get('heartbeat_flush_interval', 10)),
+            batch_size=int(config.Config.get('status_flush_batch_size',
+                                             500)))
+        self.heartbeat_collector.start()
         super(TaskManager, self).__init__(*args, **kwargs)
         LOG.info(_("TaskManager init %s %s") % (args, kwargs))
 
     def periodic_tasks(self, raise_on_error=False):
         LOG.debug("No. of running tasks: %r" % len(self.tasks))
+        try:
+            models.fail_stale_builds(
+                int(config.Config.get('build_time_out', 1800)))
+            models.clear_stale_resizes(
+                int(config.Config.get('resize_stale_time_out', 7200)))
+        except Exception:
+            LOG.exception(_("Error cleaning up stale tasks."))
+            if raise_on_error:
+                raise
+
+    @contextlib.contextmanager
+    def dispatch_scope(self):
+        """Handles each message with its reads sent to the primary database.
+
+        Casts act on rows the API wrote just before sending them, which the
+        read replica may not have yet. Builds and resizes poll the compute
+        service for minutes, so they suspend the scope and each of their
+        queries reads the rows as they are at the time.
+        """
+        with super(TaskManager, self).dispatch_scope():
+            with db.db_api.use_primary():
+                yield
 
     def _wrapper(self, method, context, *args, **kwargs):
         """Maps the respective manager method with a task counter."""
@@ -53,5 +93,43 @@ class TaskManager(service.Manager):
             del self.tasks[greenthread.getcurrent()]
 
     def resize_volume(self, context, instance_id, new_size):
-        instance_tasks = models.InstanceTasks.load(context, instance_id)
-        instance_tasks.resize_volume(new_size)
+        with db.db_api.suspend_scope():
+            instance_tasks = models.InstanceTasks.load(context, instance_id)
+            instance_tasks.resize_volume(new_size)
+
+    def resize_flavor(self, context, instance_id, new_flavor_id,
+                      old_memory_size, new_memory_size):
+        with db.db_api.suspend_scope():
+            instance_tasks = models.InstanceTasks.load(context, instance_id)
+            instance_tasks.resize_flavor(new_flavor_id, old_memory_size,
+                                         new_memory_size)
+
+    def delete_volume(self, context, volume_id):
+        models.delete_volume(context, volume_id)
+
+    def update_service_status(self, context, instance_id, status_code,
+                              reported_at=None):
+        # Guests that predate reported_at are taken to report on arrival.
+        if reported_at is not None:
+            reported_at = datetime.datetime.strptime(reported_at,
+                                                     api.REPORT_TIME_FORMAT)
+        self.status_collector.add(instance_id, status_code, reported_at)
+
+    def heartbeat(self, context, instance_id):
+        self.heartbeat_collector.add(instance_id)
+
+    def cast_to_instances(self, context, instance_ids, guest_method, args):
+        guests = remote.create_guest_set_client(context, instance_ids)
+        guests.cast(guest_method, **utils.stringify_keys(args))
+
+    def get_service_status(self, context, instance_id):
+        return self.status_collector.get(instance_id)
+
+    def create_instance(self, context, instance_id, name, flavor_ref,
+                        image_id, databases, service_type, volume_size):
+        with db.db_api.suspend_scope():
+            instance_tasks = models.FreshInstanceTasks.load(context,
+                                                            instance_id)
+            instance_tasks.create_instance(name, flavor_ref, image_id,
+                                           databases, service_type,
+                                           volume_size)
@@ -12,17 +12,23 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 import logging
+import time
 
 from eventlet import greenthread
+from novaclient import exceptions as nova_exceptions
 
 from reddwarf.common import config
 from reddwarf.common import exception
+from reddwarf.common import excutils
 from reddwarf.common import remote
 from reddwarf.common import utils
 from reddwarf.instance import models as inst_models
+from reddwarf.instance.views import get_ip_address
 
 
+CONFIG = config.Config
 LOG = logging.getLogger(__name__)
 
 
@@ -65,7 +71,8 @@ class InstanceTasks:
             raise exception.NotFound(uuid=id)
         server, volumes = inst_models.load_server_with_volumes(context,
                                                 db_info.id,
-                                                db_info.compute_instance_id)
+                                                db_info.compute_instance_id,
+                                                use_cache=False)
         nova_client = remote.create_nova_client(context)
         volume_client = remote.create_nova_volume_client(context)
         guest = remote.create_guest_client(context, id)
@@ -73,6 +80,74 @@ class InstanceTasks:
                              nova_client=nova_client,
                              volume_client=volume_client, guest=guest)
 
+    def _refresh_server(self):
+        """Reloads only the compute server; volumes are left alone."""
+        self.server = self.nova_client.servers.get(self.server.id)
+        return self.server
+
+    def resize_flavor(self, new_flavor_id, old_memory_size,
+                      updated_memory_size):
+        def resize_status_msg():
+            return "instance_id=%s, status=%s, flavor_id=%s, " \
+                   "dest. flavor id=%s)" % (self.db_info.id,
+                    self.server.status, str(self.server.flavor['id']),
+                    str(new_flavor_id))
+        try:
+            LOG.debug("Instance %s calling stop_mysql..." % self.db_info.id)
+            self.guest.stop_mysql()
+            try:
+                LOG.debug("Instance %s calling Compute resize..."
+                          % self.db_info.id)
+                self.server.resize(new_flavor_id)
+                #TODO(tim.simpson): Figure out some way to message the
+                #                   following exceptions:
+                # nova_exceptions.NotFound (for the flavor)
+                # nova_exceptions.OverLimit
+
+                # Do initial check and confirm the status is appropriate.
+                self._refresh_server()
+                if self.server.status not in ["RESIZE", "VERIFY_RESIZE"]:
+                    raise exception.ReddwarfError("Unexpected status after "
+                        "call to resize! : %s" % resize_status_msg())
+
+                # Wait for the flavor to change.
+                def resize_finished(server):
+                    LOG.debug("Resizing... currently, %s"
+                              % resize_status_msg())
+                    return server.status != "RESIZE"
+                utils.poll_with_backoff(self._refresh_server,
+                    resize_finished, sleep_time=1,
+                    max_sleep_time=int(CONFIG.get('resize_poll_max_sleep',
+                                                  30)),
+                    time_out=int(CONFIG.get('resize_time_out', 60 * 60)))
+
+                # Do check to make sure the status and flavor id are correct.
+                if (str(self.server.flavor['id']) != str(new_flavor_id) or
+                    self.server.status != "VERIFY_RESIZE"):
+                    raise exception.ReddwarfError("Assertion failed! "
+                        "flavor_id=%s and not %s"
+                        % (self.server.status, str(self.server.flavor['id'])))
+
+                # Confirm the resize with Nova.
+                LOG.debug("Instance %s calling Compute confirm resize..."
+                          % self.db_info.id)
+                self.server.confirm_resize()
+            except Exception as ex:
+                updated_memory_size = old_memory_size
+                LOG.error("Error during resize compute! Aborting action.")
+                LOG.error(ex)
+                raise
+            finally:
+                # Tell the guest to restart MySQL with the new RAM size.
+                # This is in the finally because we have to call this, or
+                # else MySQL could stay turned off on an otherwise usable
+                # instance.
+                LOG.debug("Instance %s starting mysql..." % self.db_info.id)
+                self.guest.start_mysql_with_conf_changes(updated_memory_size)
+        finally:
+            self.db_info.task_status = inst_models.InstanceTasks.NONE
+            self.db_info.save()
+
     def resize_volume(self, new_size):
         LOG.debug("%s: Resizing volume for instance: %s to %r GB"
                   % (greenthread.getcurrent(), self.server.id, new_size))
@@ -96,3 +171,321 @@ class InstanceTasks:
         finally:
             self.db_info.task_status = inst_models.InstanceTasks.NONE
             self.db_info.save()
+
+
+class FreshInstanceTasks(object):
+    """
+    Builds a newly requested instance: its volume, server, guest and DNS.
+    """
+
+    def __init__(self, context, db_info):
+        self.context = context
+        self.db_info = db_info
+
+    @staticmethod
+    def load(context, id):
+        if context is None:
+            raise TypeError("Argument context not defined.")
+        elif id is None:
+            raise TypeError("Argument id not defined.")
+        try:
+            db_info = inst_models.DBInstance.find_by(id=id)
+        except exception.NotFound:
+            raise exception.NotFound(uuid=id)
+        return FreshInstanceTasks(context, db_info)
+
+    @property
+    def id(self):
+        return self.db_info.id
+
+    def create_instance(self, name, flavor_ref, image_id, databases,
+                        service_type, volume_size):
+        """Builds the instance, leaving it in an error state on failure.
+
+        Each phase records its own error status. Anything else that goes
+        wrong is recorded as a server error, so the instance never stays in
+        BUILDING once the build has stopped.
+        """
+        try:
+            self._create_instance(name, flavor_ref, image_id, databases,
+                                  service_type, volume_size)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if self.db_info.task_status == \
+                   inst_models.InstanceTasks.BUILDING:
+                    self._server_failed()
+
+    def _create_instance(self, name, flavor_ref, image_id, databases,
+                         service_type, volume_size):
+        LOG.debug("%s: Creating instance %s"
+                  % (greenthread.getcurrent(), self.id))
+        timings = PhaseTimer()
+        # The volume is allocated while Nova schedules and boots the server,
+        # then attached once both are ready.
+        volume_ref = self._request_volume(volume_size)
+        volume_waiter = None
+        if volume_ref is not None:
+            volume_waiter = greenthread.spawn(self._wait_for_volume,
+                                              volume_ref, timings)
+        try:
+            server = self._create_server(name, flavor_ref, image_id,
+                                         service_type)
+            timings.mark('server_requested')
+            volume_info = {'device_path': None, 'mount_point': None}
+            if volume_ref is not None:
+                server = self._wait_for_server(server)
+                timings.mark('server_active')
+                try:
+                    volume = volume_waiter.wait()
+                except Exception:
+                    # Recorded here rather than in the waiter, which must
+                    # not touch db_info from its own greenthread.
+                    self._volume_failed()
+                    raise
+                finally:
+                    volume_waiter = None
+                volume_info = self._attach_volume(server, volume)
+                timings.mark('volume_attached')
+        finally:
+            if volume_waiter is not None:
+                volume_waiter.kill()
+        self._prepare_guest(databases, volume_info)
+        timings.mark('guest_prepare_sent')
+        self._create_dns_entry(server)
+        timings.mark('dns_created')
+        self._set_task_status(inst_models.InstanceTasks.NONE)
+        LOG.info(_("Provisioned instance %s: %s") % (self.id, timings))
+
+    def _set_task_status(self, task_status):
+        self.db_info.task_status = task_status
+        self.db_info.save()
+
+    def _volume_failed(self):
+        LOG.exception(_("Error creating volume for instance %s.") % self.id)
+        self._set_task_status(inst_models.InstanceTasks.BUILDING_ERROR_VOLUME)
+
+    def _server_failed(self):
+        LOG.exception(_("Error creating server for instance %s.") % self.id)
+        self._set_task_status(inst_models.InstanceTasks.BUILDING_ERROR_SERVER)
+
+    def _request_volume(self, volume_size):
+        """Asks for the volume to be created, without waiting on it."""
+        volume_support = CONFIG.get("reddwarf_volume_support", 'False')
+        LOG.debug(_("reddwarf volume support = %s") % volume_support)
+        if not volume_size or not utils.bool_from_string(volume_support):
+            LOG.debug(_("Skipping setting up the volume"))
+            return None
+        try:
+            LOG.debug(_("Starting to create the volume for the instance"))
+            volume_client = remote.create_nova_volume_client(self.context)
+            volume_desc = ("mysql volume for %s" % self.id)
+            volume_ref = volume_client.volumes.create(
+                                        volume_size,
+                                        display_name="mysql-%s" % self.id,
+                                        display_description=volume_desc)
+            # Record the volume ID in case something goes wrong.
+            self.db_info.volume_id = volume_ref.id
+            self.db_info.save()
+        except Exception:
+            self._volume_failed()
+            raise
+        return volume_ref
+
+    def _wait_for_volume(self, volume_ref, timings):
+        """Runs in its own greenthread; failures surface through wait()."""
+        volume_client = remote.create_nova_volume_client(self.context)
+        v_ref = utils.poll_until(
+                    lambda: volume_client.volumes.get(volume_ref.id),
+                    lambda v_ref: v_ref.status in ['available', 'error'],
+                    sleep_time=2,
+                    time_out=int(CONFIG.get('volume_time_out', 30)))
+        if v_ref.status in ['error']:
+            raise exception.VolumeCreationFailure()
+        timings.mark('volume_available')
+        LOG.debug(_("Created volume %s") % v_ref)
+        return v_ref
+
+    def _create_server(self, name, flavor_ref, image_id, service_type):
+        try:
+            nova_client = remote.create_nova_client(self.context)
+            files = {"/etc/guest_info": "guest_id=%s\nservice_type=%s\n" %
+                     (self.id, service_type)}
+            server = nova_client.servers.create(name, image_id, flavor_ref,
+                         files=files, block_device_mapping=None)
+            LOG.debug(_("Created new compute instance %s.") % server.id)
+            self.db_info.compute_instance_id = server.id
+            self.db_info.save()
+        except Exception:
+            self._server_failed()
+            raise
+        return server
+
+    def _wait_for_server(self, server):
+        """Waits for the server to boot so a volume can be attached."""
+        nova_client = remote.create_nova_client(self.context)
+        try:
+            server = utils.poll_with_backoff(
+                        lambda: nova_client.servers.get(server.id),
+                        lambda server: server.status in ['ACTIVE', 'ERROR'],
+                        sleep_time=1, max_sleep_time=5,
+                        time_out=int(CONFIG.get('server_create_time_out',
+                                                600)))
+            if server.status == 'ERROR':
+                raise exception.ReddwarfError(status=server.status)
+        except Exception:
+            self._server_failed()
+            raise
+        return server
+
+    def _attach_volume(self, server, volume):
+        device_path = CONFIG.get('device_path', '/dev/vdb')
+        mount_point = CONFIG.get('mount_point', '/var/lib/mysql')
+        LOG.debug(_("device_path = %s") % device_path)
+        LOG.debug(_("mount_point = %s") % mount_point)
+        try:
+            nova_client = remote.create_nova_client(self.context)
+            volume_client = remote.create_nova_volume_client(self.context)
+            nova_client.volumes.create_server_volume(server.id, volume.id,
+                                                     device_path)
+            utils.poll_until(lambda: volume_client.volumes.get(volume.id),
+                             lambda volume: volume.status == 'in-use',
+                             sleep_time=2,
+                             time_out=int(CONFIG.get('volume_time_out', 30)))
+        except Exception:
+            self._volume_failed()
+            raise
+        return {'device_path': device_path,
+                'mount_point': mount_point}
+
+    def _prepare_guest(self, databases, volume_info):
+        try:
+            guest = remote.create_guest_client(self.context, self.id)
+            # populate the databases
+            model_schemas = inst_models.populate_databases(databases)
+            guest.prepare(512, model_schemas, users=[],
+                          device_path=volume_info['device_path'],
+                          mount_point=volume_info['mount_point'])
+        except Exception:
+            LOG.exception(_("Error preparing the guest for instance %s.")
+                          % self.id)
+            self._set_task_status(
+                inst_models.InstanceTasks.BUILDING_ERROR_GUEST)
+            raise
+
+    def _create_dns_entry(self, server):
+        dns_support = CONFIG.get("reddwarf_dns_support", 'False')
+        LOG.debug(_("reddwarf dns support = %s") % dns_support)
+        try:
+            dns_client = remote.create_dns_client(self.context)
+            # Default the hostname to instance name if no dns support
+            dns_client.update_hostname(self.db_info)
+            if not utils.bool_from_string(dns_support):
+                return
+            nova_client = remote.create_nova_client(self.context)
+
+            def get_server():
+                return nova_client.servers.get(server.id)
+
+            def ip_is_available(server):
+                if server.addresses != {}:
+                    return True
+                elif server.status != inst_models.InstanceStatus.ERROR:
+                    return False
+                LOG.error(_("Instance IP not available, instance (%s): "
+                            "server had status (%s).")
+                          % (self.id, server.status))
+                raise exception.ReddwarfError(status=server.status)
+            server = utils.poll_until(get_server, ip_is_available,
+                                      sleep_time=1, time_out=60 * 2)
+            dns_client.create_instance_entry(self.id,
+                                             get_ip_address(server.addresses))
+        except Exception:
+            LOG.exception(_("Error creating DNS entry for instance %s.")
+                          % self.id)
+            self._set_task_status(inst_models.InstanceTasks.BUILDING_ERROR_DNS)
+            raise
+
+
+def delete_volume(context, volume_id):
+    """Deletes an instance's volume once its server has let go of it.
+
+    Volumes are attached after the server boots, so Nova does not delete
+    them with the server. Deleting the server detaches the volume in the
+    background; the volume can only be deleted once that is done.
+    """
+    volume_client = remote.create_nova_volume_client(context)
+    try:
+        utils.poll_until(lambda: volume_client.volumes.get(volume_id),
+                         lambda volume: volume.status in ['available',
+                                                          'error'],
+                         sleep_time=2,
+                         time_out=int(CONFIG.get('volume_delete_time_out',
+                                                 300)))
+        volume_client.volumes.delete(volume_id)
+    except nova_exceptions.NotFound:
+        # Already gone, as with volumes Nova deleted along with the server.
+        LOG.debug(_("Volume %s was already deleted.") % volume_id)
+        return
+    LOG.info(_("Deleted volume %s.") % volume_id)
+
+
+def _stale_instance_ids(task_status, time_out):
+    """Ids of instances whose task has not changed in time_out seconds."""
+    oldest_allowed = utils.utcnow() - datetime.timedelta(seconds=time_out)
+    return [db_info.id for db_info in
+            inst_models.DBInstance.find_all(task_id=task_status.code)
+            if db_info.updated < oldest_allowed]
+
+
+def fail_stale_builds(time_out):
+    """Marks instances left in BUILDING for over time_out seconds as failed.
+
+    A build stops without recording an error when its create_instance cast
+    is lost or the task manager building it dies. Rows still in BUILDING
+    long after any build would have finished or timed out are moved to
+    BUILDING_ERROR_TIMEOUT so they can be deleted. Returns their ids.
+    """
+    building = inst_models.InstanceTasks.BUILDING
+    stale_ids = _stale_instance_ids(building, time_out)
+    if stale_ids:
+        LOG.error(_("Instances stuck building for over %ss: %s")
+                  % (time_out, ", ".join(stale_ids)))
+        # Only rows still building, in case one finished in the meantime.
+        inst_models.DBInstance.update_where(
+            {'id': stale_ids, 'task_id': building.code},
+            {'task_status': inst_models.InstanceTasks.BUILDING_ERROR_TIMEOUT})
+    return stale_ids
+
+
+def clear_stale_resizes(time_out):
+    """Ends the task of instances left in RESIZING for over time_out seconds.
+
+    A resize whose cast was lost, or whose task manager died part way, never
+    clears the task. Once the resize would have timed out anyway the task is
+    set back to NONE, so the status again comes from the server and the
+    guest (SHUTDOWN if MySQL was left stopped) and the instance can be
+    restarted or resized again. Returns their ids.
+    """
+    resizing = inst_models.InstanceTasks.RESIZING
+    stale_ids = _stale_instance_ids(resizing, time_out)
+    if stale_ids:
+        LOG.error(_("Instances stuck resizing for over %ss: %s")
+                  % (time_out, ", ".join(stale_ids)))
+        inst_models.DBInstance.update_where(
+            {'id': stale_ids, 'task_id': resizing.code},
+            {'task_status': inst_models.InstanceTasks.NONE})
+    return stale_ids
+
+
+class PhaseTimer(object):
+    """Records how long into a task each of its phases finished."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.phases = []
+
+    def mark(self, phase):
+        self.phases.append((phase, time.time() - self.start_time))
+
+    def __str__(self):
+        return ", ".join("%s at %.2fs" % phase for phase in self.phases)
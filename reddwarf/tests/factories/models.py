@@ -24,13 +24,13 @@ from reddwarf.instance import models
 
 class DBInstance(factory.Factory):
     FACTORY_FOR = models.DBInstance
-    context = context.ReddwarfContext()
+    context = context.ReddwarfContext(limit=None, marker=None)
     uuid = utils.generate_uuid()
 
 
 class Instance(factory.Factory):
     FACTORY_FOR = models.Instance
-    context = context.ReddwarfContext()
+    context = context.ReddwarfContext(limit=None, marker=None)
     uuid = utils.generate_uuid()
 
 
@@ -119,6 +119,23 @@ class FakeGuest(object):
         status.status = ServiceStatuses.SHUTDOWN
         status.save()
 
+    def update_status(self):
+        # The other fake methods set the status themselves.
+        pass
+
+    def upgrade(self):
+        pass
+
+
+class FakeGuestSet(object):
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def cast(self, method_name, **kwargs):
+        for id in self.ids:
+            getattr(get_or_create(id), method_name)(**kwargs)
+
 
 def get_or_create(id):
     if id not in DB:
@@ -128,3 +145,7 @@ def get_or_create(id):
 
 def fake_create_guest_client(context, id):
     return get_or_create(id)
+
+
+def fake_create_guest_set_client(context, ids):
+    return FakeGuestSet(ids)
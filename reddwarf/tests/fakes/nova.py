@@ -231,6 +231,8 @@ class FakeServers(object):
     def schedule_delete(self, id, time_from_now):
         def delete_server():
             LOG.info("Simulated event ended, deleting server %s." % id)
+            for volume in self.db[id].volumes:
+                volume.detach(id)
             del self.db[id]
         self.events.add_event(time_from_now, delete_server)
 
@@ -259,6 +261,7 @@ class FakeVolume(object):
     def __init__(self, parent, owner, id, size, display_name,
                  display_description):
         self.attachments = []
+        self.mapping = None
         self.parent = parent
         self.owner = owner  # This is a context.
         self.id = id
@@ -287,7 +290,15 @@ class FakeVolume(object):
         for attachment in self.attachments:
             if attachment['server_id'] == server_id:
                 return  # Do nothing
-        self.attachments.append({'server_id':server_id})
+        device = self.mapping.device if self.mapping is not None else None
+        self.attachments.append({'server_id': server_id, 'device': device})
+
+    def detach(self, server_id):
+        """Fake method we've added to detach from a deleted server."""
+        self.attachments = [attachment for attachment in self.attachments
+                            if attachment['server_id'] != server_id]
+        if not self.attachments:
+            self._current_status = "available"
 
     @property
     def status(self):
@@ -342,6 +353,13 @@ class FakeVolumes(object):
         LOG.info("FAKE_VOLUMES_DB : %s" % FAKE_VOLUMES_DB)
         return volume
 
+    def delete(self, id):
+        volume = self.get(id)
+        if volume.status not in ["available", "error"]:
+            raise nova_exceptions.ClientException(400, "Volume %s is %s."
+                                                  % (id, volume.status))
+        del self.db[id]
+
     def list(self, detailed=True):
         return [self.db[key] for key in self.db]
 
@@ -361,6 +379,18 @@ class FakeClient(object):
     def get_server_volumes(self, server_id):
         return self.servers.get_server_volumes(server_id)
 
+    def create_server_volume(self, server_id, volume_id, device):
+        server = FAKE_SERVERS_DB[server_id]
+        volume = FAKE_VOLUMES_DB[volume_id]
+        if volume.status != "available":
+            raise nova_exceptions.ClientException(400, "Volume %s is %s."
+                                                  % (volume_id, volume.status))
+        volume.mapping = FakeBlockDeviceMappingInfo(volume_id, device, '',
+                                                    volume.size, 1)
+        server.volumes.append(volume)
+        volume.set_attachment(server_id)
+        volume.schedule_status("in-use", 1)
+
 
 CLIENT_DATA = {}
 
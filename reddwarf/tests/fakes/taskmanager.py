@@ -0,0 +1,57 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2010-2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http: //www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import logging
+
+from reddwarf.taskmanager import api
+
+
+LOG = logging.getLogger(__name__)
+
+
+MANAGER = None
+
+
+class FakeApi(api.API):
+    """Runs task manager methods in this process instead of over RPC."""
+
+    def _get_manager_method(self, method_name):
+        global MANAGER
+        if MANAGER is None:
+            # Imported late since the task manager loads the remote module,
+            # which is what imports this one.
+            from reddwarf.taskmanager.manager import TaskManager
+            MANAGER = TaskManager()
+        return getattr(MANAGER, method_name)
+
+    def _call(self, method_name, **kwargs):
+        return self._get_manager_method(method_name)(self.context, **kwargs)
+
+    def _cast(self, method_name, **kwargs):
+        def run():
+            try:
+                method = self._get_manager_method(method_name)
+                method(self.context, **kwargs)
+            except Exception:
+                LOG.exception("Error running fake task manager method %s."
+                              % method_name)
+        eventlet.spawn_after(0.1, run)
+
+
+def fake_create_taskmanager_client(context):
+    return FakeApi(context)
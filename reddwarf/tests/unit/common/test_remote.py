@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+import unittest
+
+from reddwarf.common import remote
+from reddwarf.common.remote import ClientPool
+
+
+class ClientPoolTest(unittest.TestCase):
+
+    def test_reuses_client_checked_in_for_same_key(self):
+        pool = ClientPool(max_size=10, idle_timeout=60)
+        first = pool.checkout('a', object)
+        pool.checkin('a', first)
+        self.assertTrue(first is pool.checkout('a', object))
+        self.assertFalse(first is pool.checkout('b', object))
+        self.assertEqual({'size': 0, 'checked_out': 2, 'hits': 1,
+                          'misses': 2, 'evictions': 0}, pool.stats())
+
+    def test_concurrent_checkouts_get_separate_clients(self):
+        pool = ClientPool(max_size=10, idle_timeout=60)
+        first = pool.checkout('a', object)
+        second = pool.checkout('a', object)
+        self.assertFalse(first is second)
+        pool.checkin('a', first)
+        pool.checkin('a', second)
+        self.assertEqual(2, pool.stats()['size'])
+        self.assertEqual(0, pool.stats()['checked_out'])
+
+    def test_idle_clients_per_key_are_bounded(self):
+        pool = ClientPool(max_size=10, idle_timeout=60, max_per_key=1)
+        clients = [pool.checkout('a', object) for i in range(2)]
+        for client in clients:
+            pool.checkin('a', client)
+        self.assertEqual(1, pool.stats()['size'])
+        self.assertEqual(1, pool.stats()['evictions'])
+
+    def test_least_recently_used_client_is_evicted(self):
+        pool = ClientPool(max_size=2, idle_timeout=60)
+        first = pool.checkout('a', object)
+        for key in ('b', 'a', 'c'):
+            pool.checkin(key, first if key == 'a' else object())
+        self.assertTrue(first is pool.checkout('a', object))
+        self.assertEqual(1, pool.stats()['evictions'])
+        self.assertEqual(1, pool.stats()['size'])
+
+    def test_idle_clients_are_evicted(self):
+        pool = ClientPool(max_size=10, idle_timeout=0.01)
+        with pool.borrow('a', object) as first:
+            pass
+        time.sleep(0.02)
+        self.assertFalse(first is pool.checkout('a', object))
+        self.assertEqual(1, pool.stats()['evictions'])
+
+    def test_borrow_checks_in_after_an_error(self):
+        pool = ClientPool(max_size=10, idle_timeout=60)
+
+        def fail():
+            with pool.borrow('a', object):
+                raise RuntimeError()
+        self.assertRaises(RuntimeError, fail)
+        self.assertEqual(0, pool.stats()['checked_out'])
+        self.assertEqual(1, pool.stats()['size'])
+
+
+class FakeHTTPClient(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, *args, **kwargs):
+        self.requests.append(args)
+        return args
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.client = FakeHTTPClient()
+
+
+class FakeContext(object):
+    user = 'user'
+    tenant = 'tenant'
+    auth_tok = 'token'
+
+
+class PooledClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.created = []
+        self.original_create_client = remote._create_client
+        self.original_pool = remote._CLIENT_POOL
+        remote._create_client = self._create_client
+        remote._CLIENT_POOL = ClientPool(max_size=10, idle_timeout=60)
+
+    def tearDown(self):
+        remote._create_client = self.original_create_client
+        remote._CLIENT_POOL = self.original_pool
+
+    def _create_client(self, context, url):
+        client = FakeClient()
+        self.created.append(client)
+        return client
+
+    def test_requests_borrow_pooled_connections(self):
+        first = remote._pooled_client('compute', FakeContext(), 'url')
+        second = remote._pooled_client('compute', FakeContext(), 'url')
+        self.assertEqual(('/servers', 'GET'),
+                         first.client.request('/servers', 'GET'))
+        second.client.request('/flavors', 'GET')
+        # Two callers and one connection built on demand and then reused.
+        connection = self.created[2].client
+        self.assertEqual(3, len(self.created))
+        self.assertEqual([('/servers', 'GET'), ('/flavors', 'GET')],
+                         connection.requests)
+        self.assertEqual(0, remote.client_pool_stats()['checked_out'])
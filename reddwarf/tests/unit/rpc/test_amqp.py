@@ -0,0 +1,339 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import time
+import unittest
+
+import eventlet
+
+from reddwarf.common import config
+from reddwarf.rpc import amqp
+
+
+class TestCallTimeout(unittest.TestCase):
+
+    keys = ('rpc_response_timeout', 'rpc_response_timeout_restart')
+
+    def setUp(self):
+        # Taken out of the test config, and put back afterwards.
+        self.saved = dict((key, config.Config.instance.pop(key))
+                          for key in self.keys
+                          if key in config.Config.instance)
+
+    def tearDown(self):
+        for key in self.keys:
+            config.Config.instance.pop(key, None)
+        config.Config.instance.update(self.saved)
+
+    def test_explicit_timeout_wins(self):
+        config.Config.instance['rpc_response_timeout_restart'] = '300'
+        self.assertEqual(amqp.call_timeout('restart', 5), 5.0)
+
+    def test_built_in_default(self):
+        self.assertEqual(amqp.call_timeout('list_users'), 3600.0)
+
+    def test_method_option_overrides_default(self):
+        config.Config.instance['rpc_response_timeout'] = '30'
+        config.Config.instance['rpc_response_timeout_restart'] = '300'
+        self.assertEqual(amqp.call_timeout('restart'), 300.0)
+        self.assertEqual(amqp.call_timeout('list_users'), 30.0)
+
+
+class TestDeadline(unittest.TestCase):
+
+    def _context(self, timeout):
+        return amqp.unpack_context({'_context': {'limit': None,
+                                                 'marker': None},
+                                    '_timeout': timeout})
+
+    def test_deadline_passed(self):
+        ctxt = self._context(60)
+        ctxt.deadline -= 61
+        self.assertTrue(ctxt.deadline_passed())
+
+    def test_deadline_counts_from_receipt(self):
+        before = time.time()
+        ctxt = self._context(60)
+        self.assertTrue(before + 60 <= ctxt.deadline <= time.time() + 60)
+        self.assertFalse(ctxt.deadline_passed())
+
+    def test_no_deadline(self):
+        self.assertFalse(self._context(None).deadline_passed())
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+        self.reconnects = 0
+
+    def health_check(self):
+        if self.healthy is None:
+            # A connection whose broker went away without closing it.
+            eventlet.sleep(60)
+        return self.healthy
+
+    def close(self):
+        self.closed = True
+
+
+class TestPool(unittest.TestCase):
+
+    def setUp(self):
+        config.Config.instance['rpc_conn_idle_timeout'] = 60
+        config.Config.instance['rpc_conn_max_lifetime'] = 600
+        config.Config.instance['rpc_conn_health_check_interval'] = 0
+        config.Config.instance['rpc_conn_health_check_timeout'] = 0.01
+        self.pool = amqp.Pool(connection_cls=FakeConnection, max_size=2)
+
+    def tearDown(self):
+        for key in ('rpc_conn_idle_timeout', 'rpc_conn_max_lifetime',
+                    'rpc_conn_health_check_interval',
+                    'rpc_conn_health_check_timeout'):
+            config.Config.instance.pop(key, None)
+
+    def test_free_connection_is_reused(self):
+        connection = self.pool.get()
+        self.pool.put(connection)
+        self.assertTrue(self.pool.get() is connection)
+
+    def test_idle_connection_is_replaced(self):
+        connection = self.pool.get()
+        self.pool.put(connection)
+        connection.pool_last_used -= 120
+        self.assertFalse(self.pool.get() is connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['size'], 1)
+        self.assertEqual(self.pool.stats()['evicted'], 1)
+
+    def test_old_connection_is_closed_when_put_back(self):
+        connection = self.pool.get()
+        connection.pool_created -= 1200
+        self.pool.put(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+    def test_check_closes_dead_connections(self):
+        dead = self.pool.get()
+        alive = self.pool.get()
+        dead.healthy = False
+        dead.reconnects = 2
+        self.pool.put(dead)
+        self.pool.put(alive)
+        self.pool.check()
+        self.assertTrue(dead.closed)
+        self.assertFalse(alive.closed)
+        self.assertEqual(self.pool.stats(), {'size': 1, 'free': 1,
+                                             'waiters': 0, 'reconnects': 2,
+                                             'evicted': 0, 'dead': 1})
+
+    def test_check_closes_connections_that_do_not_answer(self):
+        hung = self.pool.get()
+        hung.healthy = None
+        self.pool.put(hung)
+        self.pool.check()
+        self.assertTrue(hung.closed)
+        self.assertEqual(self.pool.stats()['size'], 0)
+        self.assertEqual(self.pool.stats()['dead'], 1)
+
+    def test_empty(self):
+        connection = self.pool.get()
+        self.pool.put(connection)
+        self.pool.empty()
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.stats()['size'], 0)
+
+
+class EchoProxy(object):
+
+    def __init__(self):
+        self.events = []
+
+    def echo(self, context, value):
+        self.events.append(('echo', value))
+        return value
+
+
+class FakeProxy(EchoProxy):
+
+    @contextlib.contextmanager
+    def dispatch_scope(self):
+        self.events.append('enter')
+        yield
+        self.events.append('exit')
+
+
+class TestProxyCallback(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = FakeProxy()
+        self.replies = []
+        self.original_msg_reply = amqp.msg_reply
+        amqp.msg_reply = self._msg_reply
+
+    def tearDown(self):
+        amqp.msg_reply = self.original_msg_reply
+
+    def _msg_reply(self, msg_id, connection_pool, reply=None, failure=None,
+                   ending=False, **kwargs):
+        self.proxy.events.append('reply')
+        self.replies.append((msg_id, reply, failure, ending))
+
+    def _dispatch(self, proxy, message):
+        callback = amqp.ProxyCallback(proxy, None)
+        callback(message)
+        callback.pool.waitall()
+
+    def _message(self, **args):
+        return {'method': 'echo', 'args': args, '_msg_id': 'abc',
+                '_context': {'limit': None, 'marker': None}}
+
+    def test_message_runs_in_proxy_scope(self):
+        self._dispatch(self.proxy, self._message(value=42))
+        self.assertEqual(['enter', ('echo', 42), 'exit', 'reply', 'reply'],
+                         self.proxy.events)
+        self.assertEqual([('abc', 42, None, False),
+                          ('abc', None, None, True)], self.replies)
+
+    def test_proxy_without_scope(self):
+        self._dispatch(EchoProxy(), self._message(value='x'))
+        self.assertEqual([('abc', 'x', None, False),
+                          ('abc', None, None, True)], self.replies)
+
+
+class FakeReplyProxy(amqp.ReplyProxy):
+
+    def __init__(self):
+        self.connection = None
+        self._call_waiters = {}
+        self._reply_q = 'reply_q'
+
+
+class TestReplyProxy(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy = FakeReplyProxy()
+
+    def test_reply_goes_to_its_waiter(self):
+        first = self.proxy.add_call_waiter('first')
+        second = self.proxy.add_call_waiter('second')
+        self.proxy._process_data({'_msg_id': 'second', 'result': 42,
+                                  'failure': None})
+        self.assertEqual({'result': 42, 'failure': None}, second.get_nowait())
+        self.assertTrue(first.empty())
+        self.assertTrue(second.empty())
+
+    def test_reply_nobody_waits_for_is_dropped(self):
+        waiter = self.proxy.add_call_waiter('abc')
+        self.proxy.del_call_waiter('abc')
+        self.proxy._process_data({'_msg_id': 'abc', 'result': 42,
+                                  'failure': None})
+        self.proxy._process_data({'result': 42, 'failure': None})
+        self.assertTrue(waiter.empty())
+        self.assertEqual({}, self.proxy._call_waiters)
+
+    def _waiter(self, timeout=60):
+        return amqp.MulticallWaiter(self.proxy, 'abc', time.time() + timeout)
+
+    def test_waiter_removed_after_ending(self):
+        waiter = self._waiter()
+        self.proxy._process_data({'_msg_id': 'abc', 'result': 42,
+                                  'failure': None})
+        self.proxy._process_data({'_msg_id': 'abc', 'result': None,
+                                  'failure': None, 'ending': True})
+        self.assertEqual([42], list(waiter))
+        self.assertEqual({}, self.proxy._call_waiters)
+
+    def test_waiter_removed_after_failure(self):
+        waiter = self._waiter()
+        self.proxy._process_data({'_msg_id': 'abc', 'result': None,
+                                  'failure': ('ValueError', 'bad', [])})
+        self.assertRaises(amqp.rpc_common.RemoteError, list, waiter)
+        self.assertEqual({}, self.proxy._call_waiters)
+
+    def test_waiter_removed_after_timeout(self):
+        waiter = self._waiter(timeout=0.01)
+        self.assertRaises(amqp.rpc_common.Timeout, list, waiter)
+        self.assertEqual({}, self.proxy._call_waiters)
+
+    def test_waiter_removed_when_done(self):
+        waiter = self._waiter()
+        waiter.done()
+        self.assertEqual({}, self.proxy._call_waiters)
+        self.assertEqual([], list(waiter))
+
+
+class FakeReplyConnection(FakeConnection):
+
+    def __init__(self):
+        super(FakeReplyConnection, self).__init__()
+        self.consumers = []
+        self.sent = []
+
+    def declare_direct_consumer(self, topic, callback):
+        self.consumers.append((topic, callback))
+
+    def consume_in_thread(self):
+        pass
+
+    def topic_send(self, topic, msg):
+        self.sent.append(msg)
+
+    def reset(self):
+        self.consumers = []
+
+
+class TestReplyQueueOption(unittest.TestCase):
+
+    def setUp(self):
+        config.Config.instance['rpc_conn_health_check_interval'] = 0
+        self.pool = amqp.Pool(connection_cls=FakeReplyConnection)
+        self.shared = FakeReplyProxy()
+        self.pool.get_reply_proxy = lambda: self.shared
+
+    def tearDown(self):
+        for key in ('rpc_conn_health_check_interval',
+                    'rpc_shared_reply_queue'):
+            config.Config.instance.pop(key, None)
+
+    def _call(self):
+        waiter = amqp.multicall(amqp.RpcContext(limit=None, marker=None),
+                                'topic', {'method': 'echo'}, 60, self.pool)
+        sent = [msg for connection in self.pool._connections
+                for msg in connection.sent]
+        return waiter, sent[0]
+
+    def test_reply_queue_per_call_by_default(self):
+        waiter, msg = self._call()
+        self.assertFalse('_reply_q' in msg)
+        self.assertEqual(60, msg['_timeout'])
+        connection = waiter._reply_proxy.connection
+        self.assertEqual([msg['_msg_id']],
+                         [name for name, callback in connection.consumers])
+        waiter.done()
+        self.assertEqual([], connection.consumers)
+        self.assertEqual(2, self.pool.stats()['free'])
+
+    def test_shared_reply_queue(self):
+        config.Config.instance['rpc_shared_reply_queue'] = 'True'
+        waiter, msg = self._call()
+        self.assertEqual('reply_q', msg['_reply_q'])
+        self.assertEqual([msg['_msg_id']], self.shared._call_waiters.keys())
+        waiter.done()
+        self.assertEqual({}, self.shared._call_waiters)
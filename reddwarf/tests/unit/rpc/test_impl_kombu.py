@@ -0,0 +1,88 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import unittest
+import uuid
+
+from reddwarf.common import config
+
+try:
+    from reddwarf.rpc import impl_kombu
+except ImportError:
+    impl_kombu = None
+
+
+@unittest.skipUnless(impl_kombu, "kombu cannot be imported")
+class TestTopicSendMany(unittest.TestCase):
+
+    def setUp(self):
+        # The memory transport keeps queue bindings for the whole process.
+        self.topics = ['guestagent.%s' % uuid.uuid4().hex for i in range(5)]
+        config.Config.instance['fake_rabbit'] = True
+        config.Config.instance['rpc_cast_batch_size'] = 2
+        self.conn = impl_kombu.Connection()
+        for topic in self.topics:
+            self.conn.declare_topic_consumer(topic, lambda message: None)
+        self.commits = []
+
+    def tearDown(self):
+        for topic in self.topics:
+            self.conn.channel.queue_delete(topic)
+        self.conn.close()
+        for key in ('fake_rabbit', 'rpc_cast_batch_size'):
+            config.Config.instance.pop(key, None)
+
+    def _sizes(self):
+        return [self.conn.channel._size(topic) for topic in self.topics]
+
+    def _transactional(self, lose_ack=False):
+        """Gives the memory transport's channels tx_select and tx_commit.
+
+        With lose_ack, the first commit goes through but its ack is lost.
+        """
+        connection = self.conn.connection
+        open_channel = connection.channel
+
+        def channel():
+            channel = open_channel()
+            channel.tx_select = lambda: None
+            channel.tx_commit = commit
+            return channel
+
+        def commit():
+            self.commits.append(connection)
+            if lose_ack and len(self.commits) == 1:
+                raise socket.timeout()
+        connection.channel = channel
+
+    def test_each_topic_gets_the_message_once(self):
+        self.conn.topic_send_many(self.topics, {'method': 'upgrade'})
+        self.assertEqual([1, 1, 1, 1, 1], self._sizes())
+
+    def test_one_commit_per_batch(self):
+        self._transactional()
+        self.conn.topic_send_many(self.topics, {'method': 'upgrade'})
+        self.assertEqual(3, len(self.commits))
+        self.assertEqual([1, 1, 1, 1, 1], self._sizes())
+
+    def test_batch_is_published_again_when_its_commit_is_lost(self):
+        # The casts must be idempotent, as the first batch arrives twice.
+        self._transactional(lose_ack=True)
+        self.conn.topic_send_many(self.topics, {'method': 'upgrade'})
+        self.assertEqual(1, len(self.commits))
+        self.assertEqual([2, 2, 1, 1, 1], self._sizes())
@@ -0,0 +1,111 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import unittest
+
+from reddwarf.common import context
+from reddwarf.common import config
+from reddwarf.rpc import amqp
+from reddwarf.rpc import common as rpc_common
+from reddwarf.rpc import serializer
+
+
+class TestSerializer(unittest.TestCase):
+
+    def tearDown(self):
+        config.Config.instance.pop('rpc_serializer', None)
+
+    def test_round_trip_is_labelled_with_content_type(self):
+        msg = {'method': 'list_users', 'args': {'limit': 10}}
+        content_type, body = serializer.dumps(msg)
+        self.assertEqual(content_type, 'application/json')
+        self.assertEqual(serializer.loads(content_type, body), msg)
+
+    def test_unknown_types_are_encoded_as_primitives(self):
+        when = datetime.datetime(2012, 6, 1, 12, 30)
+        content_type, body = serializer.dumps({'when': when,
+                                               'ids': set(['a'])})
+        self.assertEqual(serializer.loads(content_type, body),
+                         {'when': '2012-06-01T12:30:00Z', 'ids': ['a']})
+
+    def test_missing_content_type_is_read_as_json(self):
+        self.assertEqual(serializer.loads(None, '{"a": 1}'), {'a': 1})
+
+    def test_unsupported_content_type(self):
+        self.assertRaises(rpc_common.UnsupportedContentType,
+                          serializer.loads, 'text/plain', 'a')
+
+    def test_unavailable_serializer_falls_back_to_json(self):
+        config.Config.instance['rpc_serializer'] = 'not-a-codec'
+        self.assertEqual(serializer.get_serializer().name, 'json')
+
+
+    @unittest.skipUnless(serializer.msgpack, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        config.Config.instance['rpc_serializer'] = 'msgpack'
+        msg = {'method': 'list_users', 'args': {'limit': 10, 'ids': ['a']},
+               'when': datetime.datetime(2012, 6, 1, 12, 30)}
+        content_type, body = serializer.dumps(msg)
+        self.assertEqual(content_type, 'application/x-msgpack')
+        self.assertEqual(serializer.loads(content_type, body),
+                         {u'method': u'list_users',
+                          u'args': {u'limit': 10, u'ids': [u'a']},
+                          u'when': u'2012-06-01T12:30:00Z'})
+
+
+class TestPackContext(unittest.TestCase):
+
+    def setUp(self):
+        self.context = context.ReddwarfContext(tenant='tenant', limit=5,
+                                               marker=None)
+
+    def tearDown(self):
+        config.Config.instance.pop('rpc_nested_context', None)
+
+    def test_context_is_flattened_by_default(self):
+        msg = {'method': 'restart'}
+        amqp.pack_context(msg, self.context)
+        self.assertFalse('_context' in msg)
+        self.assertEqual(msg['_context_tenant'], 'tenant')
+        self.assertEqual(msg['_context_limit'], 5)
+        self.assertEqual(amqp.unpack_context(msg).to_dict(),
+                         self.context.to_dict())
+
+    def test_context_is_packed_as_one_object(self):
+        config.Config.instance['rpc_nested_context'] = 'True'
+        msg = {'method': 'restart'}
+        amqp.pack_context(msg, self.context)
+        self.assertEqual(sorted(msg.keys()), ['_context', 'method'])
+        self.assertEqual(msg['_context'], self.context.to_dict())
+
+    def test_unpack_nested_context(self):
+        msg = {'method': 'restart', '_msg_id': 'abc',
+               '_context': {u'tenant': 'tenant', u'limit': 5,
+                            u'marker': None}}
+        ctxt = amqp.unpack_context(msg)
+        self.assertEqual(ctxt.tenant, 'tenant')
+        self.assertEqual(ctxt.limit, 5)
+        self.assertEqual(ctxt.msg_id, 'abc')
+        self.assertEqual(msg, {'method': 'restart'})
+
+    def test_unpack_flattened_context(self):
+        msg = {'method': 'restart', '_context_tenant': 'tenant',
+               '_context_limit': 5, '_context_marker': None}
+        ctxt = amqp.unpack_context(msg)
+        self.assertEqual(ctxt.tenant, 'tenant')
+        self.assertEqual(msg, {'method': 'restart'})
@@ -0,0 +1,166 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from reddwarf import tests
+from reddwarf.common import utils
+from reddwarf.instance.models import AgentHeartBeat
+from reddwarf.instance.models import InstanceServiceStatus
+from reddwarf.instance.models import ServiceStatuses
+from reddwarf.taskmanager import collector
+
+
+class TestStatusCollector(tests.BaseTest):
+
+    def setUp(self):
+        super(TestStatusCollector, self).setUp()
+        self.ids = [utils.generate_uuid() for i in range(3)]
+        InstanceServiceStatus.bulk_create(
+            [{'instance_id': instance_id, 'status': ServiceStatuses.NEW}
+             for instance_id in self.ids])
+        self.collector = collector.StatusCollector(interval=0, batch_size=2)
+
+    def _saved_status(self, instance_id):
+        return InstanceServiceStatus.find_by(instance_id=instance_id).status
+
+    def test_newest_report_wins(self):
+        self.collector.add(self.ids[0], ServiceStatuses.BUILDING.code)
+        self.collector.add(self.ids[0], ServiceStatuses.RUNNING.code)
+
+        self.assertEqual(ServiceStatuses.RUNNING.code,
+                         self.collector.get(self.ids[0]))
+        self.assertEqual(ServiceStatuses.NEW, self._saved_status(self.ids[0]))
+        self.assertEqual(ServiceStatuses.NEW.code,
+                         self.collector.get(self.ids[1]))
+
+    def test_flush_writes_every_pending_status(self):
+        for instance_id in self.ids:
+            self.collector.add(instance_id, ServiceStatuses.RUNNING.code)
+        self.collector.add(self.ids[2], ServiceStatuses.SHUTDOWN.code)
+
+        self.collector.flush()
+
+        self.assertEqual(ServiceStatuses.RUNNING,
+                         self._saved_status(self.ids[0]))
+        self.assertEqual(ServiceStatuses.RUNNING,
+                         self._saved_status(self.ids[1]))
+        self.assertEqual(ServiceStatuses.SHUTDOWN,
+                         self._saved_status(self.ids[2]))
+        self.assertEqual(0, self.collector.stats()['pending'])
+        self.assertEqual(3, self.collector.stats()['rows_written'])
+
+    def test_rejects_unknown_status(self):
+        self.assertRaises(ValueError, self.collector.add, self.ids[0], -1)
+
+    def test_older_report_is_ignored(self):
+        now = utils.utcnow()
+        earlier = now - datetime.timedelta(seconds=1)
+        self.collector.add(self.ids[0], ServiceStatuses.RUNNING.code, now)
+        self.collector.add(self.ids[0], ServiceStatuses.SHUTDOWN.code,
+                           earlier)
+
+        self.assertEqual(ServiceStatuses.RUNNING.code,
+                         self.collector.get(self.ids[0]))
+
+    def test_late_flush_keeps_newer_status(self):
+        earlier = utils.utcnow()
+        now = earlier + datetime.timedelta(seconds=1)
+        late = collector.StatusCollector(interval=0)
+        self.collector.add(self.ids[0], ServiceStatuses.RUNNING.code, now)
+        late.add(self.ids[0], ServiceStatuses.SHUTDOWN.code, earlier)
+        late.add(self.ids[1], ServiceStatuses.SHUTDOWN.code, earlier)
+
+        self.collector.flush()
+        late.flush()
+
+        saved = InstanceServiceStatus.find_by(instance_id=self.ids[0])
+        self.assertEqual(ServiceStatuses.RUNNING, saved.status)
+        self.assertEqual(now, saved.updated_at)
+        self.assertEqual(ServiceStatuses.SHUTDOWN,
+                         self._saved_status(self.ids[1]))
+        self.assertEqual(1, late.stats()['rows_written'])
+
+
+class TestHeartbeatCollector(tests.BaseTest):
+
+    def setUp(self):
+        super(TestHeartbeatCollector, self).setUp()
+        self.collector = collector.HeartbeatCollector(interval=0,
+                                                      batch_size=2)
+
+    def test_flush_creates_then_updates_heartbeats(self):
+        ids = [utils.generate_uuid() for i in range(3)]
+        for instance_id in ids:
+            self.collector.add(instance_id)
+        self.collector.flush()
+
+        first = AgentHeartBeat.find_all_by_instance_ids(ids)
+        self.assertItemsEqual(ids, first.keys())
+
+        self.collector.add(ids[0])
+        self.collector.flush()
+
+        second = AgentHeartBeat.find_all_by_instance_ids(ids)
+        self.assertEqual(3, len(AgentHeartBeat.find_all().all()))
+        self.assertTrue(second[ids[0]].updated_at >
+                        first[ids[0]].updated_at)
+        self.assertEqual(first[ids[1]].updated_at, second[ids[1]].updated_at)
+
+    def test_racing_insert_is_retried_as_update(self):
+        instance_id = utils.generate_uuid()
+        other = collector.HeartbeatCollector(interval=0)
+        self.collector.add(instance_id)
+        other.add(instance_id)
+        reported = other._pending[instance_id]
+
+        self.collector.flush()
+        # The other task manager looked for the row before it was inserted.
+        self.mock.stubs.Set(AgentHeartBeat, 'find_all_by_ids',
+                            classmethod(lambda cls, ids, field: {}))
+        other.flush()
+        self.mock.stubs.UnsetAll()
+
+        self.assertEqual(1, other.stats()['pending'])
+        other.flush()
+        self.assertEqual(0, other.stats()['pending'])
+        heartbeats = AgentHeartBeat.find_all(instance_id=instance_id).all()
+        self.assertEqual(1, len(heartbeats))
+        self.assertEqual(reported, heartbeats[0].updated_at)
+
+    def test_updated_at_never_moves_back(self):
+        instance_id = utils.generate_uuid()
+        self.collector.add(instance_id)
+        reported = self.collector._pending[instance_id]
+        late = collector.HeartbeatCollector(interval=0)
+        late._add(instance_id, reported - datetime.timedelta(seconds=1))
+
+        self.collector.flush()
+        late.flush()
+
+        heartbeat = AgentHeartBeat.find_by(instance_id=instance_id)
+        self.assertEqual(reported, heartbeat.updated_at)
+        self.assertEqual(0, late.stats()['rows_written'])
+
+    def test_heartbeat_goes_stale(self):
+        now = utils.utcnow()
+        heartbeat = AgentHeartBeat(instance_id=utils.generate_uuid(),
+                                   updated_at=now)
+        self.assertFalse(heartbeat.is_stale(now))
+        later = now + datetime.timedelta(
+            seconds=AgentHeartBeat.HEARTBEAT_EXPIRY + 1)
+        self.assertTrue(heartbeat.is_stale(later))
@@ -0,0 +1,87 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import unittest
+
+from reddwarf.common import config
+from reddwarf.db.sqlalchemy import session
+from reddwarf.instance.models import ServiceStatuses
+from reddwarf.taskmanager import manager
+
+
+class ManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        for key in ('status_flush_interval', 'heartbeat_flush_interval'):
+            config.Config.instance[key] = 0
+        self.manager = manager.TaskManager(host='test')
+
+    def tearDown(self):
+        for key in ('status_flush_interval', 'heartbeat_flush_interval'):
+            config.Config.instance.pop(key, None)
+
+
+class TestDispatchScope(ManagerTest):
+
+    def test_messages_read_from_primary(self):
+        with self.manager.dispatch_scope():
+            self.assertTrue(session._SCOPE.active)
+            self.assertTrue(session._SCOPE.primary)
+        self.assertFalse(session._SCOPE.active)
+        self.assertFalse(session._SCOPE.primary)
+
+    def test_long_tasks_run_outside_the_scope(self):
+        seen = []
+
+        class FakeTasks(object):
+
+            @staticmethod
+            def load(context, id):
+                seen.append((session._SCOPE.active, session._SCOPE.primary))
+                return FakeTasks()
+
+            def resize_volume(self, new_size):
+                pass
+
+        saved = manager.models.InstanceTasks
+        manager.models.InstanceTasks = FakeTasks
+        try:
+            with self.manager.dispatch_scope():
+                self.manager.resize_volume(None, 'id', 2)
+                self.assertTrue(session._SCOPE.active)
+        finally:
+            manager.models.InstanceTasks = saved
+        self.assertEqual([(False, True)], seen)
+
+
+class TestUpdateServiceStatus(ManagerTest):
+
+    def test_report_time_comes_from_guest(self):
+        self.manager.update_service_status(
+            None, 'id', ServiceStatuses.RUNNING.code,
+            reported_at='2012-01-02T03:04:05.678901')
+        self.assertEqual((ServiceStatuses.RUNNING.code,
+                          datetime.datetime(2012, 1, 2, 3, 4, 5, 678901)),
+                         self.manager.status_collector._pending['id'])
+
+    def test_older_guests_report_on_arrival(self):
+        self.manager.update_service_status(None, 'id',
+                                           ServiceStatuses.RUNNING.code)
+        code, reported_at = self.manager.status_collector._pending['id']
+        self.assertEqual(ServiceStatuses.RUNNING.code, code)
+        self.assertTrue(reported_at is not None)
@@ -0,0 +1,364 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+
+from novaclient import exceptions as nova_exceptions
+
+from reddwarf import tests
+from reddwarf.common import context
+from reddwarf.common import exception
+from reddwarf.common import utils
+from reddwarf.instance.models import DBInstance
+from reddwarf.instance.tasks import InstanceTasks
+from reddwarf.taskmanager import models
+
+
+class FakeServer(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeGuest(object):
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def prepare(self, *args, **kwargs):
+        self.calls.append('prepare')
+
+
+class TestFreshInstanceTasks(tests.BaseTest):
+
+    def setUp(self):
+        super(TestFreshInstanceTasks, self).setUp()
+        self.context = context.ReddwarfContext(is_admin=True, limit=None,
+                                               marker=None)
+        db_info = DBInstance.create(name='instance',
+                                    task_status=InstanceTasks.BUILDING)
+        self.tasks = models.FreshInstanceTasks.load(self.context, db_info.id)
+        self.calls = []
+        self._stub('_create_server', lambda *args: FakeServer('server'))
+        self.guest = FakeGuest(self.calls)
+        self.mock.stubs.Set(models.remote, 'create_guest_client',
+                            lambda context, id: self.guest)
+        self._stub('_create_dns_entry', lambda *args: None)
+
+    def _stub(self, name, func):
+        def record(*args):
+            self.calls.append(name)
+            return func(*args)
+        self.mock.stubs.Set(self.tasks, name, record)
+
+    def _fail(self, *args, **kwargs):
+        raise RuntimeError("failed")
+
+    def _create(self):
+        self.tasks.create_instance('instance', 'flavor', 'image', [],
+                                   'mysql', None)
+
+    def _task_status(self):
+        return DBInstance.find_by(id=self.tasks.id).task_status
+
+    def test_finished_build_clears_the_task(self):
+        self._create()
+        self.assertEqual(['_create_server', 'prepare', '_create_dns_entry'],
+                         self.calls)
+        self.assertEqual(InstanceTasks.NONE, self._task_status())
+
+    def test_guest_failure_is_recorded(self):
+        self.guest.prepare = self._fail
+        self.assertRaises(RuntimeError, self._create)
+        self.assertEqual(InstanceTasks.BUILDING_ERROR_GUEST,
+                         self._task_status())
+
+    def test_unexpected_failure_leaves_building(self):
+        self._stub('_create_dns_entry', self._fail)
+        self.assertRaises(RuntimeError, self._create)
+        self.assertEqual(InstanceTasks.BUILDING_ERROR_SERVER,
+                         self._task_status())
+
+    def test_recorded_failure_is_kept(self):
+        def dns_failed(*args):
+            self.tasks._set_task_status(InstanceTasks.BUILDING_ERROR_DNS)
+            self._fail()
+        self._stub('_create_dns_entry', dns_failed)
+        self.assertRaises(RuntimeError, self._create)
+        self.assertEqual(InstanceTasks.BUILDING_ERROR_DNS,
+                         self._task_status())
+
+
+class StaleTaskTest(tests.BaseTest):
+
+    def _create(self, task_status, age):
+        db_info = DBInstance.create(name='instance', task_status=task_status)
+        updated = utils.utcnow() - datetime.timedelta(seconds=age)
+        DBInstance.update_where({'id': db_info.id}, {'updated': updated})
+        return db_info.id
+
+    def _task_status(self, id):
+        return DBInstance.find_by(id=id).task_status
+
+
+class TestFailStaleBuilds(StaleTaskTest):
+
+    def test_only_old_builds_fail(self):
+        stale = self._create(InstanceTasks.BUILDING, 120)
+        fresh = self._create(InstanceTasks.BUILDING, 0)
+        resizing = self._create(InstanceTasks.RESIZING, 120)
+
+        self.assertEqual([stale], models.fail_stale_builds(60))
+
+        self.assertEqual(InstanceTasks.BUILDING_ERROR_TIMEOUT,
+                         self._task_status(stale))
+        self.assertEqual(InstanceTasks.BUILDING, self._task_status(fresh))
+        self.assertEqual(InstanceTasks.RESIZING, self._task_status(resizing))
+
+    def test_nothing_stale(self):
+        self._create(InstanceTasks.BUILDING, 0)
+        self.assertEqual([], models.fail_stale_builds(60))
+
+
+class FakeVolume(object):
+
+    def __init__(self, id, status):
+        self.id = id
+        self.status = status
+
+
+class FakeVolumes(object):
+
+    def __init__(self, status='available'):
+        self.status = status
+        self.db = {}
+        self.deleted = []
+
+    def create(self, size, display_name=None, display_description=None):
+        self.db['volume'] = FakeVolume('volume', self.status)
+        return self.db['volume']
+
+    def get(self, id):
+        if id not in self.db:
+            raise nova_exceptions.NotFound(404, "Not found")
+        return self.db[id]
+
+    def delete(self, id):
+        self.deleted.append(id)
+        del self.db[id]
+
+
+class FakeVolumeClient(object):
+
+    def __init__(self, volumes):
+        self.volumes = volumes
+
+
+class FakeBootingServers(object):
+
+    def __init__(self):
+        self.created = []
+
+    def create(self, name, image_id, flavor_ref, files=None,
+               block_device_mapping=None):
+        server = FakeServer('server')
+        server.status = 'ACTIVE'
+        self.created.append(block_device_mapping)
+        return server
+
+    def get(self, id):
+        server = FakeServer(id)
+        server.status = 'ACTIVE'
+        return server
+
+
+class FakeServerVolumes(object):
+
+    def __init__(self, volumes):
+        self.volumes = volumes
+        self.attached = []
+
+    def create_server_volume(self, server_id, volume_id, device):
+        self.attached.append((server_id, volume_id, device))
+        self.volumes.get(volume_id).status = 'in-use'
+
+
+class FakeBootingNovaClient(object):
+
+    def __init__(self, volumes):
+        self.servers = FakeBootingServers()
+        self.volumes = FakeServerVolumes(volumes)
+
+
+class TestCreateWithVolume(tests.BaseTest):
+
+    def setUp(self):
+        super(TestCreateWithVolume, self).setUp()
+        self.context = context.ReddwarfContext(is_admin=True, limit=None,
+                                               marker=None)
+        db_info = DBInstance.create(name='instance',
+                                    task_status=InstanceTasks.BUILDING)
+        self.tasks = models.FreshInstanceTasks.load(self.context, db_info.id)
+        self.calls = []
+        self.mock.stubs.Set(models.remote, 'create_guest_client',
+                            lambda context, id: FakeGuest(self.calls))
+        self.mock.stubs.Set(self.tasks, '_create_dns_entry',
+                            lambda server: None)
+
+    def _use_clients(self, volumes):
+        self.nova_client = FakeBootingNovaClient(volumes)
+        self.mock.stubs.Set(models.remote, 'create_nova_client',
+                            lambda context: self.nova_client)
+        self.mock.stubs.Set(models.remote, 'create_nova_volume_client',
+                            lambda context: FakeVolumeClient(volumes))
+
+    def _create(self):
+        self.tasks.create_instance('instance', 'flavor', 'image', [],
+                                   'mysql', 1)
+
+    def _db_info(self):
+        return DBInstance.find_by(id=self.tasks.id)
+
+    def test_volume_is_attached_after_boot(self):
+        self._use_clients(FakeVolumes())
+        self._create()
+        self.assertEqual([None], self.nova_client.servers.created)
+        self.assertEqual([('server', 'volume', '/dev/vdb')],
+                         self.nova_client.volumes.attached)
+        db_info = self._db_info()
+        self.assertEqual('volume', db_info.volume_id)
+        self.assertEqual('server', db_info.compute_instance_id)
+        self.assertEqual(InstanceTasks.NONE, db_info.task_status)
+
+    def test_volume_failure_is_recorded_by_the_build(self):
+        self._use_clients(FakeVolumes(status='error'))
+        self.assertRaises(exception.VolumeCreationFailure, self._create)
+        self.assertEqual([], self.nova_client.volumes.attached)
+        self.assertEqual(InstanceTasks.BUILDING_ERROR_VOLUME,
+                         self._db_info().task_status)
+
+
+class TestDeleteVolume(tests.BaseTest):
+
+    def setUp(self):
+        super(TestDeleteVolume, self).setUp()
+        self.volumes = FakeVolumes()
+        self.mock.stubs.Set(models.remote, 'create_nova_volume_client',
+                            lambda context: FakeVolumeClient(self.volumes))
+
+    def test_deletes_detached_volume(self):
+        self.volumes.create(1)
+        models.delete_volume(None, 'volume')
+        self.assertEqual(['volume'], self.volumes.deleted)
+
+    def test_volume_already_deleted(self):
+        models.delete_volume(None, 'volume')
+        self.assertEqual([], self.volumes.deleted)
+
+
+class FakeResizeServer(object):
+
+    def __init__(self):
+        self.id = 'server'
+        self.status = 'ACTIVE'
+        self.flavor = {'id': 1}
+        self.confirmed = False
+
+    def resize(self, new_flavor_id):
+        self.status = 'VERIFY_RESIZE'
+        self.flavor = {'id': new_flavor_id}
+
+    def confirm_resize(self):
+        self.confirmed = True
+        self.status = 'ACTIVE'
+
+
+class FakeServers(object):
+
+    def __init__(self, server):
+        self.server = server
+
+    def get(self, id):
+        return self.server
+
+
+class FakeNovaClient(object):
+
+    def __init__(self, server):
+        self.servers = FakeServers(server)
+
+
+class FakeResizeGuest(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def stop_mysql(self):
+        self.calls.append(('stop_mysql',))
+
+    def start_mysql_with_conf_changes(self, memory_size):
+        self.calls.append(('start_mysql_with_conf_changes', memory_size))
+
+
+class TestResizeFlavor(tests.BaseTest):
+
+    def setUp(self):
+        super(TestResizeFlavor, self).setUp()
+        self.db_info = DBInstance.create(name='instance',
+                                         task_status=InstanceTasks.RESIZING)
+        self.server = FakeResizeServer()
+        self.guest = FakeResizeGuest()
+        self.tasks = models.InstanceTasks(None, self.db_info, self.server, [],
+                                          nova_client=FakeNovaClient(
+                                              self.server),
+                                          guest=self.guest)
+
+    def _task_status(self):
+        return DBInstance.find_by(id=self.db_info.id).task_status
+
+    def test_resize(self):
+        self.tasks.resize_flavor(2, 512, 1024)
+        self.assertTrue(self.server.confirmed)
+        self.assertEqual([('stop_mysql',),
+                          ('start_mysql_with_conf_changes', 1024)],
+                         self.guest.calls)
+        self.assertEqual(InstanceTasks.NONE, self._task_status())
+
+    def test_failed_resize_restarts_mysql_with_old_size(self):
+        def fail(new_flavor_id):
+            raise RuntimeError("failed")
+        self.server.resize = fail
+        self.assertRaises(RuntimeError, self.tasks.resize_flavor, 2, 512,
+                          1024)
+        self.assertEqual([('stop_mysql',),
+                          ('start_mysql_with_conf_changes', 512)],
+                         self.guest.calls)
+        self.assertEqual(InstanceTasks.NONE, self._task_status())
+
+
+class TestClearStaleResizes(StaleTaskTest):
+
+    def test_only_old_resizes_are_cleared(self):
+        stale = self._create(InstanceTasks.RESIZING, 120)
+        fresh = self._create(InstanceTasks.RESIZING, 0)
+        building = self._create(InstanceTasks.BUILDING, 120)
+
+        self.assertEqual([stale], models.clear_stale_resizes(60))
+
+        self.assertEqual(InstanceTasks.NONE, self._task_status(stale))
+        self.assertEqual(InstanceTasks.RESIZING, self._task_status(fresh))
+        self.assertEqual(InstanceTasks.BUILDING, self._task_status(building))
@@ -14,12 +14,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
 import mox
 import novaclient
+from novaclient import exceptions as nova_exceptions
 
 from reddwarf import tests
+from reddwarf.common import context
 from reddwarf.common import utils
 from reddwarf.common import exception
+from reddwarf.db.sqlalchemy import session
 from reddwarf.instance import models
 from reddwarf.instance.tasks import InstanceTasks
 from reddwarf.tests.factories import models as factory_models
@@ -95,3 +99,641 @@ class TestInstance(tests.BaseTest):
         self.mock_out_client()
         self.FAKE_SERVER.flavor = None
         self.assertRaises(exception.BadRequest, factory_models.Instance())
+
+
+class TestInstanceServiceStatus(tests.BaseTest):
+
+    def test_find_all_by_instance_ids(self):
+        ids = [utils.generate_uuid() for i in range(3)]
+        for instance_id in ids:
+            models.InstanceServiceStatus.create(instance_id=instance_id,
+                status=models.ServiceStatuses.RUNNING)
+        models.InstanceServiceStatus.create(
+            instance_id=utils.generate_uuid(),
+            status=models.ServiceStatuses.RUNNING)
+
+        statuses = models.InstanceServiceStatus.find_all_by_instance_ids(
+            ids[:2] + ['missing'])
+
+        self.assertItemsEqual(ids[:2], statuses.keys())
+        for instance_id, status in statuses.items():
+            self.assertEqual(instance_id, status.instance_id)
+
+    def test_find_all_by_instance_ids_with_no_ids(self):
+        self.assertEqual({},
+            models.InstanceServiceStatus.find_all_by_instance_ids([]))
+
+    def test_bulk_create(self):
+        ids = [utils.generate_uuid() for i in range(3)]
+        created = models.InstanceServiceStatus.bulk_create(
+            [{'instance_id': instance_id,
+              'status': models.ServiceStatuses.NEW} for instance_id in ids])
+
+        self.assertEqual(3, len(created))
+        statuses = models.InstanceServiceStatus.find_all_by_instance_ids(ids)
+        self.assertItemsEqual(ids, statuses.keys())
+
+    def test_bulk_create_validates(self):
+        self.assertRaises(models.InvalidModelError,
+                          models.InstanceServiceStatus.bulk_create,
+                          [{'instance_id': utils.generate_uuid(),
+                            'status': None}])
+
+    def test_update_where(self):
+        ids = [utils.generate_uuid() for i in range(2)]
+        models.InstanceServiceStatus.bulk_create(
+            [{'instance_id': instance_id,
+              'status': models.ServiceStatuses.NEW} for instance_id in ids])
+
+        count = models.InstanceServiceStatus.update_where(
+            {'instance_id': ids[0]},
+            {'status': models.ServiceStatuses.RUNNING})
+
+        self.assertEqual(1, count)
+        statuses = models.InstanceServiceStatus.find_all_by_instance_ids(ids)
+        self.assertEqual(models.ServiceStatuses.RUNNING,
+                         statuses[ids[0]].status)
+        self.assertEqual(models.ServiceStatuses.NEW, statuses[ids[1]].status)
+
+    def test_update_where_validates(self):
+        self.assertRaises(models.InvalidModelError,
+                          models.InstanceServiceStatus.update_where,
+                          {'instance_id': 'any'}, {'status': None})
+
+    def test_update_where_rejects_unknown_status_id(self):
+        self.assertRaises(models.InvalidModelError,
+                          models.InstanceServiceStatus.update_where,
+                          {'instance_id': 'any'}, {'status_id': -1})
+
+    def test_update_where_stamps_updated_at(self):
+        instance_id = utils.generate_uuid()
+        status = models.InstanceServiceStatus.create(
+            instance_id=instance_id, status=models.ServiceStatuses.NEW)
+        before = utils.utcnow()
+
+        models.InstanceServiceStatus.update_where(
+            {'instance_id': instance_id},
+            {'status': models.ServiceStatuses.RUNNING})
+
+        status = models.InstanceServiceStatus.find_by(id=status.id)
+        self.assertTrue(status.updated_at >= before)
+
+
+class TestSave(tests.BaseTest):
+
+    def setUp(self):
+        super(TestSave, self).setUp()
+        self.instance = models.DBInstance.create(
+            name='instance', tenant_id=utils.generate_uuid(),
+            task_status=InstanceTasks.NONE)
+
+    def test_copy_of_existing_row_updates_it(self):
+        copy = models.DBInstance(id=self.instance.id, name='copy',
+                                 tenant_id=self.instance.tenant_id,
+                                 created=self.instance.created,
+                                 task_status=InstanceTasks.NONE)
+        copy.save()
+        self.assertEqual('copy',
+                         models.DBInstance.find_by(id=self.instance.id).name)
+
+    def test_loaded_row_updates_only_changed_columns(self):
+        other_session = session.get_session()
+        instance = other_session.query(models.DBInstance).get(
+            self.instance.id)
+        models.DBInstance.update_where({'id': self.instance.id},
+                                       {'hostname': 'fresh'})
+        instance.name = 'renamed'
+        instance.save()
+        saved = models.DBInstance.find_by(id=self.instance.id)
+        self.assertEqual('renamed', saved.name)
+        self.assertEqual('fresh', saved.hostname)
+
+
+class TestKeysetPagination(tests.BaseTest):
+
+    def setUp(self):
+        super(TestKeysetPagination, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+        instances = models.DBInstance.bulk_create(
+            [{'name': 'instance-%d' % i, 'tenant_id': self.tenant_id,
+              'task_status': InstanceTasks.NONE} for i in range(5)])
+        # Two instances share a timestamp so the id has to break the tie.
+        times = [datetime.datetime(2012, 1, 1, 0, 0, i) for i in
+                 (3, 1, 4, 1, 5)]
+        for instance, created in zip(instances, times):
+            models.DBInstance.update_where({'id': instance.id},
+                                           {'created': created})
+        self.expected = [instance.id for created, instance in
+                         sorted(zip(times, instances),
+                                key=lambda pair: (pair[0], pair[1].id))]
+
+    def _all_pages(self, **kwargs):
+        ids, marker = [], None
+        while True:
+            query = models.DBInstance.find_all(tenant_id=self.tenant_id)
+            kwargs.setdefault('sort_key', 'created')
+            page, marker = query.paginated_collection(limit=2, marker=marker,
+                                                      **kwargs)
+            ids.extend(instance.id for instance in page)
+            if marker is None:
+                return ids
+
+    def test_ascending(self):
+        self.assertEqual(self.expected, self._all_pages())
+
+    def test_descending(self):
+        self.assertEqual(list(reversed(self.expected)),
+                         self._all_pages(sort_dir='desc'))
+
+    def _null_updated(self, count):
+        """Clears updated on count rows, which then sort before the rest."""
+        nulls = sorted(self.expected[:count])
+        models.DBInstance.update_where({'id': nulls}, {'updated': None})
+        rest = self.expected[count:]
+        for second, instance_id in enumerate(rest):
+            models.DBInstance.update_where(
+                {'id': instance_id},
+                {'updated': datetime.datetime(2012, 1, 2, 0, 0, second)})
+        return nulls + rest
+
+    def test_ascending_with_null_sort_values(self):
+        expected = self._null_updated(3)
+        self.assertEqual(expected, self._all_pages(sort_key='updated'))
+
+    def test_descending_with_null_sort_values(self):
+        expected = self._null_updated(3)
+        self.assertEqual(list(reversed(expected)),
+                         self._all_pages(sort_key='updated', sort_dir='desc'))
+
+    def test_bad_marker(self):
+        query = models.DBInstance.find_all(tenant_id=self.tenant_id)
+        self.assertRaises(exception.BadRequest, query.paginated_collection,
+                          marker='not-a-marker', sort_key='created')
+
+    def test_unsorted_pages_use_ids(self):
+        self.assertEqual(sorted(self.expected),
+                         self._all_pages(sort_key=None))
+
+    def test_id_marker_with_sort_key(self):
+        query = models.DBInstance.find_all(tenant_id=self.tenant_id)
+        self.assertRaises(exception.BadRequest, query.paginated_collection,
+                          marker=self.expected[0], sort_key='created')
+
+    def test_sorted_marker_without_sort_key(self):
+        query = models.DBInstance.find_all(tenant_id=self.tenant_id)
+        page, marker = query.paginated_collection(limit=2,
+                                                  sort_key='created')
+        self.assertRaises(exception.BadRequest, query.paginated_collection,
+                          marker=marker)
+
+
+class FakeVolume(object):
+
+    def __init__(self, id, size, *server_ids):
+        self.id = id
+        self.size = size
+        self.attachments = [{'server_id': server_id}
+                            for server_id in server_ids]
+
+
+class FakeServer(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class TestListMatchers(tests.BaseTest):
+
+    def test_server_matcher_finds_server(self):
+        servers = [FakeServer('a'), FakeServer('b')]
+        find_server = models.create_server_list_matcher(servers)
+        self.assertEqual(servers[1], find_server('instance', 'b'))
+
+    def test_server_matcher_missing_server(self):
+        find_server = models.create_server_list_matcher([FakeServer('a')])
+        self.assertRaises(exception.ComputeInstanceNotFound,
+                          find_server, 'instance', 'b')
+
+    def test_server_matcher_duplicate_server(self):
+        servers = [FakeServer('a'), FakeServer('a'), FakeServer('b')]
+        find_server = models.create_server_list_matcher(servers)
+        self.assertRaises(exception.ReddwarfError,
+                          find_server, 'instance', 'a')
+        self.assertEqual(servers[2], find_server('instance', 'b'))
+
+    def test_volumes_matcher(self):
+        volumes = [FakeVolume('v1', 1, 'a'),
+                   FakeVolume('v2', 2, 'a', 'a', 'b'),
+                   FakeVolume('v3', 3)]
+        find_volumes = models.create_volumes_list_matcher(volumes)
+        self.assertEqual([{'id': 'v1', 'size': 1}, {'id': 'v2', 'size': 2}],
+                         find_volumes('a'))
+        self.assertEqual([{'id': 'v2', 'size': 2}], find_volumes('b'))
+        self.assertEqual([], find_volumes('c'))
+
+
+class FakeServerManager(object):
+    """Servers a tenant's Nova client can see, with a log of lookups."""
+
+    def __init__(self, server_ids):
+        self.server_ids = server_ids
+        self.requested = []
+
+    def get(self, server_id):
+        self.requested.append(server_id)
+        if server_id not in self.server_ids:
+            raise nova_exceptions.NotFound(404, "Not found")
+        return FakeServer(server_id)
+
+
+class FakeNovaClient(object):
+
+    def __init__(self, *server_ids):
+        self.servers = FakeServerManager(server_ids)
+
+
+class TenantServer(FakeServer):
+
+    def __init__(self, id, tenant_id):
+        super(TenantServer, self).__init__(id)
+        self.tenant_id = tenant_id
+
+
+class FakeAdminServerManager(object):
+
+    def __init__(self, servers):
+        self.servers = servers
+
+    def list(self, search_opts=None):
+        assert search_opts == {'all_tenants': 1}
+        return self.servers
+
+
+class FakeAdminNovaClient(object):
+
+    def __init__(self, *servers):
+        self.servers = FakeAdminServerManager(servers)
+
+
+class TestInstancesLoad(tests.BaseTest):
+
+    def setUp(self):
+        super(TestInstancesLoad, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+        self.context = context.ReddwarfContext(tenant=self.tenant_id,
+                                               is_admin=False, limit=None,
+                                               marker=None)
+
+    def _create(self, server_id, tenant_id):
+        db_info = models.DBInstance.create(name=server_id,
+                                           compute_instance_id=server_id,
+                                           tenant_id=tenant_id,
+                                           task_status=InstanceTasks.NONE)
+        models.InstanceServiceStatus.create(instance_id=db_info.id,
+            status=models.ServiceStatuses.RUNNING)
+        return db_info
+
+    def _use_nova(self, client):
+        self.mock.stubs.Set(models, 'create_nova_client',
+                            lambda context: client)
+
+    def _listed_servers(self):
+        instances, marker = models.Instances.load(self.context)
+        return sorted(instance.server.id for instance in instances)
+
+    def test_lists_only_the_tenants_instances(self):
+        self._create('mine', self.tenant_id)
+        self._create('theirs', utils.generate_uuid())
+        client = FakeNovaClient('mine', 'theirs')
+        self._use_nova(client)
+
+        self.assertEqual(['mine'], self._listed_servers())
+        self.assertEqual(['mine'], client.servers.requested)
+
+    def test_asks_nova_only_about_the_page(self):
+        for server_id in ('a', 'b', 'c'):
+            self._create(server_id, self.tenant_id)
+        client = FakeNovaClient('a', 'b', 'c')
+        self._use_nova(client)
+        self.context.limit = 2
+
+        self.assertEqual(2, len(self._listed_servers()))
+        self.assertEqual(2, len(client.servers.requested))
+
+    def test_rows_without_tenant_are_not_listed(self):
+        self._create('legacy', None)
+        client = FakeNovaClient('legacy')
+        self._use_nova(client)
+
+        self.assertEqual([], self._listed_servers())
+        self.assertEqual([], client.servers.requested)
+
+    def test_admins_list_only_their_own_tenant(self):
+        self._create('mine', self.tenant_id)
+        self._create('theirs', utils.generate_uuid())
+        self._use_nova(FakeNovaClient('mine', 'theirs'))
+        self.context.is_admin = True
+
+        self.assertEqual(['mine'], self._listed_servers())
+
+    def test_missing_servers_are_left_out(self):
+        for server_id in ('a', 'b', 'c'):
+            self._create(server_id, self.tenant_id)
+        self._use_nova(FakeNovaClient('a', 'c'))
+
+        self.assertEqual(['a', 'c'], self._listed_servers())
+
+
+class TestBackfillTenantIds(tests.BaseTest):
+
+    def setUp(self):
+        super(TestBackfillTenantIds, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+
+    def _create(self, server_id, tenant_id):
+        return models.DBInstance.create(name=server_id,
+                                        compute_instance_id=server_id,
+                                        tenant_id=tenant_id,
+                                        task_status=InstanceTasks.NONE)
+
+    def test_records_the_tenant_of_the_server(self):
+        other_tenant = utils.generate_uuid()
+        legacy = self._create('legacy', None)
+        theirs = self._create('theirs', None)
+        gone = self._create('gone', None)
+        mine = self._create('mine', self.tenant_id)
+        client = FakeAdminNovaClient(TenantServer('legacy', self.tenant_id),
+                                     TenantServer('theirs', other_tenant),
+                                     TenantServer('mine', other_tenant))
+
+        self.assertEqual((2, 1), models.backfill_tenant_ids(client))
+        tenants = dict((db_info.id, db_info.tenant_id) for db_info in
+                       models.DBInstance.find_all())
+        self.assertEqual(self.tenant_id, tenants[legacy.id])
+        self.assertEqual(other_tenant, tenants[theirs.id])
+        self.assertIsNone(tenants[gone.id])
+        self.assertEqual(self.tenant_id, tenants[mine.id])
+
+    def test_nothing_to_backfill(self):
+        self._create('mine', self.tenant_id)
+        self.assertEqual((0, 0), models.backfill_tenant_ids(None))
+
+
+class TestInstanceLoadFromPrimary(tests.BaseTest):
+
+    def setUp(self):
+        super(TestInstanceLoadFromPrimary, self).setUp()
+        self.context = context.ReddwarfContext(tenant='tenant', limit=None,
+                                               marker=None)
+        self.loads = []
+
+    def _load(self, context, id, use_cache=True):
+        primary = getattr(session._SCOPE, 'primary', False)
+        self.loads.append(primary)
+        if not primary:
+            raise models.ModelNotFoundError()
+        return 'instance'
+
+    def test_retries_missing_row_on_primary(self):
+        self.mock.stubs.Set(models.Instance, '_load',
+                            staticmethod(self._load))
+        self.assertEqual('instance', models.Instance.load(self.context, 'id'))
+        self.assertEqual([False, True], self.loads)
+
+    def test_missing_row_still_raises(self):
+        self.assertRaises(models.ModelNotFoundError, models.Instance.load,
+                          self.context, utils.generate_uuid())
+
+
+class TestServerCache(tests.BaseTest):
+
+    def setUp(self):
+        super(TestServerCache, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+        self.client = FakeNovaClient('server')
+        self.mock.stubs.Set(models, '_SERVER_CACHE',
+                            utils.ExpiringCache(ttl=60, max_size=10))
+        self.mock.stubs.Set(models, 'create_nova_client',
+                            lambda context: self.client)
+        self.mock.stubs.Set(models, 'load_volumes',
+                            lambda context, server_id, client=None: [])
+        self.db_info = models.DBInstance.create(name='instance',
+            compute_instance_id='server', tenant_id=self.tenant_id,
+            task_status=InstanceTasks.NONE)
+        models.InstanceServiceStatus.create(instance_id=self.db_info.id,
+            status=models.ServiceStatuses.RUNNING)
+
+    def _load(self, auth_tok, **kwargs):
+        return models.Instance.load(context.ReddwarfContext(
+            tenant=self.tenant_id, auth_tok=auth_tok, limit=None,
+            marker=None), self.db_info.id, **kwargs)
+
+    def test_same_token_is_served_from_cache(self):
+        first = self._load('token')
+        self.assertTrue(first.server is self._load('token').server)
+        self.assertEqual(['server'], self.client.servers.requested)
+
+    def test_other_token_fetches_its_own_server(self):
+        first = self._load('token')
+        self.assertFalse(first.server is self._load('other').server)
+        self.assertEqual(['server', 'server'], self.client.servers.requested)
+
+    def test_load_without_cache_fetches_the_server(self):
+        self._load('token')
+        self._load('token', use_cache=False)
+        self.assertEqual(['server', 'server'], self.client.servers.requested)
+
+
+class TestInstanceLoadWithoutServer(tests.BaseTest):
+
+    def setUp(self):
+        super(TestInstanceLoadWithoutServer, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+        self.db_info = models.DBInstance.create(name='instance',
+            tenant_id=self.tenant_id, task_status=InstanceTasks.BUILDING)
+        models.InstanceServiceStatus.create(instance_id=self.db_info.id,
+            status=models.ServiceStatuses.NEW)
+
+    def _load(self, tenant_id, is_admin=False):
+        return models.Instance.load(context.ReddwarfContext(
+            tenant=tenant_id, is_admin=is_admin, limit=None, marker=None),
+            self.db_info.id)
+
+    def test_owner_loads_building_instance(self):
+        instance = self._load(self.tenant_id)
+        self.assertEqual(self.db_info.id, instance.id)
+        self.assertIsNone(instance.server)
+
+    def test_other_tenant_is_not_found(self):
+        self.assertRaises(exception.NotFound, self._load,
+                          utils.generate_uuid())
+
+    def test_admin_loads_any_tenants_instance(self):
+        instance = self._load(utils.generate_uuid(), is_admin=True)
+        self.assertEqual(self.db_info.id, instance.id)
+
+
+class TestSimpleInstanceLoad(tests.BaseTest):
+
+    def setUp(self):
+        super(TestSimpleInstanceLoad, self).setUp()
+        self.tenant_id = utils.generate_uuid()
+
+    def _context(self, tenant_id, is_admin=False):
+        return context.ReddwarfContext(tenant=tenant_id, is_admin=is_admin,
+                                       limit=None, marker=None)
+
+    def _create(self, tenant_id):
+        db_info = models.DBInstance.create(name='instance',
+                                           tenant_id=tenant_id,
+                                           task_status=InstanceTasks.NONE)
+        models.InstanceServiceStatus.create(instance_id=db_info.id,
+            status=models.ServiceStatuses.RUNNING)
+        return db_info
+
+    def test_owner_loads_status_from_database(self):
+        db_info = self._create(self.tenant_id)
+        instance = models.SimpleInstance.load(self._context(self.tenant_id),
+                                              db_info.id)
+        self.assertTrue(isinstance(instance, models.SimpleInstance))
+        self.assertEqual(db_info.id, instance.id)
+        self.assertTrue(instance.is_sql_running)
+
+    def test_other_tenant_is_not_found(self):
+        db_info = self._create(self.tenant_id)
+        self.assertRaises(exception.NotFound, models.SimpleInstance.load,
+                          self._context(utils.generate_uuid()), db_info.id)
+
+    def test_admin_loads_any_tenants_instance(self):
+        db_info = self._create(self.tenant_id)
+        instance = models.SimpleInstance.load(
+            self._context(utils.generate_uuid(), is_admin=True), db_info.id)
+        self.assertEqual(db_info.id, instance.id)
+
+    def test_rows_without_tenant_are_checked_through_nova(self):
+        db_info = self._create(None)
+        loaded = []
+        self.mock.stubs.Set(models.Instance, 'load',
+                            staticmethod(lambda context, id: loaded.append(id)
+                                         or 'full instance'))
+        self.assertEqual('full instance', models.SimpleInstance.load(
+            self._context(self.tenant_id), db_info.id))
+        self.assertEqual([db_info.id], loaded)
+
+    def test_missing_instance_falls_back_to_full_load(self):
+        def not_found(context, id):
+            raise exception.NotFound(uuid=id)
+        self.mock.stubs.Set(models.Instance, 'load', staticmethod(not_found))
+        self.assertRaises(exception.NotFound, models.SimpleInstance.load,
+                          self._context(self.tenant_id), 'missing')
+
+
+class FakeVolumeManager(object):
+
+    def __init__(self, *volume_ids):
+        self.volume_ids = volume_ids
+        self.requested = []
+
+    def get(self, volume_id):
+        self.requested.append(volume_id)
+        if volume_id not in self.volume_ids:
+            raise nova_exceptions.NotFound(404, "Not found")
+        return FakeVolume(volume_id, 1)
+
+    def list(self, detailed=True):
+        raise AssertionError("Volumes should not be listed.")
+
+
+class FakeVolumeClient(object):
+
+    def __init__(self, *volume_ids):
+        self.volumes = FakeVolumeManager(*volume_ids)
+
+
+class TestGetVolumes(tests.BaseTest):
+
+    def test_fetches_only_the_given_volumes_in_order(self):
+        client = FakeVolumeClient('v1', 'v2', 'v3', 'v4')
+        volumes = models._get_volumes(client, ['v3', 'v1', 'v2'])
+        self.assertEqual(['v3', 'v1', 'v2'], [volume.id for volume in volumes])
+        self.assertItemsEqual(['v1', 'v2', 'v3'], client.volumes.requested)
+
+    def test_single_volume(self):
+        client = FakeVolumeClient('v1')
+        self.assertEqual(['v1'], [volume.id for volume in
+                                  models._get_volumes(client, ['v1'])])
+
+    def test_missing_volume_raises_not_found(self):
+        client = FakeVolumeClient('v1')
+        self.assertRaises(nova_exceptions.NotFound, models._get_volumes,
+                          client, ['v1', 'v2'])
+
+
+class FakeTaskManager(object):
+
+    def __init__(self):
+        self.deleted_volumes = []
+
+    def delete_volume(self, volume_id):
+        self.deleted_volumes.append(volume_id)
+
+
+class DeletableServer(FakeServer):
+
+    def __init__(self, id, status):
+        super(DeletableServer, self).__init__(id)
+        self.status = status
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class TestInstanceDelete(tests.BaseTest):
+
+    def setUp(self):
+        super(TestInstanceDelete, self).setUp()
+        self.context = context.ReddwarfContext(is_admin=False, limit=None,
+                                               marker=None)
+        self.task_manager = FakeTaskManager()
+        self.mock.stubs.Set(models, 'create_taskmanager_client',
+                            lambda context: self.task_manager)
+
+    def _instance(self, volume_id,
+                  task_status=InstanceTasks.BUILDING_ERROR_SERVER,
+                  server=None):
+        db_info = models.DBInstance.create(name='instance',
+            volume_id=volume_id, task_status=task_status)
+        status = models.InstanceServiceStatus.create(instance_id=db_info.id,
+            status=models.ServiceStatuses.NEW)
+        return models.Instance(self.context, db_info, server, status, [])
+
+    def test_building_instance_is_not_deleted(self):
+        instance = self._instance(None, task_status=InstanceTasks.BUILDING)
+        self.assertRaises(exception.UnprocessableEntity, instance.delete)
+
+    def test_rebooting_server_is_not_deleted(self):
+        server = DeletableServer('server', 'REBOOT')
+        instance = self._instance(None, task_status=InstanceTasks.NONE,
+                                  server=server)
+        self.assertRaises(exception.UnprocessableEntity, instance.delete)
+        self.assertFalse(server.deleted)
+
+    def test_instance_whose_guest_never_reported_is_deleted(self):
+        server = DeletableServer('server', 'ACTIVE')
+        instance = self._instance(None, task_status=InstanceTasks.NONE,
+                                  server=server)
+        self.assertEqual(models.InstanceStatus.BUILD, instance.status)
+        instance.delete()
+        self.assertTrue(server.deleted)
+
+    def test_volume_is_deleted_with_instance(self):
+        instance = self._instance('volume')
+        instance.delete()
+        self.assertEqual(['volume'], self.task_manager.deleted_volumes)
+        self.assertEqual(InstanceTasks.DELETING,
+                         models.DBInstance.find_by(id=instance.id).task_status)
+
+    def test_instance_without_volume(self):
+        self._instance(None).delete()
+        self.assertEqual([], self.task_manager.deleted_volumes)
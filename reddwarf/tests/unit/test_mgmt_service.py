@@ -0,0 +1,77 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+from reddwarf import db
+from reddwarf import rpc
+from reddwarf.common import exception
+from reddwarf.common import remote
+from reddwarf.extensions.mgmt import service
+from reddwarf.instance import models as instance_models
+
+
+class TestValidateCast(unittest.TestCase):
+
+    def _validate(self, body):
+        return service.MgmtInstanceController._validate_cast(body)
+
+    def test_valid_cast(self):
+        method, ids = self._validate({'cast': {'method': 'upgrade',
+                                               'instances': ['a', 'b', 'a']}})
+        self.assertEqual(method, 'upgrade')
+        self.assertEqual(sorted(ids), ['a', 'b'])
+
+    def test_missing_keys(self):
+        self.assertRaises(exception.BadRequest, self._validate, {})
+        self.assertRaises(exception.BadRequest, self._validate,
+                          {'cast': {'method': 'upgrade'}})
+
+    def test_method_must_be_allowed(self):
+        self.assertRaises(exception.BadRequest, self._validate,
+                          {'cast': {'method': 'prepare',
+                                    'instances': ['a']}})
+
+    def test_instances_must_be_list_of_ids(self):
+        for instances in ([], 'a', [{'id': 'a'}]):
+            self.assertRaises(exception.BadRequest, self._validate,
+                              {'cast': {'method': 'upgrade',
+                                        'instances': instances}})
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        # The AMQP pool belongs to the rpc backend, which is not loaded here.
+        self.original_pool_stats = rpc.pool_stats
+        self.rpc_pool = {'size': 1, 'free': 1, 'waiters': 0,
+                         'reconnects': 0, 'evicted': 0, 'dead': 0}
+        rpc.pool_stats = lambda: self.rpc_pool
+
+    def tearDown(self):
+        rpc.pool_stats = self.original_pool_stats
+
+    def test_reports_server_cache(self):
+        result = service.MgmtStatsController().index(None, 'tenant')
+        stats = result.data('application/json')['stats']
+        self.assertEqual(instance_models.server_cache_stats(),
+                         stats['server_cache'])
+        self.assertEqual(remote.client_pool_stats(), stats['nova_clients'])
+        self.assertEqual(db.db_api.pool_stats(), stats['database_pool'])
+        self.assertEqual(db.db_api.pool_stats(read=True),
+                         stats['database_read_pool'])
+        self.assertEqual(self.rpc_pool, stats['rpc_pool'])
@@ -0,0 +1,101 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import tempfile
+import unittest
+
+import sqlalchemy
+from sqlalchemy.engine import reflection
+
+from reddwarf.db.sqlalchemy import migration
+
+
+class MigrationTest(unittest.TestCase):
+    """Runs the migrations against a throwaway sqlite database."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        self.options = {'sql_connection': 'sqlite:///%s' % self.path}
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def index_names(self):
+        engine = sqlalchemy.create_engine(self.options['sql_connection'])
+        try:
+            inspector = reflection.Inspector.from_engine(engine)
+            return set(index['name']
+                       for table in inspector.get_table_names()
+                       for index in inspector.get_indexes(table))
+        finally:
+            engine.dispose()
+
+    def execute(self, statement):
+        engine = sqlalchemy.create_engine(self.options['sql_connection'])
+        try:
+            engine.execute(statement)
+        finally:
+            engine.dispose()
+
+
+class TestIndexMigrations(MigrationTest):
+
+    LOOKUP_INDEXES = set(['ix_service_statuses_instance_id',
+                          'ix_agent_heartbeats_instance_id',
+                          'ix_service_images_service_name',
+                          'ix_instances_tenant_id_id'])
+    SORT_INDEXES = set(['ix_instances_tenant_id_created_id',
+                        'ix_instances_tenant_id_updated_id'])
+
+    def test_upgrade_and_downgrade(self):
+        migration.db_sync(self.options, version=8)
+        self.assertFalse(self.index_names() &
+                         (self.LOOKUP_INDEXES | self.SORT_INDEXES))
+        migration.upgrade(self.options, version=9)
+        self.assertTrue(self.LOOKUP_INDEXES <= self.index_names())
+        self.assertFalse(self.index_names() & self.SORT_INDEXES)
+        migration.upgrade(self.options, version=10)
+        self.assertTrue((self.LOOKUP_INDEXES | self.SORT_INDEXES) <=
+                        self.index_names())
+        migration.downgrade(self.options, version=9)
+        self.assertTrue(self.LOOKUP_INDEXES <= self.index_names())
+        self.assertFalse(self.index_names() & self.SORT_INDEXES)
+        migration.downgrade(self.options, version=8)
+        self.assertFalse(self.index_names() &
+                         (self.LOOKUP_INDEXES | self.SORT_INDEXES))
+
+
+class TestMissingIndexes(MigrationTest):
+
+    def setUp(self):
+        super(TestMissingIndexes, self).setUp()
+        migration.db_sync(self.options)
+
+    def test_migrated_schema_has_every_index(self):
+        self.assertEqual([], migration.missing_indexes(self.options))
+
+    def test_dropped_index_is_reported(self):
+        self.execute('DROP INDEX ix_instances_tenant_id_updated_id')
+        self.assertEqual([('instances', ['tenant_id', 'updated', 'id'])],
+                         migration.missing_indexes(self.options))
+
+    def test_missing_table_is_reported(self):
+        self.execute('DROP TABLE service_images')
+        self.assertEqual([('service_images', ['service_name'])],
+                         migration.missing_indexes(self.options))
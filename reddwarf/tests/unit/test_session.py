@@ -0,0 +1,159 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sqlite3
+import unittest
+
+import sqlalchemy
+from sqlalchemy import exc
+
+from reddwarf.db.sqlalchemy import session
+
+
+class TestMeteredQueuePool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = session.MeteredQueuePool(
+            lambda: sqlite3.connect(':memory:'), pool_size=1,
+            max_overflow=0, timeout=0.01)
+
+    def test_counts_checkouts(self):
+        connection = self.pool.connect()
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['checkouts'])
+        self.assertEqual(1, stats['checked_out'])
+        connection.close()
+        stats = self.pool.stats()
+        self.assertEqual(0, stats['checked_out'])
+        self.assertEqual(1, stats['checked_in'])
+        self.assertEqual(0, stats['timeouts'])
+
+    def test_counts_timeouts_and_waits(self):
+        connection = self.pool.connect()
+        self.assertRaises(exc.TimeoutError, self.pool.connect)
+        stats = self.pool.stats()
+        self.assertEqual(1, stats['timeouts'])
+        self.assertEqual(2, stats['checkouts'])
+        self.assertTrue(stats['max_wait'] >= 0.01)
+        self.assertTrue(stats['total_wait'] >= stats['max_wait'])
+        connection.close()
+
+
+class FakeCursor(object):
+
+    def __init__(self, error=None):
+        self.error = error
+        self.executed = []
+        self.closed = False
+
+    def execute(self, sql):
+        if self.error is not None:
+            raise self.error
+        self.executed.append(sql)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection(object):
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+class TestPingListener(unittest.TestCase):
+
+    def test_live_connection_is_kept(self):
+        cursor = FakeCursor()
+        session.PingListener().checkout(FakeConnection(cursor), None, None)
+        self.assertEqual(["SELECT 1"], cursor.executed)
+        self.assertTrue(cursor.closed)
+
+    def test_dead_connection_is_replaced(self):
+        cursor = FakeCursor(error=sqlite3.OperationalError("gone away"))
+        self.assertRaises(exc.DisconnectionError,
+                          session.PingListener().checkout,
+                          FakeConnection(cursor), None, None)
+        self.assertTrue(cursor.closed)
+
+    def test_pool_replaces_dead_connection(self):
+        connections = []
+
+        def connect():
+            connections.append(sqlite3.connect(':memory:'))
+            return connections[-1]
+        pool = session.MeteredQueuePool(connect, pool_size=1,
+                                        max_overflow=0,
+                                        listeners=[session.PingListener()])
+        pool.connect().close()
+        connections[0].close()
+        pool.connect().close()
+        self.assertEqual(2, len(connections))
+
+
+class TestReadRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (session._ENGINE, session._MAKER,
+                      session._READ_ENGINE, session._READ_MAKER)
+        session._ENGINE = sqlalchemy.create_engine('sqlite://')
+        session._READ_ENGINE = sqlalchemy.create_engine('sqlite://')
+        session._MAKER = session._READ_MAKER = None
+
+    def tearDown(self):
+        (session._ENGINE, session._MAKER,
+         session._READ_ENGINE, session._READ_MAKER) = self.saved
+
+    def assertReadsFrom(self, engine):
+        self.assertTrue(session.get_read_session().bind is engine)
+
+    def test_reads_go_to_replica(self):
+        self.assertReadsFrom(session._READ_ENGINE)
+
+    def test_reads_go_to_primary_without_replica(self):
+        session._READ_ENGINE = None
+        self.assertReadsFrom(session._ENGINE)
+
+    def test_use_primary(self):
+        with session.use_primary():
+            self.assertReadsFrom(session._ENGINE)
+            with session.use_primary():
+                pass
+            self.assertReadsFrom(session._ENGINE)
+        self.assertReadsFrom(session._READ_ENGINE)
+
+    def test_scope_reads_from_primary_once_it_has_written(self):
+        with session.request_scope():
+            read_session = session.get_read_session()
+            self.assertTrue(read_session.bind is session._READ_ENGINE)
+            self.assertTrue(session.get_read_session() is read_session)
+            write_session = session.get_session()
+            self.assertTrue(session.get_read_session() is write_session)
+        self.assertReadsFrom(session._READ_ENGINE)
+
+    def test_suspend_scope(self):
+        with session.request_scope():
+            scoped = session.get_session()
+            with session.suspend_scope():
+                first = session.get_session()
+                self.assertFalse(first is scoped)
+                self.assertFalse(session.get_session() is first)
+            self.assertTrue(session.get_session() is scoped)
+        self.assertFalse(session._SCOPE.active)
@@ -0,0 +1,47 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import MetaData
+
+from reddwarf import tests
+from reddwarf.db.sqlalchemy import session
+from reddwarf.db.sqlalchemy import tables
+
+
+class TestTables(tests.BaseTest):
+    """The declared tables must match what the migrations create."""
+
+    def setUp(self):
+        super(TestTables, self).setUp()
+        self.migrated = MetaData()
+        self.migrated.reflect(bind=session._ENGINE)
+
+    def test_columns_match_migrations(self):
+        for name, table in tables.meta.tables.items():
+            migrated = self.migrated.tables[name]
+            self.assertEqual(sorted(migrated.c.keys()),
+                             sorted(table.c.keys()))
+            self.assertEqual(sorted(migrated.primary_key.columns.keys()),
+                             sorted(table.primary_key.columns.keys()))
+
+    def test_indexes_match_migrations(self):
+        for name, table in tables.meta.tables.items():
+            migrated = self.migrated.tables[name]
+            self.assertEqual(sorted((index.name, index.unique)
+                                    for index in migrated.indexes),
+                             sorted((index.name, index.unique)
+                                    for index in table.indexes))
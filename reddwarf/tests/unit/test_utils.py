@@ -97,3 +97,43 @@ class StringifyExcludeTest(unittest.TestCase):
         new_keys = utils.exclude(key_values, *exclude_keys)
         self.assertEqual(len(new_keys), 1)
         self.assertEqual(new_keys, {'two': 2})
+
+
+class ExpiringCacheTest(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache = utils.ExpiringCache(ttl=60, max_size=10)
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entries_expire(self):
+        cache = utils.ExpiringCache(ttl=0.01, max_size=10)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.stats()['expirations'], 1)
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_oldest_entry_is_evicted(self):
+        cache = utils.ExpiringCache(ttl=60, max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = utils.ExpiringCache(ttl=0, max_size=10)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+
+    def test_delete(self):
+        cache = utils.ExpiringCache(ttl=60, max_size=10)
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('b')
+        self.assertEqual(cache.get('a'), None)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compares the rpc serializers on typical guest agent messages.
+
+For a list_users reply and a prepare cast it prints the bytes each codec
+puts on the wire and the time taken to encode and decode the message, with
+the context packed as one nested object and, for comparison, flattened into
+_context_* keys the way older senders did.
+
+    python tools/rpc_serializer_benchmark.py [iterations]
+"""
+
+import gettext
+import os
+import sys
+import timeit
+import uuid
+
+possible_topdir = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                                os.pardir,
+                                                os.pardir))
+if os.path.exists(os.path.join(possible_topdir, 'reddwarf', '__init__.py')):
+    sys.path.insert(0, possible_topdir)
+
+gettext.install('reddwarf', unicode=1)
+
+from reddwarf.rpc import serializer
+
+
+CONTEXT = {'user': None,
+           'tenant': uuid.uuid4().hex,
+           'is_admin': False,
+           'show_deleted': False,
+           'read_only': False,
+           'auth_tok': uuid.uuid4().hex,
+           'limit': None,
+           'marker': None,
+           'sort_key': None,
+           'sort_dir': None}
+
+
+def _database(name):
+    return {'_name': name,
+            '_collate': 'utf8_general_ci',
+            '_character_set': 'utf8'}
+
+
+def list_users_reply(count=100):
+    users = [{'_name': 'user%03d' % i,
+              '_password': None,
+              '_databases': [_database('db%03d' % i),
+                             _database('shared')]}
+             for i in range(count)]
+    return {'result': [users, 'user%03d' % (count - 1)],
+            'failure': None,
+            '_msg_id': uuid.uuid4().hex}
+
+
+def prepare_cast():
+    return {'method': 'prepare',
+            'args': {'memory_mb': 512,
+                     'databases': [_database('db%02d' % i)
+                                   for i in range(10)],
+                     'users': [],
+                     'device_path': '/dev/vdb',
+                     'mount_point': '/var/lib/mysql'}}
+
+
+def with_context(msg, nested):
+    msg = dict(msg)
+    if nested:
+        msg['_context'] = CONTEXT
+    else:
+        msg.update(('_context_%s' % key, value)
+                   for key, value in CONTEXT.iteritems())
+    return msg
+
+
+def measure(codec, msg, iterations):
+    body = codec.dumps(msg)
+    encode = timeit.timeit(lambda: codec.dumps(msg), number=iterations)
+    decode = timeit.timeit(lambda: codec.loads(body), number=iterations)
+    per_call = 1000000.0 / iterations
+    return len(body), encode * per_call, decode * per_call
+
+
+def main(iterations):
+    messages = [('list_users reply', list_users_reply()),
+                ('prepare cast', prepare_cast())]
+    print "%-18s %-8s %-8s %8s %12s %12s" % ("message", "codec", "context",
+                                           "bytes", "encode (us)",
+                                           "decode (us)")
+    for label, msg in messages:
+        for codec in serializer.SERIALIZERS:
+            for nested in (True, False):
+                size, encode, decode = measure(codec,
+                                               with_context(msg, nested),
+                                               iterations)
+                print "%-18s %-8s %-8s %8d %12.1f %12.1f" % (
+                    label, codec.name, "nested" if nested else "flat",
+                    size, encode, decode)
+    if serializer.msgpack is None:
+        print "\nmsgpack is not installed, so only json was measured."
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)